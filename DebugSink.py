@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+from EDlogger import logger
+
+"""
+File:DebugSink.py
+
+Description:
+  Writes debug images on a background thread, so a debug image costs nothing on the AP's hot paths (i.e. a nav
+  panel row read) when its channel is off, and only a copy of the image when on. Each image is written to a named
+  channel. All channels are off until enabled, which can be done at any time (i.e. from the config settings).
+  Images are put on a bounded queue and dropped (and counted) if the writer falls behind.
+
+  Channels used:
+    'images' - AP images logged for diagnostics/training, to debug-output/images (DebugImages).
+    'panels' - The nav and status panel captures, to test/nav-panel and test/status-panel (DebugImages).
+    'highlight' - The steps of finding the highlighted item in a list, to test/nav-panel/out (DebugImages).
+    'ocr' - The images sent to OCR, to ocr_output (DebugOCR).
+
+  Usage:
+    from DebugSink import debug_sink
+    debug_sink.enable('panels')
+    debug_sink.write('panels', 'test/nav-panel/out/tab_bar.png', tab_bar)
+"""
+
+
+class DebugSink:
+    """ Writes debug images of the enabled channels on a background thread. """
+
+    def __init__(self, queue_size: int = 32):
+        """
+        @param queue_size: The max number of images waiting to be written before new images are dropped.
+        """
+        self.written = 0  # Images written
+        self.dropped = 0  # Images dropped as the queue was full
+        self._channels: set[str] = set()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def enable(self, channel: str, enabled: bool = True):
+        """ Enables (or disables) a channel. """
+        if enabled:
+            self._channels.add(channel)
+        else:
+            self._channels.discard(channel)
+
+    def enabled(self, channel: str) -> bool:
+        """ True if the channel is enabled. Checking first saves building an image only needed for debug. """
+        return channel in self._channels
+
+    def write(self, channel: str, path: str, image) -> bool:
+        """ Queues an image to be written if the channel is enabled. Never blocks, the image is dropped if the queue
+        is full.
+        @param channel: The channel name.
+        @param path: The file path, its folder is created if it does not exist.
+        @param image: The image (BGR, BGRA or gray).
+        @return: True if queued, False if the channel is off or the image was dropped.
+        """
+        if channel not in self._channels or image is None or getattr(image, 'size', 0) == 0:
+            return False
+
+        self._start()
+        # Copy the image, as the caller may draw on it or it may be a view of a frame that is about to be reused
+        try:
+            self._queue.put_nowait((path, np.array(image, copy=True)))
+            return True
+        except queue.Full:
+            self.dropped = self.dropped + 1
+            return False
+
+    def flush(self):
+        """ Waits for the queued images to be written. """
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """ Writes the queued images and stops the writer thread. """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout=10.0)
+            self._thread = None
+        logger.debug(f"Debug sink stopped. {self.written} images written, {self.dropped} dropped.")
+
+    def _start(self):
+        """ Starts the writer thread on the first image. """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="DebugSink", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self):
+        """ The writer thread. Writes images until a None is taken from the queue. """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                path, image = item
+                folder = os.path.dirname(path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                if cv2.imwrite(path, image):
+                    self.written = self.written + 1
+                else:
+                    logger.warning(f"Debug sink failed to write: {path}")
+            except Exception as e:
+                logger.error(f"Debug sink failed to write: {e}")
+            finally:
+                self._queue.task_done()
+
+
+# The debug sink shared by all the classes
+debug_sink = DebugSink()
@@ -8,6 +8,7 @@
 # import cv2
 # import json
 # from pathlib import Path
+import multiprocessing
 import subprocess
 from typing import TypedDict
 
@@ -271,6 +272,8 @@ class APGui:
         self.gui_loaded = True
         # Send a log entry which will flush out the buffer.
         self.callback('log', 'ED Autopilot loaded successfully.')
+        # Load the OCR and ML models in the background once the GUI is shown
+        root.after(1000, self.ed_ap.model_warm_up.start)
 
     def setup_hotkeys(self):
         """ Enable or disable hotkeys.
@@ -1366,4 +1369,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Must be first, so a spawned process (i.e. an OCR worker) of the frozen exe runs its task, not the GUI
+    multiprocessing.freeze_support()
     main()
@@ -26,6 +26,7 @@ class EDFSS:
 
         # Load custom regions from file
         load_calibrated_regions('EDFSS', self.reg)
+        self.ap.scr.regions.register_regions('EDFSS', self.reg)
         load_calibrated_regions_quad('EDFSS', self.reg_quad)
         pass
 
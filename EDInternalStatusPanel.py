@@ -3,7 +3,6 @@ from __future__ import annotations
 import json
 import logging
 import os
-from copy import copy
 from time import sleep
 import cv2
 from EDAP_data import *
@@ -11,9 +10,10 @@ from EDAP_data import *
 from EDNavigationPanel import rects_to_quadrilateral, image_perspective_transform, image_reverse_perspective_transform
 # from OCR import OCR
 from Screen import Screen, crop_image_by_pct
-from Screen_Regions import Quad, load_calibrated_regions
+from Screen_Regions import FrozenQuad, Quad, load_calibrated_regions
 from StatusParser import StatusParser
 from EDlogger import logger
+from DebugSink import debug_sink
 
 
 class EDInternalStatusPanel:
@@ -21,7 +21,6 @@ class EDInternalStatusPanel:
 
     def __init__(self, ed_ap, screen, keys, cb):
         self.ap = ed_ap
-        self.ocr = ed_ap.ocr
         self.screen = screen
         self.keys = keys
         self.ap_ckb = cb
@@ -46,22 +45,38 @@ class EDInternalStatusPanel:
                         }
         self.panel_quad_pct = Quad()
         self.panel_quad_pix = Quad()
+        self.panel_quad_pix_off = Quad()
+        self.panel_origin = (0.0, 0.0)
+        self.sub_quad = {}
         self.panel = None
         self._transform = None  # Warp transform to deskew the Nav panel
         self._rev_transform = None  # Reverse warp transform to skew to match the Nav panel
 
         # Load custom regions from file
         load_calibrated_regions('EDInternalStatusPanel', self.reg)
+        self.screen.regions.register_regions('EDInternalStatusPanel', self.reg)
+        self.screen.regions.add_listener(self.customize_regions)
 
         self.customize_regions()
 
+    @property
+    def ocr(self):
+        """ The AP's OCR, created on first use if the startup warm-up has not created it yet. """
+        return self.ap.ocr
+
     def customize_regions(self):
         # Produce quadrilateral from the two bounds rectangles
         reg1 = Quad.from_rect(self.reg['panel_bounds1']['rect'])
         reg2 = Quad.from_rect(self.reg['panel_bounds2']['rect'])
-        self.panel_quad_pct = rects_to_quadrilateral(reg1, reg2)
-        self.panel_quad_pix = copy(self.panel_quad_pct)
-        self.panel_quad_pix.scale_from_origin(self.ap.scr.screen_width, self.ap.scr.screen_height)
+        # The panel quads are shared, so are frozen. They are computed once here rather than copied on each capture.
+        self.panel_quad_pct = rects_to_quadrilateral(reg1, reg2).frozen()
+        self.panel_quad_pix = FrozenQuad.from_array(self.panel_quad_pct.points *
+                                                    (self.ap.scr.screen_width, self.ap.scr.screen_height))
+        # The screen position of the panel, and the panel co-ords relative to it (i.e. starting at 0,0)
+        self.panel_origin = (self.panel_quad_pix.left, self.panel_quad_pix.top)
+        self.panel_quad_pix_off = FrozenQuad.from_array(self.panel_quad_pix.points - self.panel_origin)
+        # The sub regions as quads, in percent of the straightened panel
+        self.sub_quad = {name: FrozenQuad.from_rect(reg['rect']) for name, reg in self.sub_reg.items()}
 
     def capture_panel_straightened(self):
         """ Grab the image based on the panel coordinates.
@@ -76,19 +91,15 @@ class EDInternalStatusPanel:
         # Get the nav panel image based on the region
         image = self.screen.get_screen(self.panel_quad_pix.left, self.panel_quad_pix.top,
                                        self.panel_quad_pix.right, self.panel_quad_pix.bottom, rgb=False)
-        cv2.imwrite(f'test/status-panel/out/nav_panel_original.png', image)
-
-        # Offset the panel co-ords to match the cropped image (i.e. starting at 0,0)
-        panel_quad_pix_off = copy(self.panel_quad_pix)
-        panel_quad_pix_off.offset(-panel_quad_pix_off.left, -panel_quad_pix_off.top)
+        debug_sink.write('panels', 'test/status-panel/out/nav_panel_original.png', image)
 
-        # Straighten the image
-        straightened, trans, rev_trans = image_perspective_transform(image, panel_quad_pix_off)
+        # Straighten the image, using the panel co-ords offset to match the cropped image
+        straightened, trans, rev_trans = image_perspective_transform(image, self.panel_quad_pix_off)
         # Store the transforms
         self._transform = trans
         self._rev_transform = rev_trans
         # Write the file
-        cv2.imwrite(f'test/status-panel/out/nav_panel_straight.png', straightened)
+        debug_sink.write('panels', 'test/status-panel/out/nav_panel_straight.png', straightened)
 
         if self.ap.debug_overlay:
             self.ap.overlay.overlay_quad_pct('nav_panel_active', self.panel_quad_pct, (0, 255, 0), 2, 5)
@@ -105,17 +116,15 @@ class EDInternalStatusPanel:
         if self.panel is None:
             return None
 
-        # Convert region rect to quad
-        tab_bar_quad = Quad.from_rect(self.sub_reg['tab_bar']['rect'])
+        tab_bar_quad = self.sub_quad['tab_bar']
         # Crop the image to the extents of the quad
         tab_bar = crop_image_by_pct(self.panel, tab_bar_quad)
-        cv2.imwrite(f'test/status-panel/out/tab_bar.png', tab_bar)
+        debug_sink.write('panels', 'test/status-panel/out/tab_bar.png', tab_bar)
 
         if self.ap.debug_overlay:
-            # Transform the array of coordinates to the skew of the nav panel
-            q_out = image_reverse_perspective_transform(self.panel, tab_bar_quad, self._rev_transform)
-            # Offset to match the nav panel offset
-            q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+            # Transform the array of coordinates to the skew of the nav panel, offset to match the nav panel offset
+            q_out = image_reverse_perspective_transform(self.panel, tab_bar_quad, self._rev_transform,
+                                                        self.panel_origin)
 
             self.ap.overlay.overlay_quad_pix('status_panel_tab_bar', q_out, (0, 255, 0), 2, 5)
             self.ap.overlay.overlay_paint()
@@ -135,13 +144,12 @@ class EDInternalStatusPanel:
         inventory_panel_quad = Quad.from_rect(self.sub_reg['inventory_panel']['rect'])
         # Crop the image to the extents of the quad
         inventory_panel = crop_image_by_pct(panel, inventory_panel_quad)
-        cv2.imwrite(f'test/status-panel/out/inventory_panel.png', inventory_panel)
+        debug_sink.write('panels', 'test/status-panel/out/inventory_panel.png', inventory_panel)
 
         if self.ap.debug_overlay:
-            # Transform the array of coordinates to the skew of the nav panel
-            q_out = image_reverse_perspective_transform(panel, inventory_panel_quad, self._rev_transform)
-            # Offset to match the nav panel offset
-            q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+            # Transform the array of coordinates to the skew of the nav panel, offset to match the nav panel offset
+            q_out = image_reverse_perspective_transform(panel, inventory_panel_quad, self._rev_transform,
+                                                        self.panel_origin)
 
             self.ap.overlay.overlay_quad_pix('sts_panel_inventory_panel', q_out, (0, 255, 0), 2, 5)
             self.ap.overlay.overlay_paint()
@@ -158,8 +166,8 @@ class EDInternalStatusPanel:
         active, active_tab_name = self.is_panel_active()
         if active:
             # Store image
-            image = self.screen.get_screen_full()
-            cv2.imwrite(f'test/status-panel/int_panel_full.png', image)
+            if debug_sink.enabled('panels'):
+                debug_sink.write('panels', 'test/status-panel/int_panel_full.png', self.screen.get_screen_full())
             return active, active_tab_name
         else:
             print("Open Status Panel")
@@ -176,8 +184,8 @@ class EDInternalStatusPanel:
             active, active_tab_name = self.is_panel_active()
             if active:
                 # Store image
-                image = self.screen.get_screen_full()
-                cv2.imwrite(f'test/status-panel/internal_panel_full.png', image)
+                if debug_sink.enabled('panels'):
+                    debug_sink.write('panels', 'test/status-panel/internal_panel_full.png', self.screen.get_screen_full())
                 return active, active_tab_name
             else:
                 return False, ""
@@ -208,19 +216,19 @@ class EDInternalStatusPanel:
             if tab_bar is None:
                 return False, ""
 
-            item = Quad.from_rect(self.sub_reg['sts_pnl_tab']['rect'])
+            item = self.sub_quad['sts_pnl_tab']
             img_selected, _, ocr_textlist, quad = self.ocr.get_highlighted_item_data(tab_bar, item, 'status panel')
             if img_selected is not None:
                 if self.ap.debug_overlay:
-                    tab_bar_quad = Quad.from_rect(self.sub_reg['tab_bar']['rect'])
+                    tab_bar_quad = self.sub_quad['tab_bar']
                     # Convert to a percentage of the nav panel
                     quad.scale_from_origin(tab_bar_quad.width, tab_bar_quad.height)
                     # quad.offset(tab_bar_quad.left, tab_bar_quad.top)
 
-                    # Transform the array of coordinates to the skew of the nav panel
-                    q_out = image_reverse_perspective_transform(self.panel, quad, self._rev_transform)
-                    # Offset to match the nav panel offset
-                    q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+                    # Transform the array of coordinates to the skew of the nav panel, offset to match the nav
+                    # panel offset
+                    q_out = image_reverse_perspective_transform(self.panel, quad, self._rev_transform,
+                                                                self.panel_origin)
 
                     # Overlay OCR result
                     self.ap.overlay.overlay_floating_text('sts_panel_item_text', f'{str(ocr_textlist)}', q_out.left, q_out.top - 25,                                                         (0, 255, 0))
@@ -3,7 +3,6 @@ from __future__ import annotations
 import json
 import logging
 import os
-from copy import copy
 from time import sleep
 
 import cv2
@@ -11,7 +10,8 @@ import numpy as np
 
 from EDAP_data import GuiFocusExternalPanel
 from EDlogger import logger
-from Screen_Regions import Quad, Point, load_calibrated_regions
+from DebugSink import debug_sink
+from Screen_Regions import FrozenQuad, Quad, QuadArray, Point, load_calibrated_regions
 from StatusParser import StatusParser
 from Screen import crop_image_by_pct
 
@@ -41,8 +41,7 @@ def image_perspective_transform(image, src_quad: Quad):
     h, w, ch = image.shape
 
     # Source
-    source_coord = src_quad.to_list()
-    pts1 = np.float32(source_coord)
+    pts1 = src_quad.points.astype(np.float32)
 
     # Destination
     output_coord = [[0, 0], [w, 0], [w, h], [0, h]]
@@ -59,37 +58,31 @@ def image_perspective_transform(image, src_quad: Quad):
     return dst, m, rev
 
 
-def image_reverse_perspective_transform(image, src_quad: Quad, rev_transform) -> Quad:
+def image_reverse_perspective_transform(image, src_quad: Quad | QuadArray, rev_transform,
+                                        origin: tuple[float, float] = (0.0, 0.0)) -> Quad | QuadArray:
     """ Performs warping of points and returns the transformed (warped) points.
     Used to calculate overlay graphics for display over the navigation panek, which is warped.
     @param image: The straightened image from the perspective transform function.
-    @param src_quad: A quad to transform, in percent of the image size.
+    @param src_quad: A quad, or a QuadArray of quads transformed in one call, in percent of the image size. The quad
+    is not changed, so it may be frozen.
     @param rev_transform: The reverse transform created by the perspective transform function.
-    @return: A quad representing the input quad, reverse transformed. Return quad is in pixel relative to the origin
-    of the image (0, 0).
+    @param origin: The (x, y) in pixels added to the result, i.e. the screen position of the panel.
+    @return: A new quad (or QuadArray) representing the input, reverse transformed. Return quad is in pixel relative
+    to the origin.
     """
     # Existing size
     h, w, ch = image.shape
 
-    # Scale from percent of nav panel to pixels
-    q = copy(src_quad)
-    q.scale_from_origin(w, h)
-
-    # Source
-    source_coord = q.to_list()
-    # Convert 2D to 3D array for transform
-    src_arr = np.float32(source_coord).reshape(-1, 1, 2)
+    # Scale from percent of nav panel to pixels, as a 3D array for the transform
+    src_arr = (src_quad.points * (w, h)).astype(np.float32).reshape(-1, 1, 2)
 
-    # Transform the array of coordinates to the skew of the nav panel
-    dst_arr = cv2.perspectiveTransform(src_arr, rev_transform)
+    # Transform the array of coordinates to the skew of the nav panel, and offset to the origin
+    dst_arr = cv2.perspectiveTransform(src_arr, rev_transform).reshape(src_quad.points.shape).astype(np.float64)
+    dst_arr += origin
 
-    # Convert 3D results to 2D array for results
-    dst_arr_2d = dst_arr.reshape(-1, dst_arr.shape[-1])
-    # Convert to list of points
-    pts = dst_arr_2d.tolist()
-    # Create a quad from the points
-    q_out = Quad.from_list(pts)
-    return q_out
+    if isinstance(src_quad, QuadArray):
+        return QuadArray(dst_arr)
+    return Quad.from_array(dst_arr)
 
 
 def rects_to_quadrilateral(rect_tlbr: Quad, rect_bltr: Quad) -> Quad:
@@ -110,7 +103,6 @@ class EDNavigationPanel:
 
     def __init__(self, ed_ap, screen, keys, cb):
         self.ap = ed_ap
-        self.ocr = ed_ap.ocr
         self.screen = screen
         self.keys = keys
         self.ap_ckb = cb
@@ -134,22 +126,38 @@ class EDNavigationPanel:
                         }
         self.panel_quad_pct = Quad()
         self.panel_quad_pix = Quad()
+        self.panel_quad_pix_off = Quad()
+        self.panel_origin = (0.0, 0.0)
+        self.sub_quad = {}
         self.panel = None
         self._transform = None  # Warp transform to deskew the Nav panel
         self._rev_transform = None  # Reverse warp transform to skew to match the Nav panel
 
         # Load custom regions from file
         load_calibrated_regions('EDNavigationPanel', self.reg)
+        self.screen.regions.register_regions('EDNavigationPanel', self.reg)
+        self.screen.regions.add_listener(self.customize_regions)
 
         self.customize_regions()
 
+    @property
+    def ocr(self):
+        """ The AP's OCR, created on first use if the startup warm-up has not created it yet. """
+        return self.ap.ocr
+
     def customize_regions(self):
         # Produce quadrilateral from the two bounds rectangles
         reg1 = Quad.from_rect(self.reg['panel_bounds1']['rect'])
         reg2 = Quad.from_rect(self.reg['panel_bounds2']['rect'])
-        self.panel_quad_pct = rects_to_quadrilateral(reg1, reg2)
-        self.panel_quad_pix = copy(self.panel_quad_pct)
-        self.panel_quad_pix.scale_from_origin(self.ap.scr.screen_width, self.ap.scr.screen_height)
+        # The panel quads are shared, so are frozen. They are computed once here rather than copied on each capture.
+        self.panel_quad_pct = rects_to_quadrilateral(reg1, reg2).frozen()
+        self.panel_quad_pix = FrozenQuad.from_array(self.panel_quad_pct.points *
+                                                    (self.ap.scr.screen_width, self.ap.scr.screen_height))
+        # The screen position of the panel, and the panel co-ords relative to it (i.e. starting at 0,0)
+        self.panel_origin = (self.panel_quad_pix.left, self.panel_quad_pix.top)
+        self.panel_quad_pix_off = FrozenQuad.from_array(self.panel_quad_pix.points - self.panel_origin)
+        # The sub regions as quads, in percent of the straightened panel
+        self.sub_quad = {name: FrozenQuad.from_rect(reg['rect']) for name, reg in self.sub_reg.items()}
 
     def capture_panel_straightened(self):
         """ Grab the image based on the panel coordinates.
@@ -164,19 +172,15 @@ class EDNavigationPanel:
         # Get the nav panel image based on the region
         image = self.screen.get_screen(self.panel_quad_pix.left, self.panel_quad_pix.top,
                                        self.panel_quad_pix.right, self.panel_quad_pix.bottom, rgb=False)
-        cv2.imwrite(f'test/nav-panel/out/nav_panel_original.png', image)
-
-        # Offset the panel co-ords to match the cropped image (i.e. starting at 0,0)
-        panel_quad_pix_off = copy(self.panel_quad_pix)
-        panel_quad_pix_off.offset(-panel_quad_pix_off.left, -panel_quad_pix_off.top)
+        debug_sink.write('panels', 'test/nav-panel/out/nav_panel_original.png', image)
 
-        # Straighten the image
-        straightened, trans, rev_trans = image_perspective_transform(image, panel_quad_pix_off)
+        # Straighten the image, using the panel co-ords offset to match the cropped image
+        straightened, trans, rev_trans = image_perspective_transform(image, self.panel_quad_pix_off)
         # Store the transforms
         self._transform = trans
         self._rev_transform = rev_trans
         # Write the file
-        cv2.imwrite(f'test/nav-panel/out/nav_panel_straight.png', straightened)
+        debug_sink.write('panels', 'test/nav-panel/out/nav_panel_straight.png', straightened)
 
         if self.ap.debug_overlay:
             self.ap.overlay.overlay_quad_pct('nav_panel_active', self.panel_quad_pct, (0, 255, 0), 2, 5)
@@ -193,17 +197,15 @@ class EDNavigationPanel:
         if self.panel is None:
             return None
 
-        # Convert region rect to quad
-        tab_bar_quad = Quad.from_rect(self.sub_reg['tab_bar']['rect'])
+        tab_bar_quad = self.sub_quad['tab_bar']
         # Crop the image to the extents of the quad
         tab_bar = crop_image_by_pct(self.panel, tab_bar_quad)
-        cv2.imwrite(f'test/nav-panel/out/tab_bar.png', tab_bar)
+        debug_sink.write('panels', 'test/nav-panel/out/tab_bar.png', tab_bar)
 
         if self.ap.debug_overlay:
-            # Transform the array of coordinates to the skew of the nav panel
-            q_out = image_reverse_perspective_transform(self.panel, tab_bar_quad, self._rev_transform)
-            # Offset to match the nav panel offset
-            q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+            # Transform the array of coordinates to the skew of the nav panel, offset to match the nav panel offset
+            q_out = image_reverse_perspective_transform(self.panel, tab_bar_quad, self._rev_transform,
+                                                        self.panel_origin)
 
             self.ap.overlay.overlay_quad_pix('nav_panel_tab_bar', q_out, (0, 255, 0), 2, 5)
             self.ap.overlay.overlay_paint()
@@ -219,17 +221,15 @@ class EDNavigationPanel:
         if nav_panel is None:
             return None
 
-        # Convert region rect to quad
-        location_panel_quad = Quad.from_rect(self.sub_reg['location_panel']['rect'])
+        location_panel_quad = self.sub_quad['location_panel']
         # Crop the image to the extents of the quad
         location_panel = crop_image_by_pct(nav_panel, location_panel_quad)
-        cv2.imwrite(f'test/nav-panel/out/location_panel.png', location_panel)
+        debug_sink.write('panels', 'test/nav-panel/out/location_panel.png', location_panel)
 
         if self.ap.debug_overlay:
-            # Transform the array of coordinates to the skew of the nav panel
-            q_out = image_reverse_perspective_transform(nav_panel, location_panel_quad, self._rev_transform)
-            # Offset to match the nav panel offset
-            q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+            # Transform the array of coordinates to the skew of the nav panel, offset to match the nav panel offset
+            q_out = image_reverse_perspective_transform(nav_panel, location_panel_quad, self._rev_transform,
+                                                        self.panel_origin)
 
             self.ap.overlay.overlay_quad_pix('nav_panel_location_panel', q_out, (0, 255, 0), 2, 5)
             self.ap.overlay.overlay_paint()
@@ -244,8 +244,8 @@ class EDNavigationPanel:
         active, active_tab_name = self.is_panel_active()
         if active:
             # Store image
-            image = self.screen.get_screen_full()
-            cv2.imwrite(f'test/nav-panel/nav_panel_full.png', image)
+            if debug_sink.enabled('panels'):
+                debug_sink.write('panels', 'test/nav-panel/nav_panel_full.png', self.screen.get_screen_full())
             return active, active_tab_name
         else:
             print("Open Nav Panel")
@@ -261,8 +261,8 @@ class EDNavigationPanel:
             active, active_tab_name = self.is_panel_active()
             if active:
                 # Store image
-                image = self.screen.get_screen_full()
-                cv2.imwrite(f'test/nav-panel/nav_panel_full.png', image)
+                if debug_sink.enabled('panels'):
+                    debug_sink.write('panels', 'test/nav-panel/nav_panel_full.png', self.screen.get_screen_full())
                 return active, active_tab_name
             else:
                 return False, ""
@@ -291,19 +291,19 @@ class EDNavigationPanel:
             if tab_bar is None:
                 return False, ""
 
-            item = Quad.from_rect(self.sub_reg['nav_pnl_tab']['rect'])
+            item = self.sub_quad['nav_pnl_tab']
             img_selected, _, ocr_textlist, quad = self.ocr.get_highlighted_item_data(tab_bar, item, 'nav panel')
             if img_selected is not None:
                 if self.ap.debug_overlay:
-                    tab_bar_quad = Quad.from_rect(self.sub_reg['tab_bar']['rect'])
+                    tab_bar_quad = self.sub_quad['tab_bar']
                     # Convert to a percentage of the nav panel
                     quad.scale_from_origin(tab_bar_quad.width, tab_bar_quad.height)
                     # quad.offset(tab_bar_quad.left, tab_bar_quad.top)
 
-                    # Transform the array of coordinates to the skew of the nav panel
-                    q_out = image_reverse_perspective_transform(self.panel, quad, self._rev_transform)
-                    # Offset to match the nav panel offset
-                    q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+                    # Transform the array of coordinates to the skew of the nav panel, offset to match the nav
+                    # panel offset
+                    q_out = image_reverse_perspective_transform(self.panel, quad, self._rev_transform,
+                                                                self.panel_origin)
 
                     # Overlay OCR result
                     self.ap.overlay.overlay_floating_text('nav_panel_item_text', f'{str(ocr_textlist)}', q_out.left, q_out.top - 25,                                                         (0, 255, 0))
@@ -449,7 +449,7 @@ class EDNavigationPanel:
                 return None
 
             # Find the selected item/menu (solid orange)
-            item = Quad.from_rect(self.sub_reg['nav_pnl_location']['rect'])
+            item = self.sub_quad['nav_pnl_location']
             img_selected, q = self.ocr.get_highlighted_item_in_image(loc_panel, item)
 
             # Check if end of list.
@@ -459,7 +459,7 @@ class EDNavigationPanel:
                 return False
 
             # OCR the selected item
-            ocr_textlist = self.ocr.image_simple_ocr(img_selected)
+            ocr_textlist = self.ocr.image_line_ocr(img_selected)
             if ocr_textlist is not None:
                 # Check if list has not changed (we are at the top)
                 if ocr_textlist == ocr_textlist_last:
@@ -474,6 +474,49 @@ class EDNavigationPanel:
                     self.keys.send("UI_Up", state=0)  # got to top row
                     return True
 
+    def jump_to_destination_in_list(self, dst_name, sim_match: float = 0.8) -> bool:
+        """ Reads all the visible rows of the location panel list in one OCR call and, if the destination is one of
+        them, moves the selection straight to it. If the selected row is not the destination after the move, the list
+        is scrolled back to the top, so it can be searched row by row.
+        @param dst_name: The destination name.
+        @param sim_match: Similarity match 0.0 - 1.0 for 0% - 100%.
+        @return: True if the destination is selected, else False.
+        """
+        loc_panel = self.capture_location_panel()
+        if loc_panel is None:
+            return False
+
+        item = self.sub_quad['nav_pnl_location']
+        rows = self.ocr.read_list(loc_panel, item, 'nav_panel_list')
+        if not rows:
+            return False
+
+        sims = self.ocr.string_similarities(dst_name.upper(), [row.text for row in rows])
+        target = int(np.argmax(sims))
+        selected = next((i for i, row in enumerate(rows) if row.selected), None)
+        if sims[target] <= sim_match or selected is None:
+            return False
+
+        logger.debug(f"Found '{dst_name}' in row {target} of the visible list, moving {target - selected} rows.")
+        if target > selected:
+            self.keys.send("UI_Down", repeat=target - selected)
+        elif target < selected:
+            self.keys.send("UI_Up", repeat=selected - target)
+
+        # Check the destination is selected
+        loc_panel = self.capture_location_panel()
+        if loc_panel is not None:
+            img_selected, _ = self.ocr.get_highlighted_item_in_image(loc_panel, item)
+            ocr_textlist = self.ocr.image_line_ocr(img_selected)
+            if ocr_textlist is not None:
+                sim = self.ocr.string_similarity(f"['{dst_name.upper()}']", str(ocr_textlist))
+                if sim > sim_match:
+                    logger.debug(f"Found '{dst_name}' in list.")
+                    return True
+
+        self.scroll_to_top_of_list()
+        return False
+
     def find_destination_in_list(self, dst_name) -> bool:
         # tries is the number of rows to go through to find the item looking for
         # the Nav Panel should be filtered to reduce the number of rows in the list
@@ -485,6 +528,10 @@ class EDNavigationPanel:
             logger.debug(f"Unable to scroll to top of list.")
             return False
 
+        # Read the visible rows in one OCR call and jump straight to the destination if it is there
+        if self.jump_to_destination_in_list(dst_name):
+            return True
+
         y_last = -1
         in_list = False  # Have we seen one item yet? Prevents quiting if we have not selected the first item.
         while 1:
@@ -494,7 +541,7 @@ class EDNavigationPanel:
                 return False
 
             # Find the selected item/menu (solid orange)
-            item = Quad.from_rect(self.sub_reg['nav_pnl_location']['rect'])
+            item = self.sub_quad['nav_pnl_location']
             img_selected, quad = self.ocr.get_highlighted_item_in_image(loc_panel, item)
 
             # Check if end of list.
@@ -504,16 +551,13 @@ class EDNavigationPanel:
 
             if self.ap.debug_overlay:
                 # Scale the selected item down to the scale of the tab bar
-                loc_pnl_quad = Quad.from_rect(self.sub_reg['location_panel']['rect'])
-                q = copy(quad)
-                # Convert to a percentage of the nav panel
-                q.scale_from_origin(loc_pnl_quad.width, loc_pnl_quad.height)
-                q.offset(loc_pnl_quad.left, loc_pnl_quad.top)
+                loc_pnl_quad = self.sub_quad['location_panel']
+                # Convert to a percentage of the nav panel, as a new quad as the quad is used below
+                q = Quad.from_array(quad.points * (loc_pnl_quad.width, loc_pnl_quad.height) +
+                                    (loc_pnl_quad.left, loc_pnl_quad.top))
 
-                # Transform the array of coordinates to the skew of the nav panel
-                q_out = image_reverse_perspective_transform(self.panel, q, self._rev_transform)
-                # Offset to match the nav panel offset
-                q_out.offset(self.panel_quad_pix.left, self.panel_quad_pix.top)
+                # Transform the array of coordinates to the skew of the nav panel, offset to match the nav panel offset
+                q_out = image_reverse_perspective_transform(self.panel, q, self._rev_transform, self.panel_origin)
 
                 # Overlay OCR result
                 # self.ap.overlay.overlay_floating_text('nav_panel_item_text', f'{str(ocr_textlist)}', q_out.left, q_out.top - 25, (0, 255, 0))
@@ -529,7 +573,7 @@ class EDNavigationPanel:
 
             # OCR the selected item
             sim_match = 0.8  # Similarity match 0.0 - 1.0 for 0% - 100%)
-            ocr_textlist = self.ocr.image_simple_ocr(img_selected)
+            ocr_textlist = self.ocr.image_line_ocr(img_selected)
             if ocr_textlist is not None:
                 sim = self.ocr.string_similarity(f"['{dst_name.upper()}']", str(ocr_textlist))
 
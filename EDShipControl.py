@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import time
 from typing import TypedDict
 
 from EDAP_data import *
@@ -26,6 +27,17 @@ def scale(inp: float, in_min: float, in_max: float, out_min: float, out_max: flo
         return x
 
 
+# The max change in deg of the roll, pitch and yaw between frames for the ship to be settled after a movement
+SETTLE_TOLERANCE = 0.5
+# The number of frames in a row within the tolerance for the ship to be settled
+SETTLE_SAMPLES = 2
+
+
+def offset_change(off: CompassTargetOffset, last: CompassTargetOffset) -> float:
+    """ The largest change in deg of the roll, pitch or yaw between two compass/target offsets. """
+    return max(abs((off[axis] - last[axis] + 180.0) % 360.0 - 180.0) for axis in ('roll', 'pit', 'yaw'))
+
+
 class CompassTargetOffset(TypedDict):
     """
     Dictionary containing navigation (compass) and/or Target information.
@@ -53,12 +65,16 @@ class EDShipControl:
 
     def __init__(self, ed_ap, screen, keys, cb):
         self.ap = ed_ap
-        self.ocr = ed_ap.ocr
         self.screen = screen
         self.keys = keys
         self.ap_ckb = cb
         self.status_parser = StatusParser()
 
+    @property
+    def ocr(self):
+        """ The AP's OCR, created on first use if the startup warm-up has not created it yet. """
+        return self.ap.ocr
+
     def add_to_roll_curve(self, angle: float, rate: float):
         """
         Add a point to the current curve of the current ship.
@@ -149,6 +165,37 @@ class EDShipControl:
 
         return True
 
+    def get_settled_offset(self, dly: float) -> CompassTargetOffset | None:
+        """ Waits for the ship to stabilize after a movement and then gets the compass/target offset. With the screen
+        capture thread running, the offset is measured on each new frame after the key was released and returned once
+        it stops changing (SETTLE_SAMPLES frames in a row within SETTLE_TOLERANCE deg), so a ship that settles quickly
+        does not wait the full delay.
+        @param dly: The max time in secs for the ship to stabilize after the key was released.
+        @return: The compass/target data or None.
+        """
+        settle_time = time.monotonic() + dly
+        if self.screen.capture_running:
+            last = None
+            steady = 0
+            timestamp = time.monotonic()
+            while time.monotonic() < settle_time:
+                frame = self.screen.get_frame_newer_than(timestamp)
+                if frame is None:
+                    break  # No new frame, so sleep for the rest of the delay
+                timestamp = frame.timestamp
+                with self.screen.frame_tick(frame):
+                    off = self.ap.get_compass_target_offset()
+                if off is not None and last is not None and offset_change(off, last) <= SETTLE_TOLERANCE:
+                    steady = steady + 1
+                    if steady >= SETTLE_SAMPLES:
+                        return off
+                else:
+                    steady = 0
+                last = off
+
+        sleep(max(0.0, settle_time - time.monotonic()))
+        return self.ap.get_compass_target_offset()
+
     def roll_clockwise_anticlockwise(self, deg: float, auto_tune: bool = False, cur_deg: float = 0.0) -> (
             CompassTargetOffset | None):
         """ Roll in deg. (> 0.0 for roll right, < 0.0 for roll left)
@@ -213,6 +260,7 @@ class EDShipControl:
             self.keys.send('RollRightButton', hold=htime)
         else:
             self.keys.send('RollLeftButton', hold=htime)
+        self.ap.ml_tracker_motion(roll=deg)
 
         # Calculate error
         # Calc the position we want to achieve
@@ -220,10 +268,8 @@ class EDShipControl:
         # Wait for ship to stabilize. Calc the delay from the angle 0 - 45 deg = 0.1 - 0.75 Sec. 45 deg is where the
         # rate no longer increases.
         dly = scale(abs_deg, 0.0, 45.0, 0.5, 1.0, True)
-        sleep(dly)
-
         # Take current reading
-        off = self.ap.get_compass_target_offset()
+        off = self.get_settled_offset(dly)
         if off:
             # Are we still too far away?
             err = sp - off['roll']
@@ -306,6 +352,7 @@ class EDShipControl:
             self.keys.send('PitchUpButton', hold=htime)
         else:
             self.keys.send('PitchDownButton', hold=htime)
+        self.ap.ml_tracker_motion(pitch=deg)
 
         # Calculate error
         # Calc the position we want to achieve
@@ -313,10 +360,8 @@ class EDShipControl:
         # Wait for ship to stabilize. Calc the delay from the angle 0 - 30 deg = 0.1 - 0.5 Sec. 30 deg is where the
         # rate no longer increases.
         dly = scale(abs_deg, 0.0, 30.0, 0.5, 0.75, True)
-        sleep(dly)
-
         # Take current reading
-        off = self.ap.get_compass_target_offset()
+        off = self.get_settled_offset(dly)
         if off:
             # Are we still too far away?
             err = sp - off['pit']
@@ -399,6 +444,7 @@ class EDShipControl:
             self.keys.send('YawRightButton', hold=htime)
         else:
             self.keys.send('YawLeftButton', hold=htime)
+        self.ap.ml_tracker_motion(yaw=deg)
 
         # Calculate error
         # Auto-tune if necessary
@@ -407,10 +453,8 @@ class EDShipControl:
         # Wait for ship to stabilize. Calc the delay from the angle 0 - 30 deg = 0.1 - 0.4 Sec. 30 deg is where the
         # rate no longer increases.
         dly = scale(abs_deg, 0.0, 30.0, 0.5, 0.75, True)
-        sleep(dly)
-
         # Take current reading
-        off = self.ap.get_compass_target_offset()
+        off = self.get_settled_offset(dly)
         if off:
             # Are we still too far away?
             err = sp - off['yaw']
@@ -14,6 +14,8 @@ from EDAPColonizeEditor import read_json_file, write_json_file
 from EDFSS import EDFSS
 from EDPlayerSettings import EDPlayerSettings
 from MachineLearning import MachLearn, ModelType
+from MLTracker import MLTracker
+from ModelWarmUp import ModelWarmUp
 from simple_localization import LocalizationManager
 
 from EDAP_EDMesg_Server import EDMesgServer
@@ -23,8 +25,10 @@ from EDShipControl import EDShipControl, CompassTargetOffset
 from EDStationServicesInShip import EDStationServicesInShip
 from EDSystemMap import EDSystemMap
 from EDlogger import logging
+from DebugSink import debug_sink
 import Image_Templates
 import Screen
+from FrameRecorder import FrameRecorder, new_recording_folder
 import Screen_Regions
 from EDWayPoint import *
 from EDJournal import *
@@ -33,6 +37,7 @@ from EDafk_combat import AFK_Combat
 from EDInternalStatusPanel import EDInternalStatusPanel
 from NavRouteParser import NavRouteParser
 from OCR import OCR
+from Perception import Perception
 from EDNavigationPanel import EDNavigationPanel
 from Overlay import *
 from StatusParser import StatusParser
@@ -51,6 +56,9 @@ Ideas taken from: https://github.com/skai2/EDAutopilot
 Author: sumzer0@yahoo.com
 """
 
+SUN_POLL_INTERVAL = 0.05  # Time (secs) between sun checks while pitching up, if the capture thread is not running
+SUN_CLEAR_WAIT = 0.5  # Part of the estimated time for the sun to leave the sun region used as the settle time
+
 
 # Exception class used to unroll the call tree to to stop execution
 class EDAP_Interrupt(Exception):
@@ -109,8 +117,10 @@ class EDAutopilot:
         self.speed_demand = None  # 'Speed0', 'Speed50', 'Speed100', 'SCSpeed0', 'SCSpeed50' or 'SCSpeed100'
         self._tce_integration = None
         self._ocr = None
+        self._ocr_lock = threading.Lock()  # The OCR and ML models may be loaded by the startup warm up thread
         self._fss_screen = None
         self._mach_learn = None
+        self._mach_learn_lock = threading.Lock()
         self._sc_disengage_active = False  # Is SC Disengage active
         self.ship_tst_roll_enabled = False
         self.ship_tst_pitch_enabled = False
@@ -175,11 +185,19 @@ class EDAutopilot:
         self.status = StatusParser()
         self.nav_route = NavRouteParser()
         self.ship_control = EDShipControl(self, self.scr, self.keys, cb)
+        self.perception = Perception(self)
+        # Track the compass and target between frames, to skip running the ML models when they are stable
+        self.compass_tracker = MLTracker(lambda image: self.mach_learn.model_predict(ModelType.Compass, image, ''),
+                                         [{'compass'}, {'navpoint', 'navpoint-behind'}])
+        self.target_tracker = MLTracker(lambda image: self.mach_learn.model_predict(ModelType.Target, image, ''),
+                                        [{'target', 'target-occluded'}])
         self.internal_panel = EDInternalStatusPanel(self, self.scr, self.keys, cb)
         self.galaxy_map = EDGalaxyMap(self, self.scr, self.keys, cb, self.jn.ship_state()['odyssey'])
         self.system_map = EDSystemMap(self, self.scr, self.keys, cb, self.jn.ship_state()['odyssey'])
         self.stn_svcs_in_ship = EDStationServicesInShip(self, self.scr, self.keys, cb)
         self.nav_panel = EDNavigationPanel(self, self.scr, self.keys, cb)
+        # Loads the OCR and ML models in the background, started by the GUI once shown
+        self.model_warm_up = ModelWarmUp(self)
 
         self.mesg_server = EDMesgServer(self, cb)
         self.mesg_server.actions_port = self.config['EDMesgActionsPort']
@@ -229,6 +247,7 @@ class EDAutopilot:
         self.debug_images = False
         self.auto_tune_rpy = False
         self.debug_image_folder = './debug-output/images'
+        self.recorder: FrameRecorder | None = None  # Records compass/target regions when 'RecordFrames' is set
         if not os.path.exists(self.debug_image_folder):
             os.makedirs(self.debug_image_folder)
 
@@ -263,16 +282,20 @@ class EDAutopilot:
 
     @property
     def mach_learn(self) -> MachLearn:
-        """ Load Machine Learning class when needed. """
+        """ Load Machine Learning class when needed, or wait for the startup warm up to load it. """
         if not self._mach_learn:
-            self._mach_learn = MachLearn(self, self.ap_ckb)
+            with self._mach_learn_lock:
+                if not self._mach_learn:
+                    self._mach_learn = MachLearn(self, self.ap_ckb)
         return self._mach_learn
 
     @property
     def ocr(self) -> OCR:
-        """ Load OCR class when needed. """
+        """ Load OCR class when needed, or wait for the startup warm up to load it. """
         if not self._ocr:
-            self._ocr = OCR(self, self.scr)
+            with self._ocr_lock:
+                if not self._ocr:
+                    self._ocr = OCR(self, self.scr)
         return self._ocr
 
     @property
@@ -368,6 +391,21 @@ class EDAutopilot:
             "PlanetDepartureSCOTime": 5.0,  # SCO boost time when leaving planet in secs
             "FleetCarrierMonitorCAPIDataPath": "",  # EDMC Fleet Carrier Monitor plugin data export path
             "AutoTuneRPYRates": False,  # Enable auto-tune for RPY rates.
+            "FrameCacheMaxAge": 0.0,  # Max age in secs a screen grab is shared between captures. 0.0 to grab each time.
+            "CaptureThreadFPS": 0.0,  # Rate of the background screen capture thread. 0.0 to disable the thread.
+            "RecordFrames": False,  # Record the compass/target regions and detections to the 'recordings' folder
+            "ParallelInference": True,  # Run the compass and target ML models in parallel
+            "MLBackend": "torch",  # ML model backend: 'torch', 'onnx' or 'openvino'. Falls back to 'torch'.
+            "MLThreads": 0,  # CPU threads used by the 'onnx' and 'openvino' ML backends. 0 for the default.
+            "MLTrackFullEvery": 0,  # Track the compass/target between frames, running the ML every N frames. 0=off
+            "OCRCacheSize": 64,  # Number of OCR results cached by image, so an unchanged image is not OCRed again. 0=off
+            "OCRCacheMaxAge": 60.0,  # Max age in secs of a cached OCR result
+            "OCRWorkers": 0,  # Number of OCR worker processes, 0 to run the OCR in the AP process
+            "OCRTimeout": 10.0,  # Max time in secs for an OCR in a worker process, before the worker is restarted
+            "OCRLineMode": False,  # OCR single line text (list items, SC disengage) with the text recognition only
+            "OCRSettleFrames": 2,  # Unchanged captures of a region before it is OCRed when waiting for a screen
+            "WarmUpModels": True,  # Load the OCR and ML models in the background at startup, not on first use
+            "SunClearSettle": 0.0,  # Max secs to keep pitching up after the sun clears, from its last position. 0=off
         }
         # NOTE!!! When adding a new config value above, add the same after read_config() to set
         # a default value or an error will occur reading the new value!
@@ -440,6 +478,36 @@ class EDAutopilot:
                 cnf['FleetCarrierMonitorCAPIDataPath'] = ""
             if 'AutoTuneRPYRates' not in cnf:
                 cnf['AutoTuneRPYRates'] = ""
+            if 'FrameCacheMaxAge' not in cnf:
+                cnf['FrameCacheMaxAge'] = 0.0
+            if 'CaptureThreadFPS' not in cnf:
+                cnf['CaptureThreadFPS'] = 0.0
+            if 'RecordFrames' not in cnf:
+                cnf['RecordFrames'] = False
+            if 'ParallelInference' not in cnf:
+                cnf['ParallelInference'] = True
+            if 'MLBackend' not in cnf:
+                cnf['MLBackend'] = "torch"
+            if 'MLThreads' not in cnf:
+                cnf['MLThreads'] = 0
+            if 'MLTrackFullEvery' not in cnf:
+                cnf['MLTrackFullEvery'] = 0
+            if 'OCRCacheSize' not in cnf:
+                cnf['OCRCacheSize'] = 64
+            if 'OCRCacheMaxAge' not in cnf:
+                cnf['OCRCacheMaxAge'] = 60.0
+            if 'OCRWorkers' not in cnf:
+                cnf['OCRWorkers'] = 0
+            if 'OCRTimeout' not in cnf:
+                cnf['OCRTimeout'] = 10.0
+            if 'OCRLineMode' not in cnf:
+                cnf['OCRLineMode'] = False
+            if 'OCRSettleFrames' not in cnf:
+                cnf['OCRSettleFrames'] = 2
+            if 'WarmUpModels' not in cnf:
+                cnf['WarmUpModels'] = True
+            if 'SunClearSettle' not in cnf:
+                cnf['SunClearSettle'] = 0.0
             self.config = cnf
             logger.debug("read AP json:" + str(cnf))
         else:
@@ -617,7 +685,24 @@ class EDAutopilot:
         self.debug_overlay = self.config['DebugOverlay']
         self.debug_ocr = self.config['DebugOCR']
         self.debug_images = self.config['DebugImages']
+        debug_sink.enable('ocr', self.debug_ocr)
+        for channel in ('images', 'panels', 'highlight'):
+            debug_sink.enable(channel, self.debug_images)
         self.auto_tune_rpy = self.config['AutoTuneRPYRates']
+        self.scr.frame_max_age = self.config['FrameCacheMaxAge']
+        self.perception.parallel = self.config['ParallelInference']
+        self.compass_tracker.full_every = self.config['MLTrackFullEvery']
+        self.target_tracker.full_every = self.config['MLTrackFullEvery']
+        # Start, update or stop the screen capture thread
+        self.scr.start_capture(self.config['CaptureThreadFPS'])
+        # Start or stop the frame recorder
+        if self.config['RecordFrames']:
+            if self.recorder is None:
+                self.recorder = FrameRecorder(new_recording_folder())
+                self.recorder.start()
+        elif self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
 
     def draw_match_rect(self, img, pt1, pt2, color, thick):
         """ Draws the matching rectangle within the image. """
@@ -671,45 +756,49 @@ class EDAutopilot:
         """
         scale = 0
         max_pick = 0
+
+        # Capture the region once and search all the scales in one call, coarse-to-fine on each HSV channel
+        img_region = self.scr.get_screen_region(self.scrReg.reg[reg_name]['rect'], rgb=False)
+        channels = cv2.split(cv2.cvtColor(img_region, cv2.COLOR_BGR2HSV))
+        scales = []
         i = range_low
         while i <= range_high:
-            scale_x = float(i / 100)
-            scale_y = scale_x
-
-            # reload the templates with this scale value
-            self.templ.reload_templates(scale_x, scale_y)
-
-            # do image matching on the compass and the target
-            image, (minVal, maxVal, minLoc, maxLoc), match = self.scrReg.match_template_in_region_x3(reg_name, templ_name)
-
-            if not no_overlay:
-                border = 10  # border to prevent the box from interfering with future matches
-                reg_pos = self.scrReg.reg[reg_name]['rect']
-                width = self.scrReg.templates.template[templ_name]['width'] + border + border
-                height = self.scrReg.templates.template[templ_name]['height'] + border + border
-                left = reg_pos[0] + maxLoc[0] - border
-                top = reg_pos[1] + maxLoc[1] - border
-
-                if maxVal > threshold and maxVal > max_pick:
-                    # Draw box around region
-                    self.overlay.overlay_rect(20, (left, top), (left + width, top + height), (0, 255, 0), 2)
-                    self.overlay.overlay_floating_text(20, f'Match: {maxVal:5.4f}(%)', left, top - 25, (0, 255, 0))
-                else:
-                    # Draw box around region
-                    self.overlay.overlay_rect(21, (left, top), (left + width, top + height), (255, 0, 0), 2)
-                    self.overlay.overlay_floating_text(21, f'Match: {maxVal:5.4f}(%)', left, top - 25, (255, 0, 0))
-
-                self.overlay.overlay_paint()
+            scales.append(i)
+            # Next range
+            i = i + range_step
+        pct_by_scale = {float(i / 100): i for i in scales}
+        results = Image_Templates.match_template_scales(channels, self.templ.raw_template(templ_name),
+                                                        list(pct_by_scale.keys()))
+        if not results:
+            return scale, max_pick
+
+        # Best scale first
+        scale_x, maxVal, maxLoc = results[0]
+        if not no_overlay:
+            border = 10  # border to prevent the box from interfering with future matches
+            reg_pos = self.scrReg.reg[reg_name]['rect']
+            templ_h, templ_w = self.templ.raw_template(templ_name).shape[:2]
+            width = int(templ_w * scale_x) + border + border
+            height = int(templ_h * scale_x) + border + border
+            left = reg_pos[0] + maxLoc[0] - border
+            top = reg_pos[1] + maxLoc[1] - border
 
-            # Check the match percentage
             if maxVal > threshold:
-                if maxVal > max_pick:
-                    max_pick = maxVal
-                    scale = i
-                    # self.ap_ckb('log', 'Cal: Found match:' + f'{max_pick:5.4f}' + "% with scale:" + f'{self.scr.scaleX:5.4f}')
+                # Draw box around region
+                self.overlay.overlay_rect(20, (left, top), (left + width, top + height), (0, 255, 0), 2)
+                self.overlay.overlay_floating_text(20, f'Match: {maxVal:5.4f}(%)', left, top - 25, (0, 255, 0))
+            else:
+                # Draw box around region
+                self.overlay.overlay_rect(21, (left, top), (left + width, top + height), (255, 0, 0), 2)
+                self.overlay.overlay_floating_text(21, f'Match: {maxVal:5.4f}(%)', left, top - 25, (255, 0, 0))
 
-            # Next range
-            i = i + range_step
+            self.overlay.overlay_paint()
+
+        # Check the match percentage
+        if maxVal > threshold:
+            max_pick = maxVal
+            scale = pct_by_scale[scale_x]
+            # self.ap_ckb('log', 'Cal: Found match:' + f'{max_pick:5.4f}' + "% with scale:" + f'{self.scr.scaleX:5.4f}')
 
         return scale, max_pick
 
@@ -807,7 +896,7 @@ class EDAutopilot:
 
         # Log screenshot for diagnostics/training
         f = get_timestamped_filename(f'[fss_detect_elw] {self.jn.ship_state()["cur_star_system"]}', '', 'png')
-        cv2.imwrite(f'{self.debug_image_folder}/{f}', img)
+        debug_sink.write('images', f'{self.debug_image_folder}/{f}', img)
 
         # dvide the region in thirds.  Earth, then Water, then Ammonio
         wid_div3 = scr_reg.reg['fss']['width']/3
@@ -930,8 +1019,8 @@ class EDAutopilot:
         b_max_val = 0.0
         b_compass_quad = Quad()
         # b_pt = [0.0, 0.0]
-        full_compass_image2 = cv2.cvtColor(full_compass_image, cv2.COLOR_BGRA2BGR)
-        ml_res = self.mach_learn.model_predict(ModelType.Compass, full_compass_image2, '')
+        full_compass_image2 = Screen.to_bgr(full_compass_image)
+        ml_res = self.compass_tracker.model_predict(full_compass_image2)
         if ml_res and len(ml_res) > 0:
             for ml in ml_res:
                 if ml.class_name == 'compass':
@@ -950,16 +1039,16 @@ class EDAutopilot:
         # Check compass
         if max_val == 0.0:
             # Log screenshot for diagnostics/training
-            if self.debug_images:
+            if debug_sink.enabled('images'):
                 f = get_timestamped_filename('[get_nav_offset] no_compass_match', '', 'png')
-                cv2.imwrite(f'{self.debug_image_folder}/{f}', full_compass_image2)
+                debug_sink.write('images', f'{self.debug_image_folder}/{f}', full_compass_image2)
             return None
         # Check navpoint
         if n_max_val == 0.0 and b_max_val == 0.0:
             # Log screenshot for diagnostics/training
-            if self.debug_images:
+            if debug_sink.enabled('images'):
                 f = get_timestamped_filename('[get_nav_offset] no_navpoint_match', '', 'png')
-                cv2.imwrite(f'{self.debug_image_folder}/{f}', full_compass_image2)
+                debug_sink.write('images', f'{self.debug_image_folder}/{f}', full_compass_image2)
             return None
 
         # Check if the Nav Point is visible. If not, the Nav Point Behind may be visible
@@ -973,7 +1062,6 @@ class EDAutopilot:
         # get wid/hgt of templates
         # c_left = scr_reg.reg['compass']['rect'][0]
         # c_top = scr_reg.reg['compass']['rect'][1]
-        compass_region = Quad.from_rect(scr_reg.reg['compass']['rect'])
         # wid = scr_reg.templates.template['navpoint']['width']
         # hgt = scr_reg.templates.template['navpoint']['height']
 
@@ -1054,20 +1142,19 @@ class EDAutopilot:
             border = 10  # border to prevent the box from interfering with future matches
             # left = c_left + compass_quad.left
             # top = c_top + compass_quad.top
-            # Copy compass quad and offset to screen co-ords
-            compass_to_screen = copy(compass_quad)
-            compass_to_screen.offset(compass_region.left, compass_region.top)
-            compass_with_border = copy(compass_to_screen)
-            compass_with_border.inflate(border, border)
-            nav_to_screen = copy(n_compass_quad)
-            nav_to_screen.offset(compass_region.left, compass_region.top)
-
-            self.overlay.overlay_rect('compass', (compass_with_border.left, compass_with_border.top), (compass_with_border.right, compass_with_border.bottom), (0, 255, 0), 2)
-            self.overlay.overlay_rect('nav', (nav_to_screen.left, nav_to_screen.top), (nav_to_screen.right, nav_to_screen.bottom), (0, 255, 0), 2)
-            self.overlay.overlay_floating_text('compass', f'Com: {max_val:5.2f} > {scr_reg.compass_match_thresh}', compass_with_border.left, compass_with_border.top - 85, (0, 255, 0))
-            self.overlay.overlay_floating_text('nav', f'Nav: {n_max_val:5.2f} > {scr_reg.navpoint_match_thresh}', compass_with_border.left, compass_with_border.top - 65, (0, 255, 0))
-            self.overlay.overlay_floating_text('nav_beh', f'NavB: {b_max_val:5.2f}', compass_with_border.left, compass_with_border.top - 45, (0, 255, 0))
-            self.overlay.overlay_floating_text('compass_rpy', f'r: {round(final_roll_deg, 2)} p: {round(final_pit_deg, 2)} y: {round(final_yaw_deg, 2)}', compass_with_border.left, compass_with_border.bottom, (0, 255, 0))
+            # Offset the compass and nav point quads to screen co-ords in one call, without copying them
+            boxes = Screen_Regions.QuadArray.from_quads([compass_quad, n_compass_quad])
+            boxes.offset(scr_reg.reg['compass']['rect'][0], scr_reg.reg['compass']['rect'][1])
+            (left, top, right, bottom), nav_rect = boxes.to_rects().tolist()
+            # Add the border to the compass
+            left, top, right, bottom = left - border, top - border, right + border, bottom + border
+
+            self.overlay.overlay_rect('compass', (left, top), (right, bottom), (0, 255, 0), 2)
+            self.overlay.overlay_rect1('nav', nav_rect, (0, 255, 0), 2)
+            self.overlay.overlay_floating_text('compass', f'Com: {max_val:5.2f} > {scr_reg.compass_match_thresh}', left, top - 85, (0, 255, 0))
+            self.overlay.overlay_floating_text('nav', f'Nav: {n_max_val:5.2f} > {scr_reg.navpoint_match_thresh}', left, top - 65, (0, 255, 0))
+            self.overlay.overlay_floating_text('nav_beh', f'NavB: {b_max_val:5.2f}', left, top - 45, (0, 255, 0))
+            self.overlay.overlay_floating_text('compass_rpy', f'r: {round(final_roll_deg, 2)} p: {round(final_pit_deg, 2)} y: {round(final_yaw_deg, 2)}', left, bottom, (0, 255, 0))
             self.overlay.overlay_paint()
 
         if self.cv_view:
@@ -1122,8 +1209,8 @@ class EDAutopilot:
         pt = [0.0, 0.0]
         pt_occ = [0.0, 0.0]
         target_occ_quad = Quad()
-        target_image2 = cv2.cvtColor(dst_image_unfiltered, cv2.COLOR_BGRA2BGR)
-        ml_res = self.mach_learn.model_predict(ModelType.Target, target_image2, '')
+        target_image2 = Screen.to_bgr(dst_image_unfiltered)
+        ml_res = self.target_tracker.model_predict(target_image2)
         if ml_res and len(ml_res) > 0:
             for ml in ml_res:
                 if ml.class_name == 'target':
@@ -1152,9 +1239,9 @@ class EDAutopilot:
                 tar_quad = target_occ_quad
                 occluded = True
         else:
-            if self.debug_images:
+            if debug_sink.enabled('images'):
                 f = get_timestamped_filename('[get_target_offset] no_target_match', '', 'png')
-                cv2.imwrite(f'{self.debug_image_folder}/{f}', dst_image_unfiltered)
+                debug_sink.write('images', f'{self.debug_image_folder}/{f}', dst_image_unfiltered)
             return None
 
         target_region = Quad.from_rect(scr_reg.reg['target']['rect'])
@@ -1193,16 +1280,15 @@ class EDAutopilot:
         # Draw box around region
         if self.debug_overlay:
             border = 10  # border to prevent the box from interfering with future matches
-            # Copy compass quad and offset to screen co-ords
-            target_to_screen = copy(tar_quad)
-            target_to_screen.offset(target_region.left, target_region.top)
-            target_with_border = copy(target_to_screen)
-            target_with_border.inflate(border, border)
-
-            self.overlay.overlay_rect('target', (target_with_border.left, target_with_border.top), (target_with_border.right, target_with_border.bottom), (0, 255, 0), 2)
-            self.overlay.overlay_floating_text('target', f'Tar: {max_val:5.2f} > {scr_reg.target_thresh}', target_with_border.left, target_with_border.top - 45, (0, 255, 0))
-            self.overlay.overlay_floating_text('target_occ', f'TarOcc: {maxVal_occ:5.2f} > {scr_reg.target_occluded_thresh}', target_with_border.left, target_with_border.top - 25, (0, 255, 0))
-            self.overlay.overlay_floating_text('target_rpy', f'r: {round(final_roll_deg, 2)} p: {round(final_pit_deg, 2)} y: {round(final_yaw_deg, 2)}', target_with_border.left, target_with_border.top , (0, 255, 0))
+            # Offset the target quad to screen co-ords and add the border, without copying it
+            left, top, right, bottom = tar_quad.to_rect_list()
+            left, top = left + target_region.left - border, top + target_region.top - border
+            right, bottom = right + target_region.left + border, bottom + target_region.top + border
+
+            self.overlay.overlay_rect('target', (left, top), (right, bottom), (0, 255, 0), 2)
+            self.overlay.overlay_floating_text('target', f'Tar: {max_val:5.2f} > {scr_reg.target_thresh}', left, top - 45, (0, 255, 0))
+            self.overlay.overlay_floating_text('target_occ', f'TarOcc: {maxVal_occ:5.2f} > {scr_reg.target_occluded_thresh}', left, top - 25, (0, 255, 0))
+            self.overlay.overlay_floating_text('target_rpy', f'r: {round(final_roll_deg, 2)} p: {round(final_pit_deg, 2)} y: {round(final_yaw_deg, 2)}', left, top , (0, 255, 0))
             self.overlay.overlay_paint()
 
         if self.cv_view:
@@ -1227,21 +1313,72 @@ class EDAutopilot:
         if max_val > 0.0 or maxVal_occ > 0.0:
             result = {'roll': round(final_roll_deg, 2), 'pit': round(final_pit_deg, 2), 'yaw': round(final_yaw_deg, 2), 'occ': occluded}
         else:
-            if self.debug_images:
+            if debug_sink.enabled('images'):
                 f = get_timestamped_filename('[get_target_offset] no_target_match', '', 'png')
-                cv2.imwrite(f'{self.debug_image_folder}/{f}', dst_image_unfiltered)
+                debug_sink.write('images', f'{self.debug_image_folder}/{f}', dst_image_unfiltered)
             result = None
 
         return result
 
+    def record_frame(self, frame, region_names: list[str], detections: dict):
+        """ Records regions of the frame to the frame recorder, with the status flags, journal state and the
+        detector outputs. Does nothing if the recorder is not running.
+        @param frame: The frame (from Screen.frame_tick()).
+        @param region_names: The Screen_Regions regions to record.
+        @param detections: The detector outputs for the frame.
+        """
+        if self.recorder is None or frame is None:
+            return
+
+        regions = {}
+        for name in region_names:
+            rect = self.scr.screen_rect_to_abs(self.scrReg.reg_pct[name]['rect'])
+            regions[name] = (rect, frame.region(rect))
+
+        status = self.status.current_data or {}
+        meta = {'screen': [self.scr.screen_width, self.scr.screen_height],
+                'status': {key: status.get(key) for key in ('Flags', 'Flags2', 'GuiFocus')},
+                'journal': {key: self.jn.ship.get(key) for key in ('status', 'star_class', 'target',
+                                                                   'cur_star_system', 'fuel_percent', 'is_scooping')},
+                'detections': detections}
+        self.recorder.record(regions, meta, frame.frame_id, frame.timestamp)
+
+    def ml_tracker_motion(self, roll: float = 0.0, pitch: float = 0.0, yaw: float = 0.0):
+        """ Tells the compass and target trackers of a commanded ship rotation, so they can predict where the
+        compass and target will be on the next frame.
+        @param roll: The roll in degrees (> 0.0 for clockwise).
+        @param pitch: The pitch in degrees (> 0.0 for pitch up).
+        @param yaw: The yaw in degrees (> 0.0 for yaw right).
+        """
+        if roll != 0.0:
+            # A roll rotates everything around the center, so cannot be tracked
+            self.compass_tracker.reset()
+            self.target_tracker.reset()
+            return
+
+        if pitch != 0.0 or yaw != 0.0:
+            # The nav point moves non-linearly around the compass, so run the model again
+            self.compass_tracker.reset()
+            # The target moves the opposite way to the ship on the screen
+            self.target_tracker.add_motion(-yaw * self.scr.screen_width / self.hor_fov,
+                                           pitch * self.scr.screen_height / self.ver_fov)
+
     def get_compass_target_offset(self) -> CompassTargetOffset | None:
         """
         Gets the Navigation and Target offsets and determines the best match between the two.
         @return: A TypedDict representing the compass and/or target information.
         """
-        # Check Target and Compass
-        nav_off1 = self.get_nav_offset(self.scrReg)
-        tar_off1 = self.get_target_offset(self.scrReg)
+        # Check Target and Compass, both read from the same frame
+        return self.perception.sense(('compass', 'target')).compass_target
+
+    def combine_compass_target_offset(self, nav_off1: CompassOffset | None,
+                                      tar_off1: TargetOffset | None) -> CompassTargetOffset | None:
+        """
+        Determines the best match between the Navigation and Target offsets.
+        @param nav_off1: The compass offset from get_nav_offset().
+        @param tar_off1: The target offset from get_target_offset().
+        @return: A TypedDict representing the compass and/or target information.
+        """
         if nav_off1 and not tar_off1:
             # Compass detected and not target
             # Try to use the compass data if the target is not visible.
@@ -1314,6 +1451,7 @@ class EDAutopilot:
         #     self.overlay.overlay_paint()
 
         if self.cv_view:
+            dis_image = dis_image.copy()  # The region's filter buffer, reused by the next match
             self.draw_match_rect(dis_image, pt, (pt[0] + width, pt[1] + height), (0,255,0), 2)
             dis_image = cv2.rectangle(dis_image, (0, 0), (1000, 25), (0, 0, 0), -1)
             cv2.putText(dis_image, f'{maxVal:5.4f} > {scr_reg.disengage_thresh}', (1, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
@@ -1345,6 +1483,7 @@ class EDAutopilot:
             self.overlay.overlay_paint()
 
         if self.cv_view:
+            dis_image = dis_image.copy()  # The region's filter buffer, reused by the next match
             self.draw_match_rect(dis_image, pt, (pt[0] + width, pt[1] + height), (0, 255, 0), 2)
             dis_image = cv2.rectangle(dis_image, (0, 0), (1000, 25), (0, 0, 0), -1)
             cv2.putText(dis_image, f'{maxVal:5.4f} > {scr_reg.disengage_thresh}', (1, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
@@ -1365,10 +1504,10 @@ class EDAutopilot:
         if self.status.get_gui_focus() != GuiFocusNoFocus:
             return False
 
-        image = self.scr.get_screen_region(scr_reg.reg['disengage']['rect'])
-        # TODO delete this line when COLOR_RGB2BGR is removed from get_screen()
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        mask = scr_reg.capture_region_filtered(self.scr, 'disengage')
+        # Image and mask are read from the same frame
+        with self.scr.frame_tick():
+            image = Screen.to_bgr(self.scr.get_screen_region(scr_reg.reg['disengage']['rect'], rgb=False))
+            mask = scr_reg.capture_region_filtered(self.scr, 'disengage')
         masked_image = cv2.bitwise_and(image, image, mask=mask)
         image = masked_image
 
@@ -1379,7 +1518,12 @@ class EDAutopilot:
         # OCR the selected item
         sim_match = 0.35  # Similarity match 0.0 - 1.0 for 0% - 100%)
         sim = 0.0
-        ocr_textlist = self.ocr.image_simple_ocr(image, 'disengage')
+        # The line OCR needs the text line, not the whole region, so crop to the text first
+        line = self.ocr.get_text_line_in_image(image, mask)
+        if line is not None:
+            ocr_textlist = self.ocr.image_line_ocr(line, 'disengage')
+        else:
+            ocr_textlist = self.ocr.image_simple_ocr(image, 'disengage')
         if ocr_textlist is not None:
             sim = self.ocr.string_similarity(self.locale["PRESS_TO_DISENGAGE_MSG"], str(ocr_textlist))
             logger.info(f"Disengage similarity with {str(ocr_textlist)} is {sim}")
@@ -1467,7 +1611,7 @@ class EDAutopilot:
                 # if self.sc_disengage_label_up(scr_reg):
                 # If active, latch active flag and let it be reset when out of SC
                 if not self._sc_disengage_active:
-                    self._sc_disengage_active = self.sc_disengage_ocr(self.scrReg)
+                    self._sc_disengage_active = bool(self.perception.sense(('disengage',)).disengage)
             # else:
             #     self._sc_disengage_active = False
 
@@ -1581,7 +1725,40 @@ class EDAutopilot:
             raise Exception('Docking failed (Auto dock timer timed out)')
 
     def is_sun_dead_ahead(self, scr_reg):
-        return scr_reg.sun_percent(scr_reg.screen) > 5
+        return self.perception.sense(('sun',)).sun_ahead
+
+    def sun_clear_time(self, scr_reg, sun) -> float:
+        """ Estimates the time to keep pitching up after the last bright sun check, so a check between the sun
+        leaving the region and glare clearing does not stop the pitch too early. The sun (a disc of the measured bright
+        area) moves down the sun region as we pitch up, so the time is from the distance of its top edge to the bottom
+        of the region. Only part of the estimate is used, as glare makes the sun look larger.
+        Limited to the 'SunClearSettle' config, which is 0.0 by default so the pitch stops once the sun clears, as
+        the 'SunPitchUp+Time' of each ship is tuned for that.
+        @param sun: The SunMeasure.
+        @return: The time in seconds, 0.0 to stop once the sun is not ahead.
+        """
+        max_settle = self.config.get('SunClearSettle', 0.0)
+        if max_settle <= 0.0 or sun is None or sun.centroid is None or self.pitchrate <= 0.0:
+            return 0.0
+        reg_w = scr_reg.reg['sun']['width']
+        reg_h = scr_reg.reg['sun']['height']
+        radius = math.sqrt(sun.pct / 100 * reg_w * reg_h / math.pi)
+        dist_deg = ((1.0 - sun.centroid[1]) * reg_h + radius) * self.ver_fov / self.scr.screen_height
+        return min(dist_deg / self.pitchrate * SUN_CLEAR_WAIT, max_settle)
+
+    def sense_sun_next(self, res):
+        """ Measures the sun again, on the next frame of the capture thread if it is running, else after
+        SUN_POLL_INTERVAL.
+        @param res: The last PerceptionResult.
+        @return: The new PerceptionResult.
+        """
+        if self.scr.capture_running:
+            frame = self.scr.get_frame_newer_than(res.timestamp, SUN_POLL_INTERVAL)
+            with self.scr.frame_tick(frame):
+                return self.perception.sense(('sun',))
+
+        sleep(SUN_POLL_INTERVAL)
+        return self.perception.sense(('sun',))
 
     def sun_avoid(self, scr_reg, scooping: bool):
         """ Use to orient the ship to not be pointing right at the Sun
@@ -1603,8 +1780,15 @@ class EDAutopilot:
         starttime = time.time()
 
         # if sun in front of us, then keep pitching up until it is below us
-        while self.is_sun_dead_ahead(scr_reg):
-            self.keys.send('PitchUpButton', state=1)
+        res = self.perception.sense(('sun',))
+        last_bright = time.monotonic()
+        settle_time = 0.0
+        while res.sun_ahead or time.monotonic() - last_bright < settle_time:
+            if res.sun_ahead:
+                self.keys.send('PitchUpButton', state=1)
+                # Keep pitching for a while after the last bright check if set, as estimated from this measure
+                last_bright = time.monotonic()
+                settle_time = self.sun_clear_time(scr_reg, res.sun)
 
             # check if we are being interdicted
             interdicted = self.interdiction_check()
@@ -1618,6 +1802,8 @@ class EDAutopilot:
                 print("sun avoid failsafe timeout")
                 break
 
+            res = self.sense_sun_next(res)
+
         sleep(0.35)                 # up slightly so not to overheat when scooping
         # Some ships heat up too much and need pitch up a little further
         if self.sunpitchuptime > 0.0:
@@ -1644,7 +1830,7 @@ class EDAutopilot:
         # try multiple times to get aligned.  If the sun is shining on console, this it will be hard to match
         # the vehicle should be positioned with the sun below us via the sun_avoid() routine after a jump
         for ii in range(self.config['NavAlignTries']):
-            off = self.get_compass_target_offset()
+            off = self.perception.sense().compass_target
             if off is None:
                 self.ap_ckb('log', 'Unable to detect compass. Rolling to new position.')
                 # Try rolling if star glare is obscuring the compass
@@ -1823,7 +2009,8 @@ class EDAutopilot:
         for i in range(5):
             # Check Target and Compass
             # nav_off1 = self.get_nav_offset(scr_reg)
-            tar_off1 = self.get_compass_target_offset()
+            res = self.perception.sense()
+            tar_off1 = res.compass_target
             if tar_off1:
                 # Target detected
                 off = tar_off1
@@ -1911,7 +2098,8 @@ class EDAutopilot:
                 self.ship_control.yaw_right_left(off['yaw'], auto_tune=self.auto_tune_rpy, cur_deg=off['yaw'])
 
             # Check Target and Compass
-            tar_off2 = self.get_compass_target_offset()
+            res = self.perception.sense()
+            tar_off2 = res.compass_target
             if tar_off2:
                 off = tar_off2
                 logger.debug(f"sc_target_align after: pit:{off['pit']} yaw: {off['yaw']} ")
@@ -2975,6 +3163,13 @@ class EDAutopilot:
             self.vce.quit()
         if self.overlay != None:
             self.overlay.overlay_quit()
+        self.scr.stop_capture()
+        self.perception.shutdown()
+        if self._ocr is not None:
+            self._ocr.shutdown()
+        debug_sink.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
         self.terminate = True
 
     def engine_loop(self):
@@ -3005,6 +3200,7 @@ class EDAutopilot:
 
             if self.fsd_assist_enabled:
                 logger.debug("Running fsd_assist")
+                self.perception.set_mode('fsd')
                 set_focus_elite_window()
                 self.update_overlay()
                 self.jump_cnt = 0
@@ -3025,6 +3221,7 @@ class EDAutopilot:
 
                 self.stop_sco_monitoring()
                 self.fsd_assist_enabled = False
+                self.perception.set_mode('default')
                 self.ap_ckb('fsd_stop')
                 self.update_overlay()
 
@@ -3041,6 +3238,7 @@ class EDAutopilot:
 
             elif self.sc_assist_enabled:
                 logger.debug("Running sc_assist")
+                self.perception.set_mode('sc')
                 set_focus_elite_window()
                 self.update_overlay()
                 try:
@@ -3057,11 +3255,13 @@ class EDAutopilot:
                 self.stop_sco_monitoring()
                 logger.debug("Completed sc_assist")
                 self.sc_assist_enabled = False
+                self.perception.set_mode('default')
                 self.ap_ckb('sc_stop')
                 self.update_overlay()
 
             elif self.waypoint_assist_enabled:
                 logger.debug("Running waypoint_assist")
+                self.perception.set_mode('waypoint')
 
                 set_focus_elite_window()
                 self.update_overlay()
@@ -3081,6 +3281,7 @@ class EDAutopilot:
 
                 self.stop_sco_monitoring()
                 self.waypoint_assist_enabled = False
+                self.perception.set_mode('default')
                 self.ap_ckb('waypoint_stop')
                 self.update_overlay()
 
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Iterator
+
+import numpy as np
+
+from EDlogger import logger
+
+"""
+File:FrameRecorder.py
+
+Description:
+  Records screen region crops and their metadata (status flags, journal state, detector outputs, etc.) to an
+  archive on a background thread, so a whole route can be captured for offline analysis without slowing the AP.
+  Records are put on a bounded queue and dropped (and counted) if the writer falls behind.
+
+  An archive is a folder holding:
+    chunk_00000.bin, chunk_00001.bin, ... - The raw image bytes of the crops, appended one after another.
+    index.jsonl - One json line per record with the metadata and the chunk, offset, shape and dtype of each crop.
+  The chunks are read back with np.memmap, so reading an archive does not load it into memory. An archive can be
+  replayed with FrameReplay.py.
+"""
+
+INDEX_FILENAME = 'index.jsonl'
+
+
+def _chunk_filename(chunk: int) -> str:
+    return f"chunk_{chunk:05d}.bin"
+
+
+class FrameRecorder:
+    """ Writes region crops and metadata to an archive on a background thread. """
+
+    def __init__(self, folder: str, chunk_size: int = 256 * 1024 * 1024, queue_size: int = 64):
+        """
+        @param folder: The archive folder, created if it does not exist.
+        @param chunk_size: The max size of a chunk file in bytes before a new chunk is started.
+        @param queue_size: The max number of records waiting to be written before new records are dropped.
+        """
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.written = 0  # Records written
+        self.dropped = 0  # Records dropped as the queue was full
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._chunk = 0
+        self._chunk_file = None
+        self._chunk_offset = 0
+        self._index_file = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Starts the writer thread. """
+        if self.running:
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer_loop, name="FrameRecorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Frame recorder started, writing to: {self.folder}")
+
+    def stop(self):
+        """ Writes the queued records and stops the writer thread. """
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join(timeout=10.0)
+        self._thread = None
+        logger.info(f"Frame recorder stopped. {self.written} records written, {self.dropped} dropped.")
+
+    def record(self, regions: dict[str, tuple[list[int], np.ndarray]], meta: dict[str, Any],
+               frame_id: int = 0, timestamp: float | None = None) -> bool:
+        """ Queues region crops and metadata to be written. Never blocks, the record is dropped if the queue is full.
+        @param regions: The crops by region name, as (rect, image) where rect is [L, T, R, B] in pixels.
+        @param meta: The metadata for the record. Must be json serializable (other types are stored as strings).
+        @param frame_id: The id of the frame the crops were taken from.
+        @param timestamp: The time.monotonic() of the frame, else now.
+        @return: True if queued, False if dropped.
+        """
+        if not self.running:
+            return False
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+        # Copy the crops, as they may be views of a frame that is about to be reused
+        crops = [(name, list(rect), np.ascontiguousarray(image).copy()) for name, (rect, image) in regions.items()
+                 if image is not None]
+        try:
+            self._queue.put_nowait((timestamp, frame_id, crops, meta))
+            return True
+        except queue.Full:
+            self.dropped = self.dropped + 1
+            return False
+
+    def _writer_loop(self):
+        """ The writer thread. Writes records until a None is taken from the queue. """
+        try:
+            self._index_file = open(os.path.join(self.folder, INDEX_FILENAME), 'a')
+            self._open_chunk(self._next_chunk_number())
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                try:
+                    self._write_record(*item)
+                except Exception as e:
+                    logger.error(f"Frame recorder failed to write record: {e}")
+        except Exception as e:
+            logger.error(f"Frame recorder failed: {e}")
+        finally:
+            if self._chunk_file is not None:
+                self._chunk_file.close()
+                self._chunk_file = None
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+    def _next_chunk_number(self) -> int:
+        """ Gets the number of the next new chunk, so an existing archive is appended to. """
+        chunk = 0
+        while os.path.exists(os.path.join(self.folder, _chunk_filename(chunk))):
+            chunk = chunk + 1
+        return chunk
+
+    def _open_chunk(self, chunk: int):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+        self._chunk = chunk
+        self._chunk_file = open(os.path.join(self.folder, _chunk_filename(chunk)), 'ab')
+        self._chunk_offset = 0
+
+    def _write_record(self, timestamp: float, frame_id: int, crops: list, meta: dict[str, Any]):
+        regions = []
+        for name, rect, image in crops:
+            data = image.tobytes()
+            if self._chunk_offset > 0 and self._chunk_offset + len(data) > self.chunk_size:
+                self._open_chunk(self._chunk + 1)
+
+            self._chunk_file.write(data)
+            regions.append({'name': name, 'rect': rect, 'chunk': self._chunk, 'offset': self._chunk_offset,
+                            'shape': list(image.shape), 'dtype': str(image.dtype)})
+            self._chunk_offset = self._chunk_offset + len(data)
+
+        entry = {'timestamp': timestamp, 'frame': frame_id, 'regions': regions, 'meta': meta}
+        self._chunk_file.flush()
+        self._index_file.write(json.dumps(entry, default=str) + '\n')
+        self._index_file.flush()
+        self.written = self.written + 1
+
+
+class RecordingArchive:
+    """ Reads an archive written by FrameRecorder. The crops are memory-mapped views of the chunk files. """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.records: list[dict[str, Any]] = []
+        self._chunks: dict[int, np.memmap] = {}
+
+        with open(os.path.join(folder, INDEX_FILENAME), 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    self.records.append(json.loads(line))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self.records)
+
+    def read_region(self, region: dict[str, Any]) -> np.ndarray:
+        """ Gets the image of a region of a record, as a read-only view of the chunk file.
+        @param region: A region from a record's 'regions' list.
+        """
+        chunk = region['chunk']
+        if chunk not in self._chunks:
+            self._chunks[chunk] = np.memmap(os.path.join(self.folder, _chunk_filename(chunk)), dtype=np.uint8,
+                                            mode='r')
+        dtype = np.dtype(region['dtype'])
+        count = int(np.prod(region['shape']))
+        data = self._chunks[chunk][region['offset']:region['offset'] + count * dtype.itemsize]
+        return data.view(dtype).reshape(region['shape'])
+
+    def read_regions(self, record: dict[str, Any]) -> dict[str, tuple[list[int], np.ndarray]]:
+        """ Gets all the regions of a record as (rect, image) by region name. """
+        return {r['name']: (r['rect'], self.read_region(r)) for r in record['regions']}
+
+
+def is_recording_archive(folder: str) -> bool:
+    """ True if the folder holds an archive written by FrameRecorder. """
+    return os.path.isfile(os.path.join(folder, INDEX_FILENAME))
+
+
+def new_recording_folder(parent: str = './recordings') -> str:
+    """ Gets a new timestamped archive folder name under the parent folder. """
+    return os.path.join(parent, datetime.now().strftime("%Y-%m-%d %H-%M-%S"))
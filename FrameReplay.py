@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+import cv2
+import numpy as np
+
+from EDlogger import logger
+from FrameRecorder import RecordingArchive, is_recording_archive
+
+"""
+File:FrameReplay.py
+
+Description:
+  Replays recorded frames through the Screen class in place of screen grabs, so the perception code can be run,
+  benchmarked and regression tested without Elite Dangerous (i.e. on Linux).
+  A replay source can be a folder of png images, a video file, a .npz file holding a 'frames' array (N, H, W, C)
+  and an optional 'timestamps' array (N) in seconds, or an archive written by FrameRecorder. Frames are played at
+  the recorded speed (skipping frames when the detectors cannot keep up, as when live) or at maximum speed (every
+  frame processed).
+
+  Usage (from the repo root):
+    python FrameReplay.py <folder|video|npz|archive> [--detectors sun,compass,target,disengage_ocr] [--realtime]
+                          [--save results.json] [--compare results.json]
+"""
+
+
+class ReplaySource:
+    """ Base class of a replay source. Iterating a source yields (timestamp, image) pairs, where the timestamp is
+    the time in seconds from the start of the recording and the image is BGR (or BGRA). """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __iter__(self) -> Iterator[tuple[float, np.ndarray]]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class ImageFolderSource(ReplaySource):
+    """ Replays the png images in a folder, in filename order, at a fixed frame rate. """
+
+    def __init__(self, folder: str, fps: float = 10.0):
+        super().__init__(folder)
+        self.fps = fps
+        self.files = sorted(glob.glob(os.path.join(folder, '*.png')))
+
+    def __iter__(self) -> Iterator[tuple[float, np.ndarray]]:
+        for i, filepath in enumerate(self.files):
+            image = cv2.imread(filepath)
+            if image is None:
+                logger.warning(f"Replay could not read image: {filepath}")
+                continue
+            yield i / self.fps, image
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+
+class VideoSource(ReplaySource):
+    """ Replays a video file using the timestamps of the video frames. """
+
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self.filepath = filepath
+
+    def __iter__(self) -> Iterator[tuple[float, np.ndarray]]:
+        cap = cv2.VideoCapture(self.filepath)
+        try:
+            while True:
+                ok, image = cap.read()
+                if not ok:
+                    break
+                yield cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, image
+        finally:
+            cap.release()
+
+    def __len__(self) -> int:
+        cap = cv2.VideoCapture(self.filepath)
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        return count
+
+
+class NpzSource(ReplaySource):
+    """ Replays a .npz file holding a 'frames' array (N, H, W, C) and an optional 'timestamps' array (N) in seconds.
+    Without timestamps the frames are played at a fixed frame rate. """
+
+    def __init__(self, filepath: str, fps: float = 10.0):
+        super().__init__(filepath)
+        data = np.load(filepath)
+        self.frames = data['frames']
+        if 'timestamps' in data:
+            self.timestamps = [float(t) for t in data['timestamps']]
+        else:
+            self.timestamps = [i / fps for i in range(len(self.frames))]
+
+    def __iter__(self) -> Iterator[tuple[float, np.ndarray]]:
+        for timestamp, image in zip(self.timestamps, self.frames):
+            yield timestamp, image
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+class ArchiveSource(ReplaySource):
+    """ Replays an archive written by FrameRecorder. The crops of each record are pasted at their recorded
+    positions into a black frame of the recorded screen size. """
+
+    def __init__(self, folder: str):
+        super().__init__(folder)
+        self.archive = RecordingArchive(folder)
+
+    def __iter__(self) -> Iterator[tuple[float, np.ndarray]]:
+        start = None
+        for record in self.archive:
+            regions = self.archive.read_regions(record)
+            if not regions:
+                continue
+
+            screen = record['meta'].get('screen')
+            if screen:
+                width, height = screen
+            else:
+                width = max(rect[2] for rect, _ in regions.values())
+                height = max(rect[3] for rect, _ in regions.values())
+
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            for rect, image in regions.values():
+                if image.ndim == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                h = min(image.shape[0], height - rect[1])
+                w = min(image.shape[1], width - rect[0])
+                frame[rect[1]:rect[1] + h, rect[0]:rect[0] + w] = image[:h, :w, :3]
+
+            if start is None:
+                start = record['timestamp']
+            yield record['timestamp'] - start, frame
+
+    def __len__(self) -> int:
+        return len(self.archive)
+
+
+def open_replay_source(path: str, fps: float = 10.0) -> ReplaySource:
+    """ Opens a replay source of the type given by the path.
+    @param path: A folder of png images, a FrameRecorder archive folder, a .npz file or a video file.
+    @param fps: The frame rate for sources without timestamps.
+    """
+    if os.path.isdir(path):
+        if is_recording_archive(path):
+            return ArchiveSource(path)
+        return ImageFolderSource(path, fps)
+    if path.lower().endswith('.npz'):
+        return NpzSource(path, fps)
+    return VideoSource(path)
+
+
+@dataclass
+class ReplayReport:
+    """ Results of a replay. """
+    frames: int = 0  # Frames processed
+    skipped: int = 0  # Frames skipped to keep up with the recording
+    duration: float = 0.0  # Total time in seconds
+    latencies: dict[str, list[float]] = field(default_factory=dict)  # Time of each detector call in seconds by name
+    results: list[dict[str, Any]] = field(default_factory=list)  # Detector results of each frame
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.duration if self.duration > 0 else 0.0
+
+    def summary(self) -> str:
+        """ Returns the frame rate and the latency of each detector as text. """
+        lines = [f"Frames: {self.frames} (skipped {self.skipped}) in {self.duration:.2f}s = {self.fps:.1f} fps"]
+        for name, times in self.latencies.items():
+            if not times:
+                continue
+            ms = np.array(times) * 1000
+            lines.append(f"  {name:<16} mean {np.mean(ms):8.2f}ms  p50 {np.percentile(ms, 50):8.2f}ms"
+                         f"  p95 {np.percentile(ms, 95):8.2f}ms  max {np.max(ms):8.2f}ms")
+        return "\n".join(lines)
+
+
+class FrameReplay:
+    """ Plays a replay source through a Screen, one frame at a time. """
+
+    def __init__(self, screen, source: ReplaySource, realtime: bool = False):
+        """
+        @param screen: The Screen to play the frames through.
+        @param source: The replay source.
+        @param realtime: True to play at the recorded speed, skipping frames if the caller is too slow. False to
+        play every frame as fast as the caller processes them.
+        """
+        self.screen = screen
+        self.source = source
+        self.realtime = realtime
+        self.skipped = 0
+
+    def __iter__(self) -> Iterator[int]:
+        """ Sets each frame as the screen image and yields the frame index. """
+        self.skipped = 0
+        start = time.monotonic()
+        frames = iter(enumerate(self.source))
+        pending = next(frames, None)
+        while pending is not None:
+            idx, (timestamp, image) = pending
+            pending = next(frames, None)
+
+            if self.realtime:
+                elapsed = time.monotonic() - start
+                # Skip this frame if the next one is already due, as a live capture would
+                if pending is not None and pending[1][0] <= elapsed:
+                    self.skipped += 1
+                    continue
+                if timestamp > elapsed:
+                    time.sleep(timestamp - elapsed)
+
+            self.screen.set_screen_image(image)
+            yield idx
+
+
+def run_replay(replay: FrameReplay, detectors: dict[str, Callable[[], Any]]) -> ReplayReport:
+    """ Plays the replay, calling each detector on every frame.
+    @param replay: The replay.
+    @param detectors: The detectors to call, by name. Each is called with no arguments and reads from the screen.
+    @return: The report with the timings and the detector results.
+    """
+    report = ReplayReport(latencies={name: [] for name in detectors})
+    start = time.perf_counter()
+    for idx in replay:
+        result = {'frame': idx}
+        with replay.screen.frame_tick():
+            for name, func in detectors.items():
+                t = time.perf_counter()
+                result[name] = func()
+                report.latencies[name].append(time.perf_counter() - t)
+        report.results.append(result)
+        report.frames += 1
+    report.duration = time.perf_counter() - start
+    report.skipped = replay.skipped
+    return report
+
+
+def _ml_matches_to_list(matches) -> list | None:
+    """ Converts ML matches to a list that can be saved as json. """
+    if matches is None:
+        return None
+    return [[m.class_name, round(m.match_pct, 3), [round(v, 1) for v in m.bounding_quad.to_rect_list()]]
+            for m in matches]
+
+
+def build_detectors(screen, names: list[str]) -> dict[str, Callable[[], Any]]:
+    """ Builds the detectors to run on each frame. The screen must hold the first frame, so the regions and
+    templates are sized for it. The ML and OCR modules are only imported when their detectors are used.
+    @param screen: The Screen the frames are played through.
+    @param names: The detector names: 'sun', 'compass', 'target' and 'disengage_ocr'.
+    """
+    import Image_Templates
+    import Screen_Regions
+
+    # Create the calibration file with the default regions if it does not exist, as the GUI does on start
+    Screen_Regions.load_default_calib_data()
+
+    screen.update_scale()
+    templ = Image_Templates.Image_Templates(screen.scaleX, screen.scaleY)
+    scr_reg = Screen_Regions.Screen_Regions(screen, templ)
+
+    detectors = {}
+    if 'sun' in names:
+        detectors['sun'] = lambda: scr_reg.sun_percent(screen)
+
+    if 'compass' in names or 'target' in names:
+        from MachineLearning import MachLearn, ModelType
+        mach_learn = MachLearn(None, None)
+        if 'compass' in names:
+            detectors['compass'] = lambda: _ml_matches_to_list(mach_learn.model_predict(
+                ModelType.Compass, scr_reg.capture_region_percent(screen, 'compass'), ''))
+        if 'target' in names:
+            detectors['target'] = lambda: _ml_matches_to_list(mach_learn.model_predict(
+                ModelType.Target, scr_reg.capture_region_percent(screen, 'target'), ''))
+
+    if 'disengage_ocr' in names:
+        from OCR import OCR
+        ocr = OCR(None, screen)
+        detectors['disengage_ocr'] = lambda: ocr.image_simple_ocr(
+            screen.get_screen_region(scr_reg.reg['disengage']['rect'], rgb=False), 'disengage')
+
+    return detectors
+
+
+def compare_results(results: list[dict[str, Any]], expected: list[dict[str, Any]]) -> int:
+    """ Compares the detector results of a replay against expected (saved) results and logs each difference.
+    @return: The number of differences.
+    """
+    diffs = 0
+    expected_by_frame = {r['frame']: r for r in expected}
+    for result in results:
+        exp = expected_by_frame.get(result['frame'])
+        if exp is None:
+            continue
+        for name, value in result.items():
+            if name in exp and exp[name] != value:
+                diffs += 1
+                print(f"Frame {result['frame']} {name}: expected {exp[name]}, got {value}")
+    return diffs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Replay recorded frames through the perception code.')
+    parser.add_argument('path', help='A folder of png images, a recorder archive, a video file or a .npz file.')
+    parser.add_argument('--detectors', default='sun,compass,target,disengage_ocr',
+                        help='Comma separated list of detectors to run.')
+    parser.add_argument('--fps', type=float, default=10.0, help='Frame rate of sources without timestamps.')
+    parser.add_argument('--realtime', action='store_true', help='Play at the recorded speed, skipping frames.')
+    parser.add_argument('--save', help='Save the detector results to this json file.')
+    parser.add_argument('--compare', help='Compare the detector results with this json file.')
+    args = parser.parse_args()
+
+    from Screen import Screen
+
+    source = open_replay_source(args.path, args.fps)
+    screen = Screen(cb=lambda *args_, **kwargs: None)
+
+    # Set the first frame so the regions can be sized for it
+    first = next(iter(source), None)
+    if first is None:
+        print(f"No frames in: {args.path}")
+        return 1
+    screen.set_screen_image(first[1])
+
+    detectors = build_detectors(screen, [d.strip() for d in args.detectors.split(',') if d.strip()])
+    report = run_replay(FrameReplay(screen, source, args.realtime), detectors)
+    print(report.summary())
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(report.results, fp, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            expected = json.load(fp)
+        diffs = compare_results(report.results, expected)
+        print(f"{diffs} differences from {args.compare}")
+        if diffs > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
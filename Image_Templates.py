@@ -1,7 +1,12 @@
+import hashlib
+import json
+import os
+import struct
 import sys
 from os.path import abspath, getmtime, isfile, join, dirname
 
 import cv2
+import numpy as np
 from EDlogger import logger
 
 """
@@ -10,10 +15,326 @@ File:Image_Templates.py
 Description:
   Class defines template images that will be used with opencv to match in screen regions
 
+  Also has a coarse-to-fine (image pyramid) matcher. The template and image are downsampled by halves, the
+  template is matched over the whole image at the lowest resolution, and only the top few candidates are refined
+  at each higher resolution in a small window. match_template_scales() searches a range of template scales the
+  same way, matching every scale at low resolution and refining only the best scales.
+
+  The scaled templates (and their pyramids) are cached on disk by TemplateCache, one file per screen scale, so a
+  reload (on start and on every ship change) maps the file instead of reading and resizing every PNG. Each cached
+  template is keyed by the hash of its PNG, so the cache is rebuilt automatically when a PNG changes. The cache
+  file is mapped read-only, so it can be shared by worker processes.
+
 Author: sumzer0@yahoo.com
 """
 
 
+PYR_MIN_TEMPLATE = 16  # Min size (pixels) of the template at the lowest pyramid level
+PYR_MAX_LEVELS = 3  # Max number of times the template and image are halved
+PYR_TOP_K = 3  # Number of candidates refined from the lowest level
+PYR_REFINE_MARGIN = 3  # Search margin (pixels) around a candidate at each higher level
+
+TEMPLATE_CACHE_DIR = 'templates/cache'
+TEMPLATE_CACHE_MAGIC = b'EDAPTPL1'
+TEMPLATE_CACHE_ALIGN = 64  # Alignment (bytes) of each array in the cache file
+TEMPLATE_CACHE_MAX_FILES = 8  # Max number of scales kept in the cache, the least recently used are deleted
+
+# Template name and file, loaded by reload_templates()
+TEMPLATE_FILES = {'elw': "templates/elw-template.png",
+                  'elw_sig': "templates/elw-sig-template.png",
+                  'target': "templates/destination.png",
+                  'disengage': "templates/sc-disengage.png",
+                  'missions': "templates/completed-missions.png",
+                  'dest_sirius': "templates/dest-sirius-atmos-HL.png",
+                  'robigo_mines': "templates/robigo-mines-selected.png",
+                  'sirius_atmos': "templates/sirius-atmos-selected.png",
+                  }
+
+
+def pyramid_levels(templ_shape) -> int:
+    """ The number of pyramid levels for a template, keeping it at least PYR_MIN_TEMPLATE at the lowest level. """
+    h, w = templ_shape[:2]
+    levels = 0
+    while levels < PYR_MAX_LEVELS and min(h, w) >= 2 * PYR_MIN_TEMPLATE:
+        h, w = h // 2, w // 2
+        levels = levels + 1
+    return levels
+
+
+def build_pyramid(image, levels: int) -> list:
+    """ Builds an image pyramid, [full size, 1/2, 1/4, ...] with levels + 1 images. """
+    pyramid = [image]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def _top_k_locs(match, k: int, templ_shape) -> list:
+    """ Gets the locations of the k best matches, at least half a template apart. """
+    match = match.copy()
+    h, w = templ_shape[:2]
+    locs = []
+    for _ in range(k):
+        (_, max_val, _, max_loc) = cv2.minMaxLoc(match)
+        if max_val <= -1.0:
+            break
+        locs.append(max_loc)
+        x, y = max_loc
+        match[max(0, y - h // 2):y + h // 2 + 1, max(0, x - w // 2):x + w // 2 + 1] = -1.0
+    return locs
+
+
+def _refine(image, templ, loc, margin: int):
+    """ Matches the template in a window around the location.
+    @return: The match value and location of the best match in the window. """
+    t_h, t_w = templ.shape[:2]
+    img_h, img_w = image.shape[:2]
+    x1 = max(0, min(loc[0] - margin, img_w - t_w))
+    y1 = max(0, min(loc[1] - margin, img_h - t_h))
+    x2 = min(img_w, loc[0] + t_w + margin)
+    y2 = min(img_h, loc[1] + t_h + margin)
+    match = cv2.matchTemplate(image[y1:y2, x1:x2], templ, cv2.TM_CCOEFF_NORMED)
+    (_, max_val, _, max_loc) = cv2.minMaxLoc(match)
+    return max_val, (max_loc[0] + x1, max_loc[1] + y1)
+
+
+def match_pyramid(img_pyramid: list, templ_pyramid: list, top_k: int = PYR_TOP_K):
+    """ Coarse-to-fine template match (TM_CCOEFF_NORMED). With a single level this is a plain full match.
+    @param img_pyramid: The image pyramid from build_pyramid().
+    @param templ_pyramid: The template pyramid from build_pyramid().
+    @param top_k: The number of candidates refined from the lowest level.
+    @return: The detail of match (minVal, maxVal, minLoc, maxLoc) at full resolution and the match mask of the lowest
+    level. minVal and minLoc are from the lowest level (scaled to full resolution). No match (0.0) and an empty mask
+    if the image is smaller than the template.
+    """
+    def fits(level: int) -> bool:
+        return (img_pyramid[level].shape[0] >= templ_pyramid[level].shape[0] and
+                img_pyramid[level].shape[1] >= templ_pyramid[level].shape[1])
+
+    # pyrDown rounds up, so an image a little smaller than the template can still fit it at the lower levels
+    if not fits(0):
+        return (0.0, 0.0, (0, 0), (0, 0)), np.zeros((0, 0), np.float32)
+    levels = min(len(img_pyramid), len(templ_pyramid)) - 1
+    # The image must be at least the template size at the lowest level
+    while levels > 0 and not fits(levels):
+        levels = levels - 1
+
+    coarse = cv2.matchTemplate(img_pyramid[levels], templ_pyramid[levels], cv2.TM_CCOEFF_NORMED)
+    (min_val, max_val, min_loc, max_loc) = cv2.minMaxLoc(coarse)
+    if levels == 0:
+        return (min_val, max_val, min_loc, max_loc), coarse
+
+    best_val, best_loc = -1.0, (0, 0)
+    for loc in _top_k_locs(coarse, top_k, templ_pyramid[levels].shape):
+        val = -1.0
+        for level in range(levels - 1, -1, -1):
+            val, loc = _refine(img_pyramid[level], templ_pyramid[level], (loc[0] * 2, loc[1] * 2), PYR_REFINE_MARGIN)
+        if val > best_val:
+            best_val, best_loc = val, loc
+
+    scale = 2 ** levels
+    return (min_val, best_val, (min_loc[0] * scale, min_loc[1] * scale), best_loc), coarse
+
+
+def match_template_scales(images: list, templ, scales: list[float], top_k: int = PYR_TOP_K) -> list:
+    """ Searches a range of template scales in one call. Every scale is matched at low resolution and only the
+    top_k scales are refined at full resolution.
+    @param images: The images to search (i.e. the H, S and V channels), the best of the images is kept per scale.
+    @param templ: The unscaled template.
+    @param scales: The template scales to search, i.e. [0.5, 0.51, ...].
+    @param top_k: The number of scales refined at full resolution.
+    @return: The refined scales as a list of (scale, maxVal, maxLoc), best first.
+    """
+    scales = [sc for sc in scales if sc > 0.0]
+    if not scales:
+        return []
+
+    # Use the same level for all scales, so the coarse matches can be compared
+    smallest = cv2.resize(templ, (0, 0), fx=min(scales), fy=min(scales))
+    levels = pyramid_levels(smallest.shape) if smallest.size > 0 else 0
+    img_pyramids = [build_pyramid(image, levels) for image in images]
+
+    coarse = []
+    for sc in scales:
+        t = cv2.resize(templ, (0, 0), fx=sc, fy=sc)
+        t_low = build_pyramid(t, levels)[levels]
+        if t_low.size == 0:
+            continue
+        best = -1.0
+        for img_pyr in img_pyramids:
+            low = img_pyr[levels]
+            if low.shape[0] >= t_low.shape[0] and low.shape[1] >= t_low.shape[1]:
+                (_, max_val, _, _) = cv2.minMaxLoc(cv2.matchTemplate(low, t_low, cv2.TM_CCOEFF_NORMED))
+                best = max(best, max_val)
+        coarse.append((best, sc))
+
+    results = []
+    for _, sc in sorted(coarse, reverse=True)[:top_k]:
+        t_pyramid = build_pyramid(cv2.resize(templ, (0, 0), fx=sc, fy=sc), levels)
+        best_val, best_loc = -1.0, (0, 0)
+        for img_pyr in img_pyramids:
+            (_, max_val, _, max_loc), _ = match_pyramid(img_pyr, t_pyramid)
+            if max_val > best_val:
+                best_val, best_loc = max_val, max_loc
+        results.append((sc, best_val, best_loc))
+
+    results.sort(key=lambda r: r[1], reverse=True)
+    return results
+
+
+def file_sha1(path: str) -> str:
+    """ The sha1 hex digest of the file contents. """
+    with open(path, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+class TemplateCache:
+    """ On disk cache of the scaled grayscale templates and their pyramids, one file per (scale_x, scale_y).
+    The file is a small json header followed by the raw uint8 arrays, so it is mapped with np.memmap and the
+    templates are read-only views of the mapped file. Each template in the header records the sha1 of its PNG
+    (with the PNG size and mtime, so an unchanged PNG is not hashed again) and the offset and shape of each array.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.hits = 0  # Number of templates loaded from the cache
+        self.misses = 0  # Number of templates rebuilt
+
+    def file_path(self, scale_x: float, scale_y: float) -> str:
+        return join(self.cache_dir, f"templates_{scale_x:.4f}_{scale_y:.4f}.bin")
+
+    def load(self, files: dict[str, str], scale_x: float, scale_y: float, build_func) -> dict[str, list] | None:
+        """ Gets the cached arrays of the template files at the scale, rebuilding the cache file if any template
+        is missing or its PNG has changed.
+        @param files: The template file names by their absolute path.
+        @param scale_x: The X scale.
+        @param scale_y: The Y scale.
+        @param build_func: Function taking a file name and returning the list of arrays (the scaled template and
+         its pyramid levels) to cache for it.
+        @return: The list of arrays by file name, or None if the PNGs could not be read.
+        """
+        path = self.file_path(scale_x, scale_y)
+        header, mm = self._read(path)
+        cached = header.get('entries', {}) if header else {}
+
+        entries = {}
+        for file_path, file_name in files.items():
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                logger.error(f"Template not found: {file_path}")
+                return None
+            entry = cached.get(file_name)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                sha1 = entry['sha1']  # Unchanged since it was hashed
+            else:
+                sha1 = file_sha1(file_path)
+            entries[file_name] = {'sha1': sha1, 'size': st.st_size, 'mtime': st.st_mtime}
+
+        stale = [name for name, entry in entries.items()
+                 if name not in cached or cached[name]['sha1'] != entry['sha1']]
+        if mm is not None and not stale:
+            self.hits = self.hits + len(entries)
+            os.utime(path)  # Mark as recently used for pruning
+            return {name: self._views(mm, cached[name]['arrays']) for name in entries}
+
+        # Rebuild the whole file, reusing the arrays of the unchanged templates
+        arrays = {}
+        for name in entries:
+            if name not in stale and mm is not None:
+                # Copy, so the old file is not mapped while it is replaced
+                arrays[name] = [np.array(v) for v in self._views(mm, cached[name]['arrays'])]
+            else:
+                arrays[name] = build_func(name)
+                if arrays[name] is None:
+                    return None
+                self.misses = self.misses + 1
+        del mm
+        if self._write(path, entries, arrays):
+            header, mm = self._read(path)
+            if mm is not None:
+                return {name: self._views(mm, header['entries'][name]['arrays']) for name in entries}
+        return arrays
+
+    @staticmethod
+    def _views(mm, arrays: list) -> list:
+        """ The arrays as read-only views of the mapped file. """
+        return [mm[offset:offset + h * w].reshape(h, w) for offset, h, w in arrays]
+
+    @staticmethod
+    def _read(path: str):
+        """ Reads the header and maps the data of the cache file.
+        @return: The header dict and the mapped data, or None, None if missing or invalid. """
+        if not isfile(path):
+            return None, None
+        try:
+            with open(path, 'rb') as fp:
+                magic = fp.read(len(TEMPLATE_CACHE_MAGIC))
+                (length,) = struct.unpack('<Q', fp.read(8))
+                header = json.loads(fp.read(length).decode('utf-8'))
+                data_start = fp.tell()
+            if magic != TEMPLATE_CACHE_MAGIC:
+                raise ValueError("bad magic")
+            if os.path.getsize(path) == data_start:
+                return header, np.zeros(0, np.uint8)  # No data, an empty file can not be mapped
+            return header, np.memmap(path, dtype=np.uint8, mode='r', offset=data_start)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Template cache {path} invalid, rebuilding: {e}")
+            return None, None
+
+    def _write(self, path: str, entries: dict, arrays: dict) -> bool:
+        """ Writes the cache file, via a temporary file so a reader never sees a partial file.
+        @return: True if written. """
+        # Array offsets are from the start of the data, which follows the header aligned to TEMPLATE_CACHE_ALIGN
+        offset = 0
+        layout = {}
+        for name, arrs in arrays.items():
+            layout[name] = []
+            for a in arrs:
+                layout[name].append([offset, a.shape[0], a.shape[1]])
+                offset = offset + -(-a.size // TEMPLATE_CACHE_ALIGN) * TEMPLATE_CACHE_ALIGN
+        header = {'entries': {name: dict(entry, arrays=layout[name]) for name, entry in entries.items()}}
+        header_bytes = json.dumps(header).encode('utf-8')
+        pad = -(len(TEMPLATE_CACHE_MAGIC) + 8 + len(header_bytes)) % TEMPLATE_CACHE_ALIGN
+        header_bytes = header_bytes + b' ' * pad
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as fp:
+                fp.write(TEMPLATE_CACHE_MAGIC)
+                fp.write(struct.pack('<Q', len(header_bytes)))
+                fp.write(header_bytes)
+                data_start = fp.tell()
+                for name, arrs in arrays.items():
+                    for (arr_offset, _, _), a in zip(layout[name], arrs):
+                        fp.seek(data_start + arr_offset)
+                        fp.write(np.ascontiguousarray(a, dtype=np.uint8).tobytes())
+                fp.truncate(data_start + offset)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # i.e. the file is mapped by another process on Windows, use the built templates without caching
+            logger.warning(f"Unable to write template cache {path}: {e}")
+            if isfile(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        logger.debug(f"Template cache written: {path} ({offset} bytes)")
+        self._prune(path)
+        return True
+
+    def _prune(self, keep: str):
+        """ Deletes the least recently used cache files over TEMPLATE_CACHE_MAX_FILES. """
+        try:
+            files = [join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.bin')]
+            files.sort(key=getmtime, reverse=True)
+            for f in files[TEMPLATE_CACHE_MAX_FILES:]:
+                if f != keep:
+                    os.remove(f)
+        except OSError as e:
+            logger.debug(f"Unable to prune template cache: {e}")
+
+
 class Image_Templates:
     def __init__(self, scale_x, scale_y):
         self.template = {'elw': {'image': None, 'width': 1, 'height': 1},
@@ -25,6 +346,9 @@ class Image_Templates:
                          'sirius_atmos': {'image': None, 'width': 1, 'height': 1}
                          }
 
+        self.raw = {}  # Unscaled template images by file name, so the templates can be rescaled without a reload
+        self.cache = TemplateCache(self.resource_path(TEMPLATE_CACHE_DIR))
+
         # load the templates and scale them.  Default templates assumed 3440x1440 screen resolution
         self.reload_templates(scale_x, scale_y)
 
@@ -32,21 +356,46 @@ class Image_Templates:
         """ Load the template image in color. If we need grey scale for matching, we can apply that later as needed.
         Resize the image, as the templates are based on 3440x1440 resolution, so scale to current screen resolution
          return image and size info. """
-        template = cv2.imread(self.resource_path(file_name), cv2.IMREAD_GRAYSCALE)
-        template = cv2.resize(template, (0, 0), fx=scale_x, fy=scale_y)
-        width, height = template.shape[::-1]
-        return {'image': template, 'width': width, 'height': height}
+        return self._template_dict(file_name, self._build_template(file_name, scale_x, scale_y))
+
+    def _build_template(self, file_name: str, scale_x: float, scale_y: float) -> list | None:
+        """ Reads the template and scales it.
+        @return: The scaled template and its pyramid levels, or None if the file could not be read. """
+        raw = self.raw_image(file_name)
+        if raw is None:
+            return None
+        template = cv2.resize(raw, (0, 0), fx=scale_x, fy=scale_y)
+        return build_pyramid(template, pyramid_levels(template.shape))
+
+    @staticmethod
+    def _template_dict(file_name: str, pyramid: list) -> dict:
+        height, width = pyramid[0].shape[:2]
+        return {'image': pyramid[0], 'width': width, 'height': height, 'pyramid': pyramid, 'file': file_name}
+
+    def raw_image(self, file_name: str):
+        """ Gets the unscaled image of a template file, reading it on first use. """
+        if file_name not in self.raw:
+            image = cv2.imread(self.resource_path(file_name), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                logger.error(f"Unable to read template: {file_name}")
+                return None
+            self.raw[file_name] = image
+        return self.raw[file_name]
+
+    def raw_template(self, templ_name: str):
+        """ Gets the unscaled image of a template. """
+        return self.raw_image(self.template[templ_name]['file'])
 
     def reload_templates(self, scale_x, scale_y):
-        """ Load the full set of image templates. """
-        self.template['elw'] = self.load_template("templates/elw-template.png", scale_x, scale_y)
-        self.template['elw_sig'] = self.load_template("templates/elw-sig-template.png", scale_x, scale_y)
-        self.template['target'] = self.load_template("templates/destination.png", scale_x, scale_y)
-        self.template['disengage'] = self.load_template("templates/sc-disengage.png", scale_x, scale_y)
-        self.template['missions'] = self.load_template("templates/completed-missions.png", scale_x, scale_y)
-        self.template['dest_sirius'] = self.load_template("templates/dest-sirius-atmos-HL.png", scale_x, scale_y)
-        self.template['robigo_mines'] = self.load_template("templates/robigo-mines-selected.png", scale_x, scale_y)
-        self.template['sirius_atmos'] = self.load_template("templates/sirius-atmos-selected.png", scale_x, scale_y)
+        """ Load the full set of image templates, from the template cache if they are unchanged. """
+        files = {self.resource_path(f): f for f in TEMPLATE_FILES.values()}
+        pyramids = self.cache.load(files, scale_x, scale_y,
+                                   lambda file_name: self._build_template(file_name, scale_x, scale_y))
+        for name, file_name in TEMPLATE_FILES.items():
+            if pyramids is not None:
+                self.template[name] = self._template_dict(file_name, pyramids[file_name])
+            else:
+                self.template[name] = self.load_template(file_name, scale_x, scale_y)
 
     def resource_path(self, relative_path):
         """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from EDlogger import logger
+from MachineLearning import MachLearnMatch
+from Screen_Regions import Quad
+
+"""
+File:MLTracker.py
+
+Description:
+  Tracks the matches of a MachLearn model between frames, so the model does not need to be run on every frame
+  while the compass/target is stable (i.e. holding alignment in supercruise).
+  After a full model prediction, each match is tracked by a constant velocity Kalman filter. On the next frames
+  the position of each match is predicted (plus any known movement, i.e. from a commanded pitch or yaw) and
+  verified by matching the image of the match from the last prediction in a small area around the predicted
+  position. The model is run again if any match is not found, if the frame is a different size, if not all the
+  required classes are tracked, or after 'full_every' frames.
+  A tracked match keeps the class of the last prediction, so a match whose class can change in place (i.e.
+  navpoint/navpoint-behind, target/target-occluded) is checked on each frame: the model is run again if it no longer
+  closely matches its own image, or if it matches the last seen image of the other class as well.
+
+  Usage:
+    tracker = MLTracker(lambda image: ml.model_predict(ModelType.Target, image, ''), [{'target', 'target-occluded'}])
+    matches = tracker.model_predict(image)  # Same result as model_predict()
+"""
+
+MATCH_THRESH = 0.7  # Min TM_CCOEFF_NORMED match to accept a tracked position
+MIN_MARGIN = 16  # Min search margin in pixels around the predicted position
+CLASS_THRESH = 0.9  # Min match of a track whose class can change to its own image, else the model is run again
+
+
+class _Track:
+    """ A tracked match. """
+
+    def __init__(self, match: MachLearnMatch, gray: np.ndarray):
+        self.class_name = match.class_name
+        self.match_pct = match.match_pct
+        self.width = int(round(match.bounding_quad.width))
+        self.height = int(round(match.bounding_quad.height))
+        left = int(round(match.bounding_quad.left))
+        top = int(round(match.bounding_quad.top))
+        self.template = gray[top:top + self.height, left:left + self.width].copy()
+        self.score = 0.0  # The match of the template at the last tracked position
+        self.patch: np.ndarray | None = None  # The image at the last tracked position
+
+        # State is [x, y, vx, vy] of the top left, measurement is [x, y], control is a [dx, dy] shift
+        self.kf = cv2.KalmanFilter(4, 2, 2)
+        self.kf.transitionMatrix = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], np.float32)
+        self.kf.measurementMatrix = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], np.float32)
+        self.kf.controlMatrix = np.array([[1, 0], [0, 1], [0, 0], [0, 0]], np.float32)
+        self.kf.processNoiseCov = np.diag([1.0, 1.0, 4.0, 4.0]).astype(np.float32)
+        self.kf.measurementNoiseCov = np.eye(2, dtype=np.float32)
+        self.kf.errorCovPost = np.diag([1.0, 1.0, 16.0, 16.0]).astype(np.float32)
+        self.kf.statePost = np.array([[left], [top], [0], [0]], np.float32)
+
+    @property
+    def valid(self) -> bool:
+        return self.template.shape[0] > 0 and self.template.shape[1] > 0
+
+    def update(self, gray: np.ndarray, control: tuple[float, float]) -> MachLearnMatch | None:
+        """ Predicts the position of the match and verifies it in the image.
+        @param gray: The grayscale image.
+        @param control: The known movement (dx, dy) in pixels since the last frame.
+        @return: The match at the new position, or None if not found.
+        """
+        pred = self.kf.predict(np.array([[control[0]], [control[1]]], np.float32))
+        px, py = float(pred[0, 0]), float(pred[1, 0])
+
+        # Search area grows with the velocity and the movement, as those are less certain
+        vx, vy = float(pred[2, 0]), float(pred[3, 0])
+        margin_x = int(MIN_MARGIN + abs(vx) + abs(control[0]) * 0.5)
+        margin_y = int(MIN_MARGIN + abs(vy) + abs(control[1]) * 0.5)
+        img_h, img_w = gray.shape[:2]
+        x1 = max(0, int(px) - margin_x)
+        y1 = max(0, int(py) - margin_y)
+        x2 = min(img_w, int(px) + self.width + margin_x)
+        y2 = min(img_h, int(py) + self.height + margin_y)
+        if x2 - x1 < self.width or y2 - y1 < self.height:
+            return None
+
+        res = cv2.matchTemplate(gray[y1:y2, x1:x2], self.template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if max_val < MATCH_THRESH:
+            return None
+
+        left, top = x1 + max_loc[0], y1 + max_loc[1]
+        self.score = max_val
+        self.patch = gray[top:top + self.height, left:left + self.width]
+        self.kf.correct(np.array([[left], [top]], np.float32))
+        quad = Quad.from_rect([left, top, left + self.width, top + self.height])
+        return MachLearnMatch(class_name=self.class_name, match_pct=self.match_pct, bounding_quad=quad)
+
+
+class MLTracker:
+    """ Tracks the matches of a MachLearn model between frames, running the model only when needed. """
+
+    def __init__(self, predict_func: Callable[[np.ndarray], list[MachLearnMatch] | None],
+                 required: list[set[str]], full_every: int = 10):
+        """
+        @param predict_func: The full model prediction of an image, i.e. MachLearn.model_predict().
+        @param required: The class groups that must each have a match for the matches to be tracked, i.e.
+         [{'compass'}, {'navpoint', 'navpoint-behind'}].
+        @param full_every: Run the full prediction at least every N frames. 0 or 1 to run it on every frame.
+        """
+        self.predict_func = predict_func
+        self.required = required
+        self.full_every = full_every
+        self.full_count = 0  # Number of full predictions
+        self.tracked_count = 0  # Number of frames served by tracking
+        self._tracks: list[_Track] = []
+        self._shape = None
+        self._frames_since_full = 0
+        self._control = [0.0, 0.0]
+        # The other classes a class can change to in place, i.e. 'navpoint' -> {'navpoint-behind'}
+        self._alternatives = {name: group - {name} for group in required if len(group) > 1 for name in group}
+        self._class_images: dict[str, np.ndarray] = {}  # The last image of each class from a full prediction
+
+    def reset(self):
+        """ Drops the tracks, so the next frame runs the full prediction (i.e. after a roll). """
+        self._tracks = []
+
+    def add_motion(self, dx: float, dy: float):
+        """ Adds a known movement of the matches in pixels (i.e. from a commanded pitch or yaw), used to predict
+        the position on the next frame.
+        """
+        self._control[0] = self._control[0] + dx
+        self._control[1] = self._control[1] + dy
+
+    def model_predict(self, image: np.ndarray) -> list[MachLearnMatch] | None:
+        """ Gets the matches in the image, by tracking from the last frame or else the full model prediction.
+        @param image: The image (BGR).
+        @return: A list of learning matches, as from the full model prediction.
+        """
+        control = tuple(self._control)
+        self._control = [0.0, 0.0]
+
+        if (self.full_every > 1 and self._tracks and self._frames_since_full < self.full_every - 1
+                and image.shape == self._shape):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            matches = []
+            for track in self._tracks:
+                match = track.update(gray, control)
+                if match is None or self._class_changed(track):
+                    break
+                matches.append(match)
+            else:
+                self._frames_since_full = self._frames_since_full + 1
+                self.tracked_count = self.tracked_count + 1
+                return matches
+
+        return self._full_predict(image)
+
+    def _full_predict(self, image: np.ndarray) -> list[MachLearnMatch] | None:
+        """ Runs the full model prediction and starts tracking the matches. """
+        matches = self.predict_func(image)
+        self.full_count = self.full_count + 1
+        self._frames_since_full = 0
+        self._shape = image.shape
+        self._tracks = []
+
+        if self.full_every > 1 and matches and self._has_required(matches):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            tracks = [_Track(m, gray) for m in matches]
+            if all(t.valid for t in tracks):
+                self._tracks = tracks
+                for track in tracks:
+                    self._class_images[track.class_name] = track.template
+            else:
+                logger.debug("MLTracker: match outside of image, not tracking.")
+        return matches
+
+    def _class_changed(self, track: _Track) -> bool:
+        """ True if the class of a tracked match may have changed (i.e. the navpoint has gone behind), so the model
+        must be run to get the class.
+        """
+        alternatives = self._alternatives.get(track.class_name)
+        if not alternatives:
+            return False
+        if track.score < CLASS_THRESH:
+            return True
+        for name in alternatives:
+            image = self._class_images.get(name)
+            if image is None:
+                continue
+            image = cv2.resize(image, (track.width, track.height), interpolation=cv2.INTER_AREA)
+            score = float(cv2.matchTemplate(track.patch, image, cv2.TM_CCOEFF_NORMED)[0, 0])
+            if score >= track.score:
+                return True
+        return False
+
+    def _has_required(self, matches: list[MachLearnMatch]) -> bool:
+        names = {m.class_name for m in matches}
+        return all(names & group for group in self.required)
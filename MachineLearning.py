@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import ast
 import enum
+import os
 from dataclasses import dataclass
 import cv2
-from ultralytics import YOLO
+import numpy as np
+from EDlogger import logger
 from Screen_Regions import Quad
 
 """
@@ -13,9 +16,27 @@ Description:
   Class for Machine Learning using Yolo26.
   Ref: https://docs.ultralytics.com/
 
+  The models are run by a backend:
+    'torch' - The ultralytics YOLO model with PyTorch (the default, and the fallback for the other backends).
+    'onnx' - ONNX Runtime on the CPU.
+    'openvino' - OpenVINO on the CPU.
+  The ONNX and OpenVINO backends use an ONNX export of the model with a fixed input size, exported once by
+  ultralytics and cached next to the weights (i.e. 'weights/best.onnx'). It is exported again if the weights are
+  newer than the export. These backends are optional and need 'pip install onnx onnxruntime' or
+  'pip install onnx openvino'.
+
 Author: Stumpii
 """
 
+COMPASS_WEIGHTS = "Yolo26/compass-model/weights/best.pt"
+TARGET_WEIGHTS = "Yolo26/target-model/weights/best.pt"
+
+ML_BACKENDS = ('torch', 'onnx', 'openvino')
+
+CONF_THRESH = 0.25  # Min confidence of a match, as the ultralytics predict() default
+IOU_THRESH = 0.7  # NMS IOU threshold, as the ultralytics predict() default
+WARM_UP_IMAGE_SIZE = 128  # Size in pixels of the blank image of the warm up, about a compass/target region
+
 
 @dataclass
 class MachLearnMatch:
@@ -30,13 +51,257 @@ class ModelType(enum.Enum):
     Target = 1
 
 
+class TorchBackend:
+    """ Runs a model with ultralytics and PyTorch. """
+    name = 'torch'
+
+    def __init__(self, weights: str):
+        from ultralytics import YOLO  # Heavy import, only done when this backend is used
+
+        self.model = YOLO(weights)
+
+    def predict(self, image) -> list[tuple[str, float, list[float]]]:
+        """ Performs a prediction of an image.
+        @param image: The image (BGR).
+        @return: A list of (class name, confidence, [x1, y1, x2, y2]) in image pixels.
+        """
+        detections = []
+        results = self.model.predict(image, verbose=False)  # Predict on an image
+        if results and len(results) == 1:
+            r = results[0]
+            for b in r.boxes:
+                clsid = int(b.cls.item())
+                detections.append((r.names[clsid], b.conf.item(), b.xyxy.tolist()[0]))
+        return detections
+
+
+class OnnxBackend:
+    """ Runs an ONNX export of a model with ONNX Runtime on the CPU. """
+    name = 'onnx'
+
+    def __init__(self, weights: str, imgsz: int = 640, threads: int = 0):
+        """
+        @param weights: The path of the PyTorch weights. The model is exported to ONNX next to it if needed.
+        @param imgsz: The fixed input size of the exported model.
+        @param threads: The number of CPU threads to use, 0 for the runtime default.
+        """
+        import onnxruntime as ort
+
+        self.onnx_path = export_onnx(weights, imgsz)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.onnx_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = _input_size(self.session.get_inputs()[0].shape, imgsz)
+        self.names = _parse_names(self.session.get_modelmeta().custom_metadata_map.get('names'))
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def predict(self, image) -> list[tuple[str, float, list[float]]]:
+        """ Performs a prediction of an image.
+        @param image: The image (BGR).
+        @return: A list of (class name, confidence, [x1, y1, x2, y2]) in image pixels.
+        """
+        blob, ratio, pad = letterbox(image, self.imgsz)
+        output = self._infer(blob)
+        return postprocess(output, ratio, pad, image.shape, self.names)
+
+
+class OpenVinoBackend(OnnxBackend):
+    """ Runs an ONNX export of a model with OpenVINO on the CPU. """
+    name = 'openvino'
+
+    def __init__(self, weights: str, imgsz: int = 640, threads: int = 0):
+        import openvino as ov
+
+        self.onnx_path = export_onnx(weights, imgsz)
+        core = ov.Core()
+        model = core.read_model(self.onnx_path)
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads > 0:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.compiled = core.compile_model(model, 'CPU', config)
+        self.imgsz = _input_size(list(model.inputs[0].get_partial_shape().to_shape()), imgsz)
+        # The class names are in the ONNX metadata, which OpenVINO does not read
+        self.names = _parse_names(_read_onnx_names(self.onnx_path))
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        return self.compiled([blob])[0]
+
+
+def export_onnx(weights: str, imgsz: int = 640) -> str:
+    """ Exports the PyTorch weights to ONNX next to the weights, unless already exported.
+    @param weights: The path of the PyTorch weights, i.e. 'weights/best.pt'.
+    @param imgsz: The fixed input size of the export.
+    @return: The path of the ONNX file.
+    """
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    if os.path.isfile(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(weights):
+        return onnx_path
+
+    from ultralytics import YOLO
+
+    logger.info(f"Exporting {weights} to ONNX.")
+    path = YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+    if os.path.abspath(path) != os.path.abspath(onnx_path):
+        os.replace(path, onnx_path)
+    return onnx_path
+
+
+def _input_size(shape, default: int) -> int:
+    """ Gets the input size from an NCHW input shape, which may be dynamic (not an int). """
+    if len(shape) == 4 and isinstance(shape[2], int) and shape[2] > 0:
+        return shape[2]
+    return default
+
+
+def _read_onnx_names(onnx_path: str) -> str | None:
+    """ Gets the class names from the metadata of an ONNX file exported by ultralytics. """
+    try:
+        import onnx
+
+        model = onnx.load(onnx_path, load_external_data=False)
+        for prop in model.metadata_props:
+            if prop.key == 'names':
+                return prop.value
+    except ImportError:
+        logger.warning("The onnx package is not installed, unable to read the class names.")
+    return None
+
+
+def _parse_names(names: str | None) -> dict[int, str]:
+    """ Parses the class names stored by ultralytics in the model metadata, i.e. "{0: 'compass', 1: 'navpoint'}". """
+    if not names:
+        return {}
+    try:
+        return {int(k): str(v) for k, v in ast.literal_eval(names).items()}
+    except (ValueError, SyntaxError):
+        logger.warning(f"Unable to parse model class names: {names}")
+        return {}
+
+
+def letterbox(image, imgsz: int) -> tuple[np.ndarray, float, tuple[float, float]]:
+    """ Resizes an image to fit a square model input, keeping the aspect ratio and padding with grey, as
+    ultralytics does.
+    @param image: The image (BGR).
+    @param imgsz: The model input size.
+    @return: The NCHW RGB float32 blob, the resize ratio and the (x, y) padding.
+    """
+    h, w = image.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+    blob = cv2.dnn.blobFromImage(image, scalefactor=1.0 / 255.0, swapRB=True)
+    return blob, ratio, (pad_x, pad_y)
+
+
+def postprocess(output: np.ndarray, ratio: float, pad: tuple[float, float], shape,
+                names: dict[int, str]) -> list[tuple[str, float, list[float]]]:
+    """ Converts the raw model output to detections in image pixels.
+    Handles both the end-to-end (NMS free) output of Yolo26 [1, N, 6] as (x1, y1, x2, y2, conf, class) and the
+    older [1, 4 + classes, N] output as (cx, cy, w, h, class scores...), which needs NMS.
+    @param output: The model output.
+    @param ratio: The letterbox resize ratio.
+    @param pad: The letterbox (x, y) padding.
+    @param shape: The shape of the original image.
+    @param names: The class names by class id.
+    @return: A list of (class name, confidence, [x1, y1, x2, y2]).
+    """
+    out = output[0]
+    if out.ndim == 2 and out.shape[1] == 6:
+        # End-to-end output
+        out = out[out[:, 4] >= CONF_THRESH]
+        boxes = out[:, :4].copy()
+        confs = out[:, 4]
+        classes = out[:, 5].astype(int)
+    else:
+        # Raw output, transpose to [N, 4 + classes]
+        out = out.T
+        scores = out[:, 4:]
+        classes = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), classes]
+        keep = confs >= CONF_THRESH
+        out, confs, classes = out[keep], confs[keep], classes[keep]
+        boxes = np.empty((len(out), 4), dtype=np.float32)
+        boxes[:, 0] = out[:, 0] - out[:, 2] / 2
+        boxes[:, 1] = out[:, 1] - out[:, 3] / 2
+        boxes[:, 2] = out[:, 0] + out[:, 2] / 2
+        boxes[:, 3] = out[:, 1] + out[:, 3] / 2
+        if len(boxes) > 0:
+            # Class aware NMS, by offsetting the boxes of each class
+            offset = boxes + (classes[:, None] * 4096.0)
+            xywh = np.column_stack((offset[:, :2], offset[:, 2:] - offset[:, :2]))
+            idx = np.array(cv2.dnn.NMSBoxes(xywh.tolist(), confs.tolist(), CONF_THRESH, IOU_THRESH),
+                           dtype=int).flatten()
+            boxes, confs, classes = boxes[idx], confs[idx], classes[idx]
+
+    # Undo the letterbox
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / ratio).clip(0, shape[1])
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / ratio).clip(0, shape[0])
+
+    return [(names.get(int(c), str(int(c))), float(conf), box.tolist()) for box, conf, c in
+            zip(boxes, confs, classes)]
+
+
+def create_backend(backend: str, weights: str, imgsz: int = 640, threads: int = 0):
+    """ Creates a model backend, falling back to PyTorch if the backend is not available.
+    @param backend: The backend name, one of ML_BACKENDS.
+    @param weights: The path of the PyTorch weights.
+    @param imgsz: The fixed input size for the ONNX backends.
+    @param threads: The number of CPU threads for the ONNX backends, 0 for the default.
+    @return: The backend.
+    """
+    try:
+        if backend == 'onnx':
+            return OnnxBackend(weights, imgsz, threads)
+        elif backend == 'openvino':
+            return OpenVinoBackend(weights, imgsz, threads)
+        elif backend != 'torch':
+            logger.warning(f"Unknown ML backend '{backend}', using torch.")
+    except ImportError as e:
+        logger.warning(f"ML backend '{backend}' is not installed ({e}), using torch.")
+    except Exception as e:
+        logger.warning(f"ML backend '{backend}' failed to load {weights} ({e}), using torch.")
+
+    return TorchBackend(weights)
+
+
 class MachLearn:
-    def __init__(self, ed_ap, cb):
+    def __init__(self, ed_ap, cb, backend: str | None = None):
+        """
+        @param ed_ap: The AP, used for the backend config. May be None.
+        @param cb: The callback.
+        @param backend: The backend, else the 'MLBackend' config setting (or 'torch' if there is no AP).
+        """
         self.ap = ed_ap
         self.ap_ckb = cb
 
-        self.compass_ml_model = YOLO("Yolo26/compass-model/weights/best.pt")
-        self.target_ml_model = YOLO("Yolo26/target-model/weights/best.pt")
+        config = ed_ap.config if ed_ap is not None else {}
+        if backend is None:
+            backend = config.get('MLBackend', 'torch')
+        threads = config.get('MLThreads', 0)
+
+        self.compass_ml_model = create_backend(backend, COMPASS_WEIGHTS, threads=threads)
+        self.target_ml_model = create_backend(backend, TARGET_WEIGHTS, threads=threads)
+        logger.info(f"Machine learning backend: {self.compass_ml_model.name}")
+
+    def warm_up(self):
+        """ Runs each model once on a blank image, so the first real prediction does not pay for the backend's
+        first run setup (i.e. allocating its buffers, selecting its kernels). """
+        image = np.zeros((WARM_UP_IMAGE_SIZE, WARM_UP_IMAGE_SIZE, 3), np.uint8)
+        self.compass_ml_model.predict(image)
+        self.target_ml_model.predict(image)
 
     def model_predict(self, model: ModelType, image, class_name: str) -> list[MachLearnMatch] | None:
         """ Performs a prediction of an image using the relevant model and returns the results.
@@ -47,31 +312,23 @@ class MachLearn:
          for Target Model: 'target', 'target-occluded'.
         @return: A list of learning matches.
         """
-        results = None
+        detections = None
         matches: list[MachLearnMatch] = []
         # Do prediction with ML
         if model is ModelType.Compass:
-            results = self.compass_ml_model.predict(image, verbose=False)  # Predict on an image
+            detections = self.compass_ml_model.predict(image)  # Predict on an image
         elif model is model.Target:
-            results = self.target_ml_model.predict(image, verbose=False)  # Predict on an image
+            detections = self.target_ml_model.predict(image)  # Predict on an image
 
-        if results and len(results) == 1:
-            r = results[0]
-            if len(r.boxes) > 0:
-                for b in r.boxes:
-                    clsid = int(b.cls.item())
-                    name = r.names[clsid]  # Class name
-                    # Is name wanted
-                    if class_name == '' or name == class_name:
-                        confidence = b.conf.item()  # Confidence %
-                        rect_tmp = b.xyxy.tolist()  # Match as a rect
-                        rect_tmp = rect_tmp[0]
-                        res_quad = Quad.from_rect(rect_tmp)
-
-                        # Add item
-                        match = MachLearnMatch(class_name=name, match_pct=confidence, bounding_quad=res_quad)
-                        matches.append(match)
-                return matches
-            else:
-                return None
+        if detections:
+            for name, confidence, rect_tmp in detections:
+                # Is name wanted
+                if class_name == '' or name == class_name:
+                    res_quad = Quad.from_rect(rect_tmp)
 
+                    # Add item
+                    match = MachLearnMatch(class_name=name, match_pct=confidence, bounding_quad=res_quad)
+                    matches.append(match)
+            return matches
+        else:
+            return None
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from EDlogger import logger
+
+"""
+File:ModelWarmUp.py
+
+Description:
+  Loads the ML models (compass and target) and the OCR on a background thread at startup, and runs each once on a
+  dummy image, so the first real detection (i.e. in an FSD alignment or a SC disengage check) does not stall for
+  the seconds it takes to load them. Started by the GUI once it is shown, so it does not delay the GUI.
+  The AP's 'mach_learn' and 'ocr' properties are locked, so a detection needing a model before the warm up is done
+  waits for it to be loaded instead of loading it a second time.
+
+  The state of each model is published as 'pending', 'loading', 'ready' or 'failed'. A model that fails to load
+  is loaded again on first use, as without the warm up, so the error shows where the model is needed.
+
+  Usage:
+    warm_up = ModelWarmUp(ed_ap)
+    warm_up.start()  # Returns at once. Does nothing if 'WarmUpModels' is off in the config.
+    if warm_up.ready('ocr'): ...
+    warm_up.wait('mach_learn', timeout=5.0)
+"""
+
+# The models, in the order they are loaded. The compass/target models are needed first (FSD alignment).
+WARM_UP_MODELS = {'mach_learn': 'ML models', 'ocr': 'OCR'}
+
+
+class ModelWarmUp:
+    """ Loads and warms up the AP's models on a background thread. """
+
+    def __init__(self, ed_ap):
+        """
+        @param ed_ap: The AP, with the 'mach_learn' and 'ocr' properties, the config and the callback.
+        """
+        self.ap = ed_ap
+        self.state: dict[str, str] = {name: 'pending' for name in WARM_UP_MODELS}
+        self.load_time: dict[str, float] = {}  # Time in secs to load and warm up each model
+        self._done = {name: threading.Event() for name in WARM_UP_MODELS}
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> bool:
+        """ Starts the warm up thread, unless 'WarmUpModels' is off in the config or it is already started.
+        @return: True if started.
+        """
+        if self._thread is not None or not self.ap.config.get('WarmUpModels', True):
+            return False
+        self._thread = threading.Thread(target=self._run, name="ModelWarmUp", daemon=True)
+        self._thread.start()
+        return True
+
+    def ready(self, name: str) -> bool:
+        """ True if the model is loaded and warmed up.
+        @param name: 'mach_learn' or 'ocr'.
+        """
+        return self.state[name] == 'ready'
+
+    def wait(self, name: str, timeout: float | None = None) -> bool:
+        """ Waits for the warm up of a model to finish.
+        @param name: 'mach_learn' or 'ocr'.
+        @param timeout: The max time to wait in secs, or None to wait until finished.
+        @return: True if the model is ready, False if it failed, is not done in time, or the warm up is not started.
+        """
+        if self._thread is None:
+            return False
+        self._done[name].wait(timeout)
+        return self.ready(name)
+
+    def _run(self):
+        """ The warm up thread. Loads and warms up each model in turn. """
+        for name, label in WARM_UP_MODELS.items():
+            if self.ap.terminate:
+                self._done[name].set()  # Do not leave a wait() hanging on a model that will not be loaded
+                continue
+            self.state[name] = 'loading'
+            start = time.perf_counter()
+            try:
+                model = getattr(self.ap, name)  # Loads the model through the AP's property
+                if model.warm_up() is False:
+                    raise RuntimeError("dummy inference failed")
+                self.state[name] = 'ready'
+                self.load_time[name] = time.perf_counter() - start
+                logger.info(f"{label} ready in {self.load_time[name]:.1f}s.")
+                self.ap.ap_ckb('log', f"{label} loaded in {self.load_time[name]:.1f}s.")
+            except Exception as e:
+                self.state[name] = 'failed'
+                logger.warning(f"{label} warm up failed: {e}")
+            finally:
+                self._done[name].set()
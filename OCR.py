@@ -1,14 +1,30 @@
 from __future__ import annotations
+import hashlib
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
+
 import cv2
 import numpy as np
 from cv2.typing import MatLike
-from paddleocr import PaddleOCR
 from strsimpy import SorensenDice
 from strsimpy.jaro_winkler import JaroWinkler
 from strsimpy.normalized_levenshtein import NormalizedLevenshtein
 from EDlogger import logger
-from Screen_Regions import Quad
+from DebugSink import debug_sink
+from OCRWorker import OCRWorkerPool, create_paddleocr, create_text_recognition, recognize_lines
+from Screen import to_bgr
+from Screen_Regions import Quad, QuadArray
+
+try:
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Levenshtein as rf_levenshtein
+except ImportError:
+    rf_process = None
+    rf_levenshtein = None
 
 """
 File:OCR.py    
@@ -16,91 +32,356 @@ File:OCR.py
 Description:
   Class for OCR processing using PaddleOCR. 
 
+  The OCR results are cached by OCRCache, keyed by a hash of a downsampled and quantized copy of the image, so
+  repeated reads of an unchanged panel or menu (i.e. wait_for_text() polling) skip the OCR model.
+
+  With 'OCRWorkers' set in the config, PaddleOCR runs in worker processes (see OCRWorker.py) instead of in the
+  AP process, so a crash of PaddleOCR does not take down the AP, and a hung OCR times out after 'OCRTimeout'.
+  If the pool gives up on all its workers (i.e. they keep crashing), the OCR falls back to the AP process.
+
+  Single line images (a highlighted list item, the SC disengage text) can skip the text detection model. The lines
+  are scaled to the height of the text recognition model and recognized in one batch by image_lines_ocr().
+  image_line_ocr() uses this path when 'OCRLineMode' is set in the config, otherwise the full OCR.
+
+  wait_for_text() only OCRs the region once it has changed and then settled (RegionChangeGate), so no OCR is done
+  on the frames of a screen's opening animation or while the region is unchanged, and checks all the texts against
+  the one OCR result.
+
+  The string similarity of OCR text uses rapidfuzz's C++ Levenshtein if installed, else strsimpy. The strings are
+  normalized by one translate table, cached per string, and text_similarities() scores one text against a whole
+  list of candidates (i.e. the rows of a list, or the stations of a route) in one call.
+
+  read_list() splits a list panel into its rows and OCRs them all in one call by recognize_batch(), so an item can
+  be found and selected without an OCR and key press round trip per row.
+
 Author: Stumpii
 """
 
 
+OCR_CACHE_THUMB_SCALE = 0.5  # Scale of the image hashed for the cache key
+OCR_CACHE_QUANT_SHIFT = 3  # Low bits dropped from each pixel before hashing, so sensor/render noise still matches
+OCR_LINE_HEIGHT = 48  # Input height in pixels of the PP-OCRv5 text recognition models
+OCR_LINE_MAX_WIDTH = 3200  # Max width of a line image, the recognition models limit
+WAIT_FOR_TEXT_POLL = 0.1  # Time in secs between the captures of the region in wait_for_text()
+OCR_WARM_UP_TIMEOUT = 120.0  # Max time in secs for the workers to load their models at startup (i.e. download)
+
+# Characters ignored by the string similarity: the list repr of OCR results (i.e. "['NAV', 'BEACON']"), the '<>'
+# around some names in game and the characters PaddleOCR often misses or adds (spaces and dashes).
+SIMILARITY_IGNORED = str.maketrans('', '', "[]'\",<>-— ")
+
+
+@lru_cache(maxsize=4096)
+def _normalize(text: str) -> str:
+    return text.translate(SIMILARITY_IGNORED)
+
+
+def normalize_text(text: str | list[str]) -> str:
+    """ Normalizes a text or an OCR result (list of strings) for the string similarity.
+    @param text: The text, the list repr of an OCR result, or the OCR result.
+    @return: The text with the ignored characters removed.
+    """
+    if not isinstance(text, str):
+        text = ''.join(text)
+    return _normalize(text)
+
+
+_levenshtein = NormalizedLevenshtein()
+
+
+def text_similarity(s1: str | list[str], s2: str | list[str]) -> float:
+    """ The normalized Levenshtein similarity of two texts, after normalize_text().
+    @return: The similarity from 0.0 (no match) to 1.0 (identical).
+    """
+    n1, n2 = normalize_text(s1), normalize_text(s2)
+    if rf_levenshtein is not None:
+        return rf_levenshtein.normalized_similarity(n1, n2)
+    return _levenshtein.similarity(n1, n2)
+
+
+def text_similarities(text: str | list[str], candidates: list) -> np.ndarray:
+    """ The similarity of a text to each of the candidates, as text_similarity(), in one call.
+    @param text: The text or OCR result.
+    @param candidates: The candidate texts or OCR results.
+    @return: The similarity to each candidate.
+    """
+    query = normalize_text(text)
+    choices = [normalize_text(c) for c in candidates]
+    if len(choices) == 0:
+        return np.zeros(0, dtype=np.float32)
+    if rf_process is not None:
+        return rf_process.cdist([query], choices, scorer=rf_levenshtein.normalized_similarity,
+                                dtype=np.float32)[0]
+    return np.array([_levenshtein.similarity(query, c) for c in choices], dtype=np.float32)
+
+
+def normalize_line(image, height: int = OCR_LINE_HEIGHT):
+    """ Scales a single line image to the height of the text recognition model, keeping the aspect ratio.
+    @param image: The line image (BGR).
+    @param height: The height to scale to.
+    @return: The scaled image.
+    """
+    h, w = image.shape[:2]
+    width = min(OCR_LINE_MAX_WIDTH, max(1, round(w * height / h)))
+    interpolation = cv2.INTER_AREA if h > height else cv2.INTER_CUBIC
+    return cv2.resize(image, (width, height), interpolation=interpolation)
+
+
+@dataclass
+class ListRow:
+    """ A row of a list read by OCR.read_list(). """
+    text: list[str]  # The OCR text, in the format of image_simple_ocr()
+    quad: Quad  # The position of the row, in percent of the list image
+    selected: bool  # True if the row is the highlighted (selected) row
+
+
+class OCRCache:
+    """ A LRU cache of OCR results keyed by the image. The key is a hash of a half size copy of the image with the
+    low bits of each pixel dropped, so it costs a fraction of a millisecond against the hundreds of the OCR.
+    Entries are evicted when the cache is full (least recently used first) or when older than max_age.
+    """
+
+    def __init__(self, max_size: int = 64, max_age: float = 60.0):
+        """
+        @param max_size: The max number of results. 0 to disable the cache.
+        @param max_age: The max age of a result in seconds.
+        """
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def image_key(image) -> tuple:
+        """ The cache key of an image, from its shape and a hash of its downsampled, quantized pixels. """
+        h, w = image.shape[:2]
+        thumb = cv2.resize(image, (max(1, int(w * OCR_CACHE_THUMB_SCALE)), max(1, int(h * OCR_CACHE_THUMB_SCALE))),
+                           interpolation=cv2.INTER_AREA)
+        thumb = np.right_shift(thumb, OCR_CACHE_QUANT_SHIFT)
+        return image.shape, hashlib.blake2b(np.ascontiguousarray(thumb).data, digest_size=16).digest()
+
+    def get(self, key: tuple):
+        """ Gets a result, or None if not cached or expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.max_age:
+                self._entries.move_to_end(key)
+                self.hits = self.hits + 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, key: tuple, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.0
+        return f"OCR cache: {len(self)} results, {self.hits} hits, {self.misses} misses ({rate:.1%} hit rate)"
+
+
+class RegionChangeGate:
+    """ Decides when a polled region is worth an OCR. The region is compared with the previous capture by the mean
+    difference of small gray copies, which costs a fraction of a millisecond. The gate opens once the region has
+    been unchanged for settle_frames captures (the first time, or after a change since the last OCR), so the frames of
+    a transition animation are skipped. It also opens if there has been no OCR for max_wait, so a region that never
+    settles (i.e. an animated background) is still read.
+    """
+
+    def __init__(self, settle_frames: int = 2, threshold: float = 2.0, max_wait: float = 2.0):
+        """
+        @param settle_frames: The number of unchanged captures before the OCR.
+        @param threshold: The mean difference (0-255) of the gray pixels above which the region has changed.
+        @param max_wait: The max time in secs between OCRs.
+        """
+        self.settle_frames = settle_frames
+        self.threshold = threshold
+        self.max_wait = max_wait
+        self.skipped = 0  # Number of captures not OCRed
+        self._last = None  # Small gray copy of the last capture
+        self._last_ocr = None  # Small gray copy of the last capture OCRed
+        self._last_ocr_time = time.monotonic()
+        self._settled = 0
+
+    def _changed(self, a, b) -> bool:
+        return a is None or a.shape != b.shape or cv2.absdiff(a, b).mean() > self.threshold
+
+    def update(self, image) -> bool:
+        """ Adds a capture of the region.
+        @param image: The capture of the region.
+        @return: True if the capture should be OCRed.
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(to_bgr(image), cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape[:2]
+        thumb = cv2.resize(gray, (max(1, w // 4), max(1, h // 4)), interpolation=cv2.INTER_AREA)
+
+        self._settled = 0 if self._changed(self._last, thumb) else self._settled + 1
+        self._last = thumb
+
+        now = time.monotonic()
+        settled = self._settled >= self.settle_frames and self._changed(self._last_ocr, thumb)
+        if settled or now - self._last_ocr_time > self.max_wait:
+            self._last_ocr = thumb
+            self._last_ocr_time = now
+            return True
+
+        self.skipped = self.skipped + 1
+        return False
+
+
 class OCR:
     def __init__(self, ed_ap, screen):
         """
         Initialise the OCR class.
-        @param ed_ap:
+        @param ed_ap: The AP, or None to run without it (i.e. replay) with the default settings.
         @param screen:
         """
         self.ap = ed_ap
         self.screen = screen
-        if self.ap.config['OCRMobile']:
-            self.paddleocr = PaddleOCR(
-                use_doc_orientation_classify=False,
-                use_doc_unwarping=False,
-                use_textline_orientation=False,
-                text_detection_model_name="PP-OCRv5_mobile_det",
-                text_recognition_model_name="en_PP-OCRv5_mobile_rec")  # text detection + text recognition
+        config = ed_ap.config if ed_ap is not None else {}
+        self.timeout = config.get('OCRTimeout', 10.0)
+        self.line_mode = config.get('OCRLineMode', False)
+        self.settle_frames = config.get('OCRSettleFrames', 2)
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self.paddleocr = None
+        self._text_rec = None  # Created on the first in-process line OCR
+        if config.get('OCRWorkers', 0) > 0:
+            self.pool = OCRWorkerPool(config['OCRWorkers'], config.get('OCRMobile', False))
         else:
-            self.paddleocr = PaddleOCR(
-                use_doc_orientation_classify=False,
-                use_doc_unwarping=False,
-                use_textline_orientation=False)  # text detection + text recognition
+            self.paddleocr = self._create_paddleocr()
+        self.cache = OCRCache(config.get('OCRCacheSize', 64), config.get('OCRCacheMaxAge', 60.0))
 
         # Class for text similarity metrics
         self.jarowinkler = JaroWinkler()
         self.sorensendice = SorensenDice()
         self.normalized_levenshtein = NormalizedLevenshtein()
 
+    @property
+    def debug_ocr(self) -> bool:
+        """ True to write all OCR data to the output folder. Always False when running without the AP (i.e. replay).
+        """
+        return self.ap is not None and self.ap.debug_ocr
+
+    def _create_paddleocr(self):
+        """ Creates the in-process PaddleOCR instance, using the mobile models if set in the config. """
+        return create_paddleocr(self.ap is not None and self.ap.config['OCRMobile'])
+
     def _reinit_paddleocr(self):
         """ Reinitialize PaddleOCR after a failure. PaddleOCR's C++ layer can throw
         an 'Unknown exception' which corrupts internal state. If the same instance is
         reused, the next call will cause a hard process crash with no Python traceback.
-        Creating a fresh instance prevents this. """
+        Creating a fresh instance prevents this. The worker pool restarts its own workers. """
+        if self.pool is not None:
+            return
         try:
             logger.warning("Reinitializing PaddleOCR after failure.")
-            if self.ap.config['OCRMobile']:
-                self.paddleocr = PaddleOCR(
-                    use_doc_orientation_classify=False,
-                    use_doc_unwarping=False,
-                    use_textline_orientation=False,
-                    text_detection_model_name="PP-OCRv5_mobile_det",
-                    text_recognition_model_name="en_PP-OCRv5_mobile_rec")  # text detection + text recognition
-            else:
-                self.paddleocr = PaddleOCR(
-                    use_doc_orientation_classify=False,
-                    use_doc_unwarping=False,
-                    use_textline_orientation=False)  # text detection + text recognition
-
+            self.paddleocr = self._create_paddleocr()
         except Exception as e:
             logger.error(f"Failed to reinitialize PaddleOCR: {e}")
 
-    def string_similarity(self, s1: str, s2: str) -> float:
+    def _get_pool(self) -> OCRWorkerPool | None:
+        """ The worker pool, or None to run the OCR in the AP process. If the pool has given up on all its workers,
+        falls back to the in-process OCR, so the OCR keeps working (without the crash protection). """
+        pool = self.pool
+        if pool is None or pool.workers > 0:
+            return pool
+        with self._pool_lock:
+            if self.pool is pool:
+                logger.error("No OCR worker processes left, running the OCR in the AP process.")
+                self.pool = None
+                pool.shutdown()
+                try:
+                    self.paddleocr = self._create_paddleocr()
+                except Exception as e:
+                    logger.error(f"Failed to create PaddleOCR: {e}")
+        return None
+
+    def _predict(self, image):
+        """ Runs PaddleOCR on the image, in a worker process if the pool is in use.
+        @param image: The image (BGR).
+        @return: The PaddleOCR results, one per page with the 'rec_texts' key, or None on failure.
+        """
+        pool = self._get_pool()
+        if pool is not None:
+            return pool.ocr(image, self.timeout)
+        return self.paddleocr.predict(image)
+
+    def _recognize(self, lines: list) -> list[tuple[str, float]] | None:
+        """ Runs the text recognition model on line images, in a worker process if the pool is in use.
+        @param lines: The line images (BGR), of the same height.
+        @return: The text and score of each line, or None on failure.
+        """
+        pool = self._get_pool()
+        if pool is not None:
+            return pool.recognize(lines, self.timeout)
+        if self._text_rec is None:
+            self._text_rec = create_text_recognition(self.ap is not None and self.ap.config['OCRMobile'])
+        return recognize_lines(self._text_rec, lines)
+
+    def shutdown(self):
+        """ Stops the OCR worker processes, if any. """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            logger.debug(str(self.cache))
+
+    def warm_up(self) -> bool:
+        """ Runs the OCR once on a small dummy image (and the text recognition if 'OCRLineMode' is set), bypassing
+        the cache, so the models are loaded (in each worker process if the pool is in use) and their first run is
+        done before the first real OCR.
+        @return: True if the OCR ran, False if it failed.
+        """
+        image = np.full((OCR_LINE_HEIGHT, 320, 3), 20, np.uint8)
+        cv2.putText(image, 'WARM UP', (10, 34), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        line = normalize_line(image) if self.line_mode else None
+
+        pool = self._get_pool()
+        if pool is not None:
+            return pool.warm_up(image, line, OCR_WARM_UP_TIMEOUT)
+        ok = self.paddleocr.predict(image) is not None
+        if line is not None:
+            ok = self._recognize([line]) is not None and ok
+        return ok
+
+    def string_similarity(self, s1: str | list[str], s2: str | list[str]) -> float:
         """ Performs a string similarity check and returns the result.
-        @param s1: The first string to compare.
-        @param s2: The second string to compare.
+        @param s1: The first string (or OCR result) to compare.
+        @param s2: The second string (or OCR result) to compare.
         @return: The similarity from 0.0 (no match) to 1.0 (identical).
         """
-        s1_new = s1.replace("['",  "")
-        s1_new = s1_new.replace("']",  "")
-        s1_new = s1_new.replace('["',  "")
-        s1_new = s1_new.replace('"]',  "")
-        s1_new = s1_new.replace("', '",  "")
-        s1_new = s1_new.replace("<",  "")
-        s1_new = s1_new.replace(">",  "")
-        s1_new = s1_new.replace("-",  "")
-        s1_new = s1_new.replace("—",  "")
-        s1_new = s1_new.replace(" ",  "")
-
-        s2_new = s2.replace("['",  "")
-        s2_new = s2_new.replace("']",  "")
-        s2_new = s2_new.replace('["',  "")
-        s2_new = s2_new.replace('"]',  "")
-        s2_new = s2_new.replace("', '",  "")
-        s2_new = s2_new.replace("<",  "")
-        s2_new = s2_new.replace(">",  "")
-        s2_new = s2_new.replace("-",  "")
-        s2_new = s2_new.replace("—",  "")
-        s2_new = s2_new.replace(" ",  "")
-
         # return self.jarowinkler.similarity(s1, s2)
-        return self.normalized_levenshtein.similarity(s1_new, s2_new)
-        # return self.sorensendice.similarity(s1_new, s2_new)
+        return text_similarity(s1, s2)
+        # return self.sorensendice.similarity(s1, s2)
+
+    def string_similarities(self, text: str | list[str], candidates: list) -> np.ndarray:
+        """ Performs a string similarity check of a string (or OCR result) against each of a list of candidates.
+        @param text: The string to compare.
+        @param candidates: The strings (or OCR results) to compare against.
+        @return: The similarity of each candidate from 0.0 (no match) to 1.0 (identical).
+        """
+        return text_similarities(text, candidates)
+
+    def _cache_key(self, kind: str, image) -> tuple | None:
+        """ The OCR cache key of the image, or None if the cache is off. The cache is bypassed when debugging OCR,
+        so every call writes its output. """
+        if self.cache.max_size <= 0 or self.debug_ocr:
+            return None
+        return (kind,) + self.cache.image_key(image)
 
     def image_ocr(self, image, name=''):
         """ Perform OCR with no filtering. Returns the full OCR data and a simplified list of strings.
@@ -117,10 +398,16 @@ class OCR:
         # (e.g., ED in exclusive Fullscreen). Treat that as "no text" instead of crashing.
         if image is None or getattr(image, 'size', 0) == 0:
             return None, None
+
+        key = self._cache_key('full', image)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached[0], list(cached[1])
         try:
             # Remove Alpha channel if it exists
-            image2 = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
-            ocr_data = self.paddleocr.predict(image2)
+            image2 = to_bgr(image)
+            ocr_data = self._predict(image2)
 
             if ocr_data is None:
                 return None, None
@@ -131,7 +418,7 @@ class OCR:
                         return None, None
 
                     # Debug - places all detected data to 'output' folder
-                    if self.ap.debug_ocr:
+                    if self.debug_ocr and hasattr(res, 'save_to_img'):
                         # x = datetime.now().strftime("%Y-%m-%d %H-%M-%S.%f")[:-3]  # Date time with mS.
                         res.save_to_img(f"./ocr_output/{name}")
                         res.save_to_json(f"./ocr_output/{name}")
@@ -141,14 +428,16 @@ class OCR:
 
                 # print(f"image_simple_ocr: {ocr_textlist}")
                 # logger.info(f"image_simple_ocr: {ocr_textlist}")
+                if key is not None:
+                    self.cache.put(key, (ocr_data, list(ocr_textlist)))
                 return ocr_data, ocr_textlist
 
         except Exception as e:
             logger.error(f"OCR failed: {e}")
             # Reinit to avoid hard crash on next call due to corrupted C++ state
             self._reinit_paddleocr()
-            logger.error(f"Image stored to ocr_output folder.")
-            cv2.imwrite(f"./ocr_output/{name}", image)
+            if debug_sink.write('ocr', f"./ocr_output/failed_{name}.png", image):
+                logger.error(f"Image stored to ocr_output folder.")
             return None, None
 
     def image_simple_ocr(self, image, name='') -> list[str] | None:
@@ -166,12 +455,18 @@ class OCR:
         if image is None or getattr(image, 'size', 0) == 0:
             return None
 
+        key = self._cache_key('simple', image)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return list(cached)
+
         # start_time = time.time()
 
         try:
             # Remove Alpha channel if it exists
-            image2 = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
-            ocr_data = self.paddleocr.predict(image2)
+            image2 = to_bgr(image)
+            ocr_data = self._predict(image2)
 
             # elapsed_time = time.time() - start_time
             # print(f"OCR took {elapsed_time} secs")
@@ -185,7 +480,7 @@ class OCR:
                         return None
 
                     # Debug - places all detected data to 'output' folder
-                    if self.ap.debug_ocr:
+                    if self.debug_ocr and hasattr(res, 'save_to_img'):
                         # x = datetime.now().strftime("%Y-%m-%d %H-%M-%S.%f")[:-3]  # Date time with mS.
                         res.save_to_img(f"./ocr_output/{name}")
                         res.save_to_json(f"./ocr_output/{name}")
@@ -197,16 +492,163 @@ class OCR:
 
                 # print(f"image_simple_ocr: {ocr_textlist}")
                 # logger.info(f"image_simple_ocr: {ocr_textlist}")
+                if key is not None:
+                    self.cache.put(key, list(ocr_textlist))
                 return ocr_textlist
 
         except Exception as e:
             logger.error(f"OCR failed: {e}")
             # Reinit to avoid hard crash on next call due to corrupted C++ state
             self._reinit_paddleocr()
-            logger.error(f"Image stored to ocr_output folder.")
-            cv2.imwrite(f"./ocr_output/{name}", image)
+            if debug_sink.write('ocr', f"./ocr_output/failed_{name}.png", image):
+                logger.error(f"Image stored to ocr_output folder.")
+            return None
+
+    def image_lines_ocr(self, images: list, name='') -> list[str] | None:
+        """ Perform recognition only OCR on single line images, with no text detection. Much faster than the full
+        OCR, but each image must hold one line of text with little else around it (i.e. a highlighted list item).
+        All the lines not in the cache are recognized in one call.
+        @param name: A name for the images for logging/debug purposes.
+        @param images: The line images to check.
+        @return: The text of each image ('' for a None/empty image), or None on failure.
+        """
+        texts = [''] * len(images)
+        lines = []
+        todo = []  # (index, cache key) of the lines to recognize
+        for i, image in enumerate(images):
+            if image is None or getattr(image, 'size', 0) == 0:
+                continue
+            line = normalize_line(to_bgr(image))
+            key = self._cache_key('line', line)
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                texts[i] = cached
+                continue
+
+            debug_sink.write('ocr', f"./ocr_output/line_{name}{i}.png", line)
+            lines.append(line)
+            todo.append((i, key))
+
+        if len(lines) == 0:
+            return texts
+
+        try:
+            results = self._recognize(lines)
+        except Exception as e:
+            logger.error(f"Line OCR failed: {e}")
+            self._text_rec = None  # Recreate on the next call, as for _reinit_paddleocr()
+            return None
+        if results is None:
+            return None
+
+        for (i, key), (text, score) in zip(todo, results):
+            texts[i] = text
+            if key is not None:
+                self.cache.put(key, text)
+        return texts
+
+    def recognize_batch(self, images: list, name='') -> list[list[str] | None] | None:
+        """ Perform OCR with no filtering on many images (i.e. the rows of a list) in one PaddleOCR call.
+        The results are the same as image_simple_ocr() of each image, and share its cache.
+        @param name: A name for the images for logging/debug purposes.
+        @param images: The images to check.
+        @return: The list of strings of each image (None for a None/empty image), or None on failure.
+        """
+        textlists: list[list[str] | None] = [None] * len(images)
+        crops = []
+        todo = []  # (index, cache key) of the images to OCR
+        for i, image in enumerate(images):
+            if image is None or getattr(image, 'size', 0) == 0:
+                continue
+            key = self._cache_key('simple', image)
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                textlists[i] = list(cached)
+                continue
+
+            debug_sink.write('ocr', f"./ocr_output/batch_{name}{i}.png", image)
+            crops.append(to_bgr(image))
+            todo.append((i, key))
+
+        if len(crops) == 0:
+            return textlists
+
+        try:
+            pool = self._get_pool()
+            if pool is not None:
+                pages = pool.ocr_batch(crops, self.timeout)
+            else:
+                pages = self.paddleocr.predict(crops)
+        except Exception as e:
+            logger.error(f"Batch OCR failed: {e}")
+            self._reinit_paddleocr()
+            return None
+        if pages is None:
+            return None
+
+        for (i, key), res in zip(todo, pages):
+            if res is None:
+                continue
+            textlists[i] = list(res['rec_texts'])
+            if key is not None:
+                self.cache.put(key, list(textlists[i]))
+        return textlists
+
+    def image_line_ocr(self, image, name='') -> list[str] | None:
+        """ Perform OCR on a single line image, returning the text in the format of image_simple_ocr().
+        Uses the recognition only OCR if 'OCRLineMode' is set in the config, otherwise image_simple_ocr().
+        @param name: A name for the image for logging/debug purposes.
+        @param image: The image to check.
+        'ocr_textlist' is returned in the following format, or None:
+        ['PRESS [J] TO DISENGAGE']
+        """
+        if not self.line_mode:
+            return self.image_simple_ocr(image, name)
+        if image is None or getattr(image, 'size', 0) == 0:
             return None
 
+        texts = self.image_lines_ocr([image], name)
+        if texts is None:
+            return None
+        return [text for text in texts if text != '']
+
+    def image_simple_ocr_async(self, image, name='') -> Future:
+        """ As image_simple_ocr(), but returns at once with a future of the list of strings, so independent
+        reads can run in parallel in the worker processes. Without the worker pool the OCR is done before
+        returning.
+        @param name: A name for the image for logging/debug purposes.
+        @param image: The image to check.
+        @return: A future of the list of strings, or of None.
+        """
+        pool = self._get_pool()
+        if pool is None or image is None or getattr(image, 'size', 0) == 0:
+            future = Future()
+            future.set_result(self.image_simple_ocr(image, name))
+            return future
+
+        key = self._cache_key('simple', image)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(list(cached))
+                return future
+
+        result = Future()
+
+        def done(pages_future: Future):
+            pages = pages_future.result()
+            if pages is None or any(res is None for res in pages):
+                result.set_result(None)
+                return
+            ocr_textlist = [text for res in pages for text in res['rec_texts']]
+            if key is not None:
+                self.cache.put(key, list(ocr_textlist))
+            result.set_result(ocr_textlist)
+
+        pool.submit(to_bgr(image)).add_done_callback(done)
+        return result
+
     def get_highlighted_item_data(self, image, item: Quad, name=''):
         """ Attempts to find a selected item in an image. The selected item is identified by being solid orange or blue
             rectangle with dark text, instead of orange/blue text on a dark background.
@@ -251,7 +693,7 @@ class OCR:
         img_h, img_w, _ = image.shape
 
         # The input image
-        cv2.imwrite('test/nav-panel/out/1-input.png', image)
+        debug_sink.write('highlight', 'test/nav-panel/out/1-input.png', image)
 
         # Perform HSV mask
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
@@ -259,29 +701,30 @@ class OCR:
         upper_range = np.array([255, 255, 255])
         mask = cv2.inRange(hsv, lower_range, upper_range)
         masked_image = cv2.bitwise_and(image, image, mask=mask)
-        cv2.imwrite('test/nav-panel/out/2-masked.png', masked_image)
+        debug_sink.write('highlight', 'test/nav-panel/out/2-masked.png', masked_image)
 
         # Convert to gray scale and invert
         gray = cv2.cvtColor(masked_image, cv2.COLOR_BGR2GRAY)
-        cv2.imwrite('test/nav-panel/out/3-gray.png', gray)
+        debug_sink.write('highlight', 'test/nav-panel/out/3-gray.png', gray)
 
         # Convert to B&W to allow FindContours to find rectangles.
         ret, thresh1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU)  # | cv2.THRESH_BINARY_INV)
-        cv2.imwrite('test/nav-panel/out/4-thresh1.png', thresh1)
+        debug_sink.write('highlight', 'test/nav-panel/out/4-thresh1.png', thresh1)
 
         # Perform opening. Opening  is just another name of erosion followed by dilation. This will remove specs and
         # edges and then embolden the remaining edges. This works to remove text and stray lines.
         k = int(min(img_w * min_w, img_h * min_h) / 10)  # Make kernel 10% of the smallest image side
         kernel = np.ones((k, k), np.uint8)
         opening = cv2.morphologyEx(thresh1, cv2.MORPH_OPEN, kernel)
-        cv2.imwrite('test/nav-panel/out/5-opened.png', opening)
+        debug_sink.write('highlight', 'test/nav-panel/out/5-opened.png', opening)
 
         # Finding contours in B&W image. White are the areas detected
         contours, hierarchy = cv2.findContours(opening, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        output = image
-        cv2.drawContours(output, contours, -1, (0, 255, 0), 2)
-        cv2.imwrite('test/nav-panel/out/6-contours.png', output)
+        if debug_sink.enabled('highlight'):
+            output = image.copy()
+            cv2.drawContours(output, contours, -1, (0, 255, 0), 2)
+            debug_sink.write('highlight', 'test/nav-panel/out/6-contours.png', output)
 
         # bounds = image
         cropped = image
@@ -299,13 +742,109 @@ class OCR:
                 cropped = image[y:y + h, x:x + w]
 
                 # cv2.imshow("cropped", cropped)
-                cv2.imwrite('test/nav-panel/out/7-selected_item.png', cropped)
+                debug_sink.write('highlight', 'test/nav-panel/out/7-selected_item.png', cropped)
                 q = Quad.from_rect([x / img_w, y / img_h, (x + w) / img_w, (y + h) / img_h])
                 return cropped, q
 
         # No good matches, then return None
         return None, None
 
+    @staticmethod
+    def get_list_rows_in_image(image, item: Quad) -> list[tuple[Quad, bool]]:
+        """ Splits an image of a list into its rows. The rows are found from the horizontal bands of text (orange
+        or blue text on a dark background) and of the highlighted item (solid orange or blue with dark text), using
+        the same color mask as get_highlighted_item_in_image().
+        @param image: The image of the list.
+        @param item: A Quad representing a list item, in percent. Only its height is used.
+        @return: The position of each row in percentage of the image and True if it is the highlighted row, from the
+        top of the list.
+        """
+        if image is None or getattr(image, 'size', 0) == 0:
+            return []
+
+        img_h, img_w = image.shape[:2]
+        row_h = max(2, int(img_h * item.height))
+
+        # Mask the text and highlight, as get_highlighted_item_in_image()
+        hsv = cv2.cvtColor(to_bgr(image), cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, np.array([0, 100, 180]), np.array([255, 255, 255]))
+
+        # The fraction of each pixel row that is masked, with small gaps (i.e. between the lines of a letter) closed
+        fill = cv2.reduce(mask, 1, cv2.REDUCE_AVG, dtype=cv2.CV_32F).ravel() / 255.0
+        on = (fill > 0.0).astype(np.uint8).reshape(-1, 1)
+        on = cv2.morphologyEx(on, cv2.MORPH_CLOSE, np.ones((max(1, row_h // 4), 1), np.uint8)).ravel()
+
+        rects, selected_rows = [], []
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], on, [0]))))
+        for top, bottom in zip(edges[::2], edges[1::2]):
+            # Skip specks, and bands of text that are too short to be a row of text
+            if bottom - top < row_h * 0.3:
+                continue
+            cols = np.flatnonzero(mask[top:bottom].max(axis=0))
+            selected = bool(fill[top:bottom].mean() > 0.5)
+
+            # Grow text bands to the row height, so the OCR gets the same margin around the text as a highlight
+            pad = max(0, (row_h - (bottom - top)) // 2)
+            y1, y2 = max(0, top - pad), min(img_h, bottom + pad)
+            x1, x2 = max(0, cols[0] - pad), min(img_w, cols[-1] + 1 + pad)
+            rects.append([x1, y1, x2, y2])
+            selected_rows.append(selected)
+
+        # Scale all the rows to percent of the image in one call
+        quads = QuadArray.from_rects(rects)
+        quads.scale_from_origin(1.0 / img_w, 1.0 / img_h)
+        return list(zip(quads.to_quads(), selected_rows))
+
+    @staticmethod
+    def get_text_line_in_image(image, mask):
+        """ Crops an image to its main line of text, for image_line_ocr(). The lines are found from the horizontal
+        bands of the mask, and the band with the most text is kept, padded by half its height.
+        @param image: The image.
+        @param mask: The mask of the text in the image, i.e. from a color filter.
+        @return: The cropped image, or None if the mask is empty.
+        """
+        if image is None or mask is None or getattr(mask, 'size', 0) == 0:
+            return None
+
+        img_h, img_w = mask.shape[:2]
+        count = np.count_nonzero(mask, axis=1)
+        on = np.concatenate(([0], (count > 0).astype(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(on))
+        if len(edges) == 0:
+            return None
+
+        # The band with the most masked pixels, as specks and icons have few
+        top, bottom = max(zip(edges[::2], edges[1::2]), key=lambda band: count[band[0]:band[1]].sum())
+        cols = np.flatnonzero(mask[top:bottom].max(axis=0))
+        pad = max(1, (bottom - top) // 2)
+        y1, y2 = max(0, top - pad), min(img_h, bottom + pad)
+        x1, x2 = max(0, cols[0] - pad), min(img_w, cols[-1] + 1 + pad)
+        return image[y1:y2, x1:x2]
+
+    def read_list(self, image, item: Quad, name='') -> list[ListRow] | None:
+        """ Reads all the rows of a list in one OCR call.
+        @param image: The image of the list.
+        @param item: A Quad representing a list item, in percent.
+        @param name: A name for the image for logging/debug purposes.
+        @return: The rows from the top of the list, or None on failure.
+        """
+        rows = self.get_list_rows_in_image(image, item)
+        if len(rows) == 0:
+            return []
+
+        img_h, img_w = image.shape[:2]
+        crops = []
+        for quad, _ in rows:
+            x1, y1, x2, y2 = [int(round(v)) for v in [quad.left * img_w, quad.top * img_h,
+                                                      quad.right * img_w, quad.bottom * img_h]]
+            crops.append(image[y1:y2, x1:x2])
+
+        textlists = self.recognize_batch(crops, name)
+        if textlists is None:
+            return None
+        return [ListRow(textlist if textlist is not None else [], quad, selected)
+                for (quad, selected), textlist in zip(rows, textlists)]
+
     def capture_region_pct(self, region):
         """ Grab the image based on the region name/rect.
         Returns an unfiltered image, either from screenshot or provided image.
@@ -365,17 +904,24 @@ class OCR:
         ocr_textlist = self.image_simple_ocr(image, name)
         # print(str(ocr_textlist))
 
-        # PaddleOCR has difficulty detecting spaces, so strip out spaces for the compare
-        text_ns = text.replace(' ', '').upper()
-        ocr_textlist_ns = str(ocr_textlist).replace(' ', '').upper()
-
-        if text_ns in ocr_textlist_ns:
+        if self.is_text_in_textlist(text, ocr_textlist):
             logger.debug(f"Found '{text}' text in item text '{str(ocr_textlist)}'.")
             return True, str(ocr_textlist)
         else:
             logger.debug(f"Did not find '{text}' text in item text '{str(ocr_textlist)}'.")
             return False, str(ocr_textlist)
 
+    @staticmethod
+    def is_text_in_textlist(text, ocr_textlist) -> bool:
+        """ Does the OCR result include the text being checked for.
+        @param text: The text to check for.
+        @param ocr_textlist: The OCR result from image_simple_ocr().
+        """
+        # PaddleOCR has difficulty detecting spaces, so strip out spaces for the compare
+        text_ns = text.replace(' ', '').upper()
+        ocr_textlist_ns = str(ocr_textlist).replace(' ', '').upper()
+        return text_ns in ocr_textlist_ns
+
     def select_item_in_list(self, text, region, keys, quad: Quad, name='') -> bool:
         """ Attempt to find the item by text in a list defined by the region.
         If found, leaves it selected for further actions.
@@ -386,6 +932,25 @@ class OCR:
         @param name: A name for the image for logging/debug purposes.
         TODO - Move this to Region or Screen code. Make all funcs in OCR use rect/quad, not region.
         """
+        # Read the visible rows in one OCR call and jump straight to the item if it is there
+        img = self.capture_region_pct(region)
+        if img is None:
+            return False
+        rows = self.read_list(img, quad, name) or []
+        text_ns = text.replace(' ', '').upper()
+        target = next((i for i, row in enumerate(rows) if text_ns in str(row.text).replace(' ', '').upper()), None)
+        selected = next((i for i, row in enumerate(rows) if row.selected), None)
+        if target is not None and selected is not None:
+            moves = target - selected
+            if moves != 0:
+                keys.send("UI_Down" if moves > 0 else "UI_Up", repeat=abs(moves))
+            found = self.is_text_in_selected_item_in_image(self.capture_region_pct(region), text, quad, name)
+            if found is not None and found[0]:
+                logger.debug(f"Found '{text}' in {region} list.")
+                return True
+            if moves != 0:
+                # Not the item, go back and check row by row
+                keys.send("UI_Up" if moves > 0 else "UI_Down", repeat=abs(moves))
 
         in_list = False  # Have we seen one item yet? Prevents quiting if we have not selected the first item.
         while 1:
@@ -400,7 +965,7 @@ class OCR:
                 logger.debug(f"Did not find '{text}' in {region} list.")
                 return False
 
-            if found:
+            if found is not None and found[0]:
                 logger.debug(f"Found '{text}' in {region} list.")
                 return True
             else:
@@ -425,14 +990,17 @@ class OCR:
 
         start_time = time.time()
         text_found = False
+        gate = RegionChangeGate(self.settle_frames)
         while True:
             # Check for timeout.
             if time.time() > (start_time + timeout):
                 break
 
-            # Check if screen has appeared.
-            for text in texts:
-                text_found, ocr_text = self.is_text_in_region(text, region)
+            # Check if screen has appeared, once the region has changed and settled
+            img = self.capture_region_pct(region)
+            if img is not None and img.size > 0 and gate.update(img):
+                ocr_textlist = self.image_simple_ocr(img)
+                ocr_text = str(ocr_textlist)
 
                 # Overlay OCR result
                 if ap.debug_overlay:
@@ -440,14 +1008,15 @@ class OCR:
                                                      abs_rect[0], abs_rect[1] - 25, (0, 255, 0))
                     ap.overlay.overlay_paint()
 
+                text_found = any(self.is_text_in_textlist(text, ocr_textlist) for text in texts)
+                logger.debug(f"wait_for_text: {'found' if text_found else 'did not find'} {texts} "
+                             f"in '{ocr_text}'.")
                 if text_found:
                     break
 
-            if text_found:
-                break
-
-            time.sleep(0.25)
+            time.sleep(WAIT_FOR_TEXT_POLL)
 
+        logger.debug(f"wait_for_text: {gate.skipped} captures not OCRed.")
         return text_found
 
 
@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from EDlogger import logger
+
+"""
+File:OCRWorker.py
+
+Description:
+  Runs PaddleOCR in a pool of worker processes, so a crash of PaddleOCR's C++ layer only takes down a worker and
+  not the AP. The image is passed to the worker in shared memory, only the small request and the recognised text
+  go through the queue and pipe of the worker. Each worker has its own result pipe, so a worker killed while
+  sending a result only loses its own pipe. A worker that crashes or times out is restarted, with a fresh
+  PaddleOCR. The timeout of a request only starts once its worker has loaded PaddleOCR, as the first load (or
+  download) of the models can take much longer than an OCR.
+  With more than one worker, OCR requests from different threads (i.e. the SC disengage monitoring and a panel
+  read) run in parallel. Single line images can be sent in a batch to the text recognition model only, skipping the
+  text detection, or many crops (i.e. the rows of a list) to the full OCR in one call.
+
+  Usage:
+    pool = OCRWorkerPool(workers=2, mobile=False)
+    future = pool.submit(image)  # Returns at once
+    result = pool.ocr(image, timeout=10.0)  # Waits, None on failure or timeout
+    lines = pool.recognize([line1, line2], timeout=10.0)  # [(text, score), ...], None on failure or timeout
+    crops = pool.ocr_batch([crop1, crop2], timeout=10.0)  # [pages, pages], None on failure or timeout
+    pool.shutdown()
+
+  A result is a list with one dict per page with the 'rec_texts', 'rec_scores' and 'rec_polys' keys, as the
+  PaddleOCR results.
+"""
+
+WORKER_POLL = 0.5  # Time in secs between the checks of the workers by the monitor thread
+WORKER_MAX_RESTARTS = 3  # Restarts of a worker with no result in between, before giving up on it (i.e. no PaddleOCR)
+WORKER_LOAD_TIMEOUT = 600.0  # Max time in secs for a worker to load PaddleOCR (and download the models)
+WORKER_READY = 0  # Request id of the message a worker sends once it has loaded PaddleOCR, with its pid
+
+
+def create_paddleocr(mobile: bool):
+    """ Creates the PaddleOCR instance, using the mobile models if set. """
+    from paddleocr import PaddleOCR
+
+    if mobile:
+        return PaddleOCR(
+            use_doc_orientation_classify=False,
+            use_doc_unwarping=False,
+            use_textline_orientation=False,
+            text_detection_model_name="PP-OCRv5_mobile_det",
+            text_recognition_model_name="en_PP-OCRv5_mobile_rec")  # text detection + text recognition
+    else:
+        return PaddleOCR(
+            use_doc_orientation_classify=False,
+            use_doc_unwarping=False,
+            use_textline_orientation=False)  # text detection + text recognition
+
+
+def create_text_recognition(mobile: bool):
+    """ Creates the PaddleOCR text recognition model alone, the same model as used by create_paddleocr(). """
+    from paddleocr import TextRecognition
+
+    if mobile:
+        return TextRecognition(model_name="en_PP-OCRv5_mobile_rec")
+    else:
+        return TextRecognition(model_name="PP-OCRv5_server_rec")
+
+
+def recognize_lines(text_rec, lines: list) -> list[tuple[str, float]]:
+    """ Recognizes the text of single line images in one inference call.
+    @param text_rec: The text recognition model from create_text_recognition().
+    @param lines: The line images (BGR), cropped to the text and of the same height.
+    @return: The text and score of each line.
+    """
+    results = text_rec.predict(input=lines, batch_size=len(lines))
+    return [(res['rec_text'], float(res['rec_score'])) for res in results]
+
+
+def _page(res) -> dict | None:
+    """ A PaddleOCR result as a plain dict, that can be sent back from the worker. """
+    if res is None:
+        return None
+    return {'rec_texts': list(res['rec_texts']),
+            'rec_scores': [float(s) for s in res['rec_scores']],
+            'rec_polys': [np.asarray(p).tolist() for p in res['rec_polys']]}
+
+
+def _worker_main(requests, results, mobile: bool):
+    """ The worker process. OCRs the images of the requests until a None request.
+    @param requests: The request queue of the worker.
+    @param results: The sending end of the result pipe of the worker.
+    Once PaddleOCR is loaded the worker sends (WORKER_READY, True, pid).
+    A request is (request id, kind, shared memory name, shape, dtype, sizes), the result is (request id, True,
+    result) or (request id, False, error message). For an 'ocr' request the result is the pages. For 'rec' and
+    'batch' requests the image is a stack of images padded to the same size, with the (height, width) of each in
+    sizes. The result is the text and score of each line for 'rec', and the page of each image for 'batch'.
+    PaddleOCR is recreated after a failure, as its C++ layer can be left in a corrupt state.
+    """
+    paddleocr = create_paddleocr(mobile)
+    text_rec = None
+    results.send((WORKER_READY, True, os.getpid()))
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+
+        req_id, kind, shm_name, shape, dtype, sizes = request
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            if kind == 'rec':
+                if text_rec is None:
+                    text_rec = create_text_recognition(mobile)
+                result = recognize_lines(text_rec, [image[i, :h, :w].copy() for i, (h, w) in enumerate(sizes)])
+            elif kind == 'batch':
+                result = [_page(res) for res in paddleocr.predict([image[i, :h, :w].copy()
+                                                                   for i, (h, w) in enumerate(sizes)])]
+            else:
+                result = [_page(res) for res in paddleocr.predict(image) or []]
+                if None in result:
+                    result = None
+            del image
+            results.send((req_id, True, result))
+        except Exception as e:
+            results.send((req_id, False, f"{type(e).__name__}: {e}"))
+            if kind == 'rec':
+                text_rec = None
+            else:
+                paddleocr = create_paddleocr(mobile)
+        finally:
+            shm.close()
+
+
+class _Worker:
+    """ A worker process, its request queue and its result pipe. The process is started by start(), so a worker can
+    be created (and receive requests) under the pool's lock and started after it is released. """
+
+    def __init__(self, ctx, mobile: bool, index: int, target=_worker_main):
+        self.requests = ctx.Queue()
+        self.results, self._results_send = ctx.Pipe(duplex=False)
+        self.pending: set[int] = set()  # Ids of the requests sent to this worker
+        self.failures = 0  # Restarts since the last result from this worker
+        self.ready = threading.Event()  # Set once the worker has loaded PaddleOCR
+        self.started = time.monotonic()
+        self.process = ctx.Process(target=target, args=(self.requests, self._results_send, mobile),
+                                   name=f"OCRWorker-{index}", daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.process.start()
+        # Only the worker sends, so the pipe reads EOF once it has exited
+        self._results_send.close()
+
+    @property
+    def exited(self) -> bool:
+        """ True once the process has exited. False before it is started. """
+        return self.process.exitcode is not None
+
+    def stop(self, timeout: float = 2.0):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout)
+        self.kill(timeout)
+
+    def kill(self, timeout: float = 2.0):
+        """ Terminates the process if still running, and reaps it. """
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.process.pid is not None:
+            self.process.join(timeout)
+
+
+class OCRWorkerPool:
+    """ A pool of PaddleOCR worker processes with an async request API. """
+
+    def __init__(self, workers: int = 1, mobile: bool = False, target=_worker_main):
+        """
+        @param workers: The number of worker processes.
+        @param mobile: Use the mobile (light) PaddleOCR models.
+        @param target: The function run by the worker processes, with the arguments and protocol of _worker_main().
+        """
+        self.mobile = mobile
+        self._target = target
+        self.restarts = 0  # Number of workers restarted after a crash or timeout
+        self._ctx = mp.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, tuple[Future, shared_memory.SharedMemory, _Worker]] = {}
+        self._workers: list[_Worker | None] = [_Worker(self._ctx, mobile, i, target) for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="OCRWorkerMonitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"Started {len(self._workers)} OCR worker process(es).")
+
+    def submit(self, image: np.ndarray) -> Future:
+        """ Sends an image to the least busy worker.
+        @param image: The image (BGR).
+        @return: A future of the result, the list of pages or None if the OCR failed.
+        """
+        return self._submit('ocr', np.ascontiguousarray(image), None)
+
+    def submit_lines(self, lines: list) -> Future:
+        """ Sends single line images to the least busy worker, for the text recognition model only.
+        @param lines: The line images (BGR), of the same height.
+        @return: A future of the result, the text and score of each line or None if the OCR failed.
+        """
+        return self._submit('rec', *self._stack(lines))
+
+    def submit_batch(self, images: list) -> Future:
+        """ Sends images (i.e. the rows of a list) to the least busy worker, for the full OCR in one call.
+        @param images: The images (BGR).
+        @return: A future of the result, the page of each image (None for a failed image) or None if the OCR failed.
+        """
+        return self._submit('batch', *self._stack(images))
+
+    @staticmethod
+    def _stack(images: list) -> tuple[np.ndarray, list[tuple[int, int]]]:
+        """ Stacks images of different sizes into one array, so they are sent in one shared memory block.
+        @return: The stack, padded to the largest height and width, and the (height, width) of each image.
+        """
+        sizes = [image.shape[:2] for image in images]
+        stack = np.zeros((len(images), max(h for h, _ in sizes), max(w for _, w in sizes)) + images[0].shape[2:],
+                         dtype=images[0].dtype)
+        for i, image in enumerate(images):
+            stack[i, :image.shape[0], :image.shape[1]] = image
+        return stack, sizes
+
+    def _submit(self, kind: str, image: np.ndarray, sizes: list[tuple[int, int]] | None) -> Future:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+
+        future = Future()
+        with self._lock:
+            workers = [w for w in self._workers if w is not None]
+            if len(workers) == 0:
+                shm.close()
+                shm.unlink()
+                future.set_result(None)
+                return future
+            req_id = next(self._ids)
+            # Skip a worker that has died and is not restarted yet
+            workers = [w for w in workers if not w.exited] or workers
+            worker = min(workers, key=lambda w: len(w.pending))
+            worker.pending.add(req_id)
+            self._pending[req_id] = (future, shm, worker)
+            worker.requests.put((req_id, kind, shm.name, image.shape, image.dtype.str, sizes))
+        return future
+
+    def ocr(self, image: np.ndarray, timeout: float = 10.0):
+        """ OCRs an image and waits for the result.
+        @param image: The image (BGR).
+        @param timeout: The max time to wait in secs. The worker is restarted if it times out, as it may be hung.
+        @return: The list of pages, or None if the OCR failed or timed out.
+        """
+        return self._wait(self.submit(image), timeout)
+
+    def recognize(self, lines: list, timeout: float = 10.0):
+        """ Recognizes the text of single line images and waits for the result.
+        @param lines: The line images (BGR), of the same height.
+        @param timeout: The max time to wait in secs. The worker is restarted if it times out, as it may be hung.
+        @return: The text and score of each line, or None if the OCR failed or timed out.
+        """
+        return self._wait(self.submit_lines(lines), timeout)
+
+    def ocr_batch(self, images: list, timeout: float = 10.0):
+        """ OCRs many images in one call and waits for the result.
+        @param images: The images (BGR).
+        @param timeout: The max time to wait in secs. The worker is restarted if it times out, as it may be hung.
+        @return: The page of each image (None for a failed image), or None if the OCR failed or timed out.
+        """
+        return self._wait(self.submit_batch(images), timeout)
+
+    def warm_up(self, image: np.ndarray, line: np.ndarray | None = None, timeout: float = 120.0) -> bool:
+        """ Sends an OCR (and a line recognition) to each worker and waits for them, so every worker has loaded its
+        models before the first real request. Unlike ocr(), the timeout includes the model load, and a worker that
+        does not finish in time is not restarted (the monitor restarts it after WORKER_LOAD_TIMEOUT if not loaded).
+        @param image: The image (BGR).
+        @param line: A line image (BGR) for the text recognition model, or None to skip it.
+        @param timeout: The max time to wait in secs for each request, including the model load.
+        @return: True if every request succeeded.
+        """
+        count = self.workers
+        # The requests go to the least busy worker, so each worker gets one of each
+        futures = [self.submit(image) for _ in range(count)]
+        if line is not None:
+            futures += [self.submit_lines([line]) for _ in range(count)]
+
+        ok = count > 0
+        for future in futures:
+            try:
+                ok = future.result(timeout) is not None and ok
+            except FutureTimeoutError:
+                logger.warning(f"OCR worker warm up not done after {timeout}s.")
+                ok = False
+        return ok
+
+    @property
+    def workers(self) -> int:
+        """ The number of workers, not counting those given up on. 0 if the pool can no longer OCR. """
+        with self._lock:
+            return len([w for w in self._workers if w is not None])
+
+    def _worker_of(self, future: Future) -> _Worker | None:
+        """ The worker of a pending request, or None if the request is done. """
+        with self._lock:
+            for fut, _, worker in self._pending.values():
+                if fut is future:
+                    return worker
+        return None
+
+    def _wait(self, future: Future, timeout: float):
+        # Start the timeout once the worker has loaded PaddleOCR. The monitor restarts a worker that takes too long.
+        worker = self._worker_of(future)
+        while worker is not None and not worker.ready.is_set() and not future.done():
+            worker.ready.wait(WORKER_POLL)
+            worker = self._worker_of(future)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            logger.warning(f"OCR worker timed out after {timeout}s, restarting it.")
+            self._restart_worker_of(future)
+            return None
+
+    def shutdown(self):
+        """ Stops the workers and fails any pending requests. """
+        self._stop.set()
+        self._monitor.join(timeout=2.0)
+        with self._lock:
+            workers = [w for w in self._workers if w is not None]
+        for worker in workers:
+            worker.stop()
+        with self._lock:
+            for req_id in list(self._pending):
+                self._finish(req_id, None)
+
+    def _monitor_loop(self):
+        """ Resolves the futures from the results and restarts any worker that has died. """
+        closed = set()  # Result pipes at EOF, of workers that have exited and are not replaced yet
+        while not self._stop.is_set():
+            with self._lock:
+                by_pipe = {w.results: w for w in self._workers if w is not None}
+            closed &= by_pipe.keys()
+            try:
+                ready = connection.wait([pipe for pipe in by_pipe if pipe not in closed], timeout=WORKER_POLL)
+            except OSError:
+                ready = []
+
+            for pipe in ready:
+                worker = by_pipe[pipe]
+                try:
+                    req_id, ok, payload = pipe.recv()
+                except (EOFError, OSError):
+                    closed.add(pipe)
+                    continue
+                with self._lock:
+                    if req_id == WORKER_READY:
+                        worker.ready.set()
+                    else:
+                        if not ok:
+                            logger.error(f"OCR failed in worker: {payload}")
+                        self._finish(req_id, payload if ok else None)
+
+            with self._lock:
+                stopped = []
+                for worker in self._workers:
+                    if worker is None:
+                        continue
+                    if worker.exited:
+                        stopped.append((worker, f"exit code {worker.process.exitcode}"))
+                    elif not worker.ready.is_set() and time.monotonic() - worker.started > WORKER_LOAD_TIMEOUT:
+                        stopped.append((worker, f"not loaded after {WORKER_LOAD_TIMEOUT}s"))
+            for worker, reason in stopped:
+                self._replace(worker, reason)
+
+    def _finish(self, req_id: int, result):
+        """ Resolves a request and frees its shared memory. Called with the lock held. """
+        entry = self._pending.pop(req_id, None)
+        if entry is None:
+            return  # Already failed (i.e. timed out)
+        future, shm, worker = entry
+        worker.pending.discard(req_id)
+        if result is not None:
+            worker.failures = 0
+        shm.close()
+        shm.unlink()
+        if not future.done():
+            future.set_result(result)
+
+    def _replace(self, worker: _Worker, reason: str):
+        """ Restarts a worker, failing its pending requests. The old process is killed and the new one started
+        with the lock released. Does nothing if the worker has already been replaced. """
+        with self._lock:
+            if worker not in self._workers:
+                return
+            index = self._workers.index(worker)
+            logger.warning(f"OCR worker {index} stopped ({reason}), restarting it.")
+            for req_id in list(worker.pending):
+                self._finish(req_id, None)
+            new_worker = None
+            if worker.failures >= WORKER_MAX_RESTARTS:
+                logger.error(f"OCR worker {index} failed {worker.failures} times in a row, not restarting it.")
+                self._workers[index] = None
+                if all(w is None for w in self._workers):
+                    logger.error("No OCR worker processes left.")
+            else:
+                # Requests sent from now on wait in the queue of the new worker until it has started
+                new_worker = _Worker(self._ctx, self.mobile, index, self._target)
+                new_worker.failures = worker.failures + 1
+                self._workers[index] = new_worker
+                self.restarts = self.restarts + 1
+
+        worker.kill()
+        if new_worker is not None:
+            new_worker.start()
+
+    def _restart_worker_of(self, future: Future):
+        worker = self._worker_of(future)
+        if worker is not None:
+            self._replace(worker, "timeout")
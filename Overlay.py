@@ -150,8 +150,8 @@ class Overlay:
         @param duration: The duration in seconds to display until removed, or <0.0 to prevent removal.
         @duration: Duration to display overlay in secs before it is removed, or <0.0 to prevent removal. """
         global quadrilaterals
-        q = copy(quad)
-        q.scale_from_origin(self.targetRect.w, self.targetRect.h)
+        # Scale to pixels as a new quad, so the quad given may be frozen
+        q = Quad.from_array(quad.points * (self.targetRect.w, self.targetRect.h))
         quadrilaterals[key] = [q, color, thick, duration, datetime.now()]
 
     @staticmethod
@@ -363,11 +363,12 @@ class Overlay:
 
         # top
         win32gui.SelectObject(hdc, pin_thick)
-        win32gui.MoveToEx(hdc, int(quad.pt1.get_x()), int(quad.pt1.get_y()))
-        win32gui.LineTo(hdc, int(quad.pt2.get_x()), int(quad.pt2.get_y()))
-        win32gui.LineTo(hdc, int(quad.pt3.get_x()), int(quad.pt3.get_y()))
-        win32gui.LineTo(hdc, int(quad.pt4.get_x()), int(quad.pt4.get_y()))
-        win32gui.LineTo(hdc, int(quad.pt1.get_x()), int(quad.pt1.get_y()))
+        (x1, y1), (x2, y2), (x3, y3), (x4, y4) = quad.points.astype(int).tolist()
+        win32gui.MoveToEx(hdc, x1, y1)
+        win32gui.LineTo(hdc, x2, y2)
+        win32gui.LineTo(hdc, x3, y3)
+        win32gui.LineTo(hdc, x4, y4)
+        win32gui.LineTo(hdc, x1, y1)
 
     @staticmethod 
     def overlay_set_font(hdc, fontname, fontSize):
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from EDlogger import logger
+from Screen_Regions import SunMeasure
+
+"""
+File:Perception.py
+
+Description:
+  Runs the screen detectors (compass, target, sun and disengage) on a single frame and returns their outputs in
+  one PerceptionResult, so a full sense cycle costs one screen capture. Each detector can be switched on or off
+  per assist mode, and the time taken by the capture and by each detector is returned with the result.
+  The compass and target ML models are run in parallel on a small worker pool when both are wanted.
+
+  Usage:
+    res = ed_ap.perception.sense()  # The detectors enabled for the current mode
+    res = ed_ap.perception.sense(('sun',))  # Only the sun detector
+    if res.compass_target: ...
+"""
+
+DETECTORS = ('compass', 'target', 'sun', 'disengage')
+
+# The detectors run by sense() for each assist mode. The sun is only measured when asked for (i.e. sense(('sun',))
+# by the sun avoidance), and the disengage OCR is run by the SCO monitoring thread, so neither is enabled by default
+# (they can be enabled with enable()).
+DEFAULT_MODE_DETECTORS = {
+    'default': ('compass', 'target'),
+    'fsd': ('compass', 'target'),
+    'sc': ('compass', 'target'),
+    'waypoint': ('compass', 'target'),
+}
+
+SUN_AHEAD_PCT = 5  # Sun percent above which the sun is considered to be dead ahead
+
+
+@dataclass
+class PerceptionResult:
+    """ The outputs of the detectors for one frame. The output of a detector that was not run is None. """
+    frame_id: int = 0
+    timestamp: float = 0.0  # The time.monotonic() of the frame
+    nav: dict | None = None  # CompassOffset from get_nav_offset()
+    target: dict | None = None  # TargetOffset from get_target_offset()
+    compass_target: dict | None = None  # CompassTargetOffset combined from the nav and target
+    sun_pct: int | None = None  # Percent of the sun region that is bright
+    sun: SunMeasure | None = None  # The sun measure, with the centroid of the bright pixels
+    disengage: bool | None = None  # The SC disengage text is showing
+    timings: dict[str, float] = field(default_factory=dict)  # Time taken by each stage in seconds
+
+    @property
+    def sun_ahead(self) -> bool:
+        """ True if the sun is dead ahead. """
+        return self.sun_pct is not None and self.sun_pct > SUN_AHEAD_PCT
+
+
+class Perception:
+    """ Runs the screen detectors on a single frame. """
+
+    def __init__(self, ed_ap):
+        self.ap = ed_ap
+        self.mode = 'default'
+        self.parallel = True  # Run the compass and target detectors in parallel
+        self._pool: ThreadPoolExecutor | None = None
+        self.mode_detectors: dict[str, set[str]] = {mode: set(dets) for mode, dets in
+                                                    DEFAULT_MODE_DETECTORS.items()}
+
+    @property
+    def enabled(self) -> set[str]:
+        """ The detectors enabled for the current mode. """
+        return self.mode_detectors.get(self.mode, self.mode_detectors['default'])
+
+    def set_mode(self, mode: str):
+        """ Sets the assist mode, which selects the detectors run by sense().
+        @param mode: The mode, i.e. 'default', 'fsd', 'sc' or 'waypoint'. Unknown modes use the default detectors.
+        """
+        if mode != self.mode:
+            logger.debug(f"Perception mode: {mode}")
+        self.mode = mode
+
+    def enable(self, detector: str, enabled: bool = True, mode: str | None = None):
+        """ Switches a detector on or off for a mode.
+        @param detector: The detector, one of DETECTORS.
+        @param enabled: True to run the detector, False to not.
+        @param mode: The mode, else the current mode.
+        """
+        if detector not in DETECTORS:
+            logger.warning(f"Perception: unknown detector '{detector}'.")
+            return
+
+        mode = self.mode if mode is None else mode
+        detectors = self.mode_detectors.setdefault(mode, set(self.mode_detectors['default']))
+        if enabled:
+            detectors.add(detector)
+        else:
+            detectors.discard(detector)
+
+    def sense(self, detectors: tuple[str, ...] | None = None) -> PerceptionResult:
+        """ Captures one frame and runs the detectors on it.
+        @param detectors: The detectors to run, else the detectors enabled for the current mode.
+        @return: The outputs of the detectors.
+        """
+        if detectors is None:
+            detectors = self.enabled
+        ap = self.ap
+        scr_reg = ap.scrReg
+        res = PerceptionResult()
+
+        start = time.perf_counter()
+        with ap.scr.frame_tick() as frame:
+            res.timings['capture'] = time.perf_counter() - start
+            if frame is not None:
+                res.frame_id = frame.frame_id
+                res.timestamp = frame.timestamp
+
+            # The CV view windows must be drawn from a single thread, so do not run in parallel when shown
+            if self.parallel and not ap.cv_view and 'compass' in detectors and 'target' in detectors:
+                res.nav, res.target = self._sense_compass_target(res, frame)
+            else:
+                if 'compass' in detectors:
+                    res.nav = self._timed(res, 'compass', lambda: ap.get_nav_offset(scr_reg))
+                if 'target' in detectors:
+                    res.target = self._timed(res, 'target', lambda: ap.get_target_offset(scr_reg))
+            if 'compass' in detectors or 'target' in detectors:
+                res.compass_target = ap.combine_compass_target_offset(res.nav, res.target)
+            if 'sun' in detectors:
+                res.sun = self._timed(res, 'sun', lambda: scr_reg.sun_measure(ap.scr))
+                res.sun_pct = int(res.sun.pct)
+            if 'disengage' in detectors:
+                res.disengage = self._timed(res, 'disengage', lambda: ap.sc_disengage_ocr(scr_reg))
+
+            ap.record_frame(frame, [d for d in DETECTORS if d in detectors],
+                            {'nav': res.nav, 'tar': res.target, 'sun': res.sun_pct, 'disengage': res.disengage})
+
+        res.timings['total'] = time.perf_counter() - start
+        return res
+
+    def _sense_compass_target(self, res: PerceptionResult, frame) -> tuple[dict | None, dict | None]:
+        """ Runs the compass and target detectors in parallel on the frame, joining both results.
+        @return: The compass and target offsets.
+        """
+        ap = self.ap
+        scr_reg = ap.scrReg
+        _ = ap.mach_learn  # Load the models before the workers use them, so they are only loaded once
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='Perception')
+
+        def run(name, func):
+            # The frame tick is per thread, so share this tick's frame with the worker thread
+            with ap.scr.frame_tick(frame):
+                return self._timed(res, name, lambda: func(scr_reg))
+
+        start = time.perf_counter()
+        nav = self._pool.submit(run, 'compass', ap.get_nav_offset)
+        tar = self._pool.submit(run, 'target', ap.get_target_offset)
+        result = nav.result(), tar.result()
+        res.timings['compass_target'] = time.perf_counter() - start
+        return result
+
+    def shutdown(self):
+        """ Stops the worker pool. """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    @staticmethod
+    def _timed(res: PerceptionResult, name: str, func: Callable[[], Any]) -> Any:
+        """ Calls the detector function and stores the time it took in the result. """
+        start = time.perf_counter()
+        out = func()
+        res.timings[name] = time.perf_counter() - start
+        return out
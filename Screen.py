@@ -1,18 +1,28 @@
 from __future__ import annotations
+import sys
+import threading
 import time
 import typing
+from contextlib import contextmanager
 from copy import copy
+from dataclasses import dataclass, field
 
 import cv2
-import win32con
-import win32gui
 import numpy as np
 from numpy import array
 import mss
 import json
 
 from EDlogger import logger
-from Screen_Regions import Quad
+from Screen_Regions import Quad, RegionRegistry
+
+try:
+    import win32con
+    import win32gui
+except ImportError:
+    # Not on Windows (i.e. running the benchmarks or a replay on Linux), so there is no ED window to find
+    win32con = None
+    win32gui = None
 
 """
 File:Screen.py    
@@ -36,6 +46,8 @@ def set_focus_elite_window():
     """ set focus to the ED window, if ED does not have focus then the keystrokes will go to the window
     that does have focus. """
     ed_title = "Elite - Dangerous (CLIENT)"
+    if win32gui is None:
+        return
 
     # TODO - determine if GetWindowText is faster than FindWindow if ED is in foreground
     if win32gui.GetWindowText(win32gui.GetForegroundWindow()) == ed_title:
@@ -57,15 +69,22 @@ def crop_image_by_pct(image, quad: Quad):
     Returns the cropped image. """
     # Existing size
     h, w, ch = image.shape
-    # Make a local copy
-    q = copy(quad)
-    # Scale from percent to pixels
-    q.scale_from_origin(w, h)
-    # Crop image
-    cropped = crop_image_pix(image, q)
+    # Scale the bounds from percent to pixels, without copying the quad
+    left, top, right, bottom = quad.to_rect_list()
+    cropped = image[int(top * h):int(bottom * h), int(left * w):int(right * w)]  # i.e. [y:y+h, x:x+w]
     return cropped
 
 
+def to_bgr(image):
+    """ Converts a BGRA image (as captured by mss) to BGR with a single conversion. A BGR image is returned as is.
+    """
+    if image is None:
+        return None
+    if image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+
 def crop_image_pix(image, quad: Quad):
     """ Crop an image using a pixel values.
     Rect is an array of pixel values [100, 200, 1800, 1600] = [X0, Y0, X1, Y1] = [L, T, R, B]
@@ -75,10 +94,146 @@ def crop_image_pix(image, quad: Quad):
     return cropped
 
 
+@dataclass
+class Frame:
+    """ A single grab of the full ED screen, shared by all the detectors that read it.
+    The image is the native BGRA buffer from mss and is read-only, as region crops are views of it. Copy a crop
+    before drawing on it. The BGR image is only converted when first requested and is then cached, so a frame is
+    converted at most once however many detectors read it.
+    """
+    image: np.ndarray  # Full screen image (BGRA, or BGR when set from an image file)
+    timestamp: float  # time.monotonic() when the frame was grabbed
+    frame_id: int  # Incrementing frame number
+    _bgr: np.ndarray | None = field(default=None, repr=False)  # Cached BGR image
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """ The full screen image in BGR, converted on first use. """
+        if self._bgr is None:
+            # A view, so a BGR image set from an image file (returned as is by to_bgr) is not made read-only
+            self._bgr = to_bgr(self.image).view()
+            self._bgr.flags.writeable = False
+        return self._bgr
+
+    @property
+    def age(self) -> float:
+        """ Age of the frame in seconds. """
+        return time.monotonic() - self.timestamp
+
+    def region(self, rect) -> np.ndarray:
+        """ Gets a region of the frame as a zero-copy view.
+        @param rect: A rect array ([L, T, R, B]) in pixels.
+        """
+        return self.image[int(rect[1]):int(rect[3]), int(rect[0]):int(rect[2])]
+
+    def region_pct(self, rect) -> np.ndarray:
+        """ Gets a region of the frame as a zero-copy view.
+        @param rect: A rect array ([L, T, R, B]) in percent (0.0 - 1.0).
+        """
+        h, w = self.image.shape[:2]
+        return self.image[int(rect[1] * h):int(rect[3] * h), int(rect[0] * w):int(rect[2] * w)]
+
+    def region_bgr(self, rect) -> np.ndarray:
+        """ Gets a region of the frame in BGR. If the full BGR image has already been converted this is a
+        zero-copy view of it, else only the region is converted.
+        @param rect: A rect array ([L, T, R, B]) in pixels.
+        """
+        if self._bgr is not None:
+            return self._bgr[int(rect[1]):int(rect[3]), int(rect[0]):int(rect[2])]
+        return to_bgr(self.region(rect))
+
+
+class FrameRingBuffer:
+    """ A fixed size ring of preallocated frame images, written by the capture thread and read by any thread.
+    The images are reused when the ring wraps round, unless a reader still holds the frame or a region view of it.
+    That slot then gets a new image, so a frame handed out is never overwritten while it is being read.
+    """
+
+    def __init__(self, size: int, shape: tuple):
+        self.size = size
+        self.shape = shape
+        self.closed = False  # Set when the ring is replaced, i.e. the screen size changed
+        self.reallocs = 0  # Number of slots given a new image as their frame was still held by a reader
+        self._images = [np.zeros(shape, dtype=np.uint8) for _ in range(size)]
+        self._frames: list[Frame | None] = [None] * size
+        self._count = 0  # Number of frames written
+        self._cond = threading.Condition()
+        # References to a slot image not held by a reader: the list, _in_use()'s argument and getrefcount()'s
+        self._free_refs = self._in_use_refs(self._images[0])
+
+    @staticmethod
+    def _in_use_refs(image) -> int:
+        return sys.getrefcount(image)
+
+    def write(self, image, timestamp: float) -> Frame:
+        """ Copies the image into the next slot of the ring, overwriting the oldest frame.
+        @param image: The image, of the same shape as the ring.
+        @param timestamp: The time.monotonic() the image was grabbed.
+        @return: The new frame.
+        """
+        idx = self._count % self.size
+        with self._cond:
+            # Drop the old frame before its image is overwritten. If a reader still holds it (or a view of it), its
+            # image is left to the reader and the slot gets a new one. Once dropped, no new reader can get it.
+            self._frames[idx] = None
+            if self._in_use_refs(self._images[idx]) > self._free_refs:
+                self._images[idx] = np.empty(self.shape, dtype=np.uint8)
+                self.reallocs = self.reallocs + 1
+
+        np.copyto(self._images[idx], image)
+        view = self._images[idx].view()
+        view.flags.writeable = False
+
+        with self._cond:
+            self._count = self._count + 1
+            frame = Frame(view, timestamp, self._count)
+            self._frames[idx] = frame
+            self._cond.notify_all()
+        return frame
+
+    def latest(self) -> Frame | None:
+        """ Gets the most recent frame, or None if no frame has been written. """
+        with self._cond:
+            if self._count == 0:
+                return None
+            return self._frames[(self._count - 1) % self.size]
+
+    def newer_than(self, timestamp: float, timeout: float) -> Frame | None:
+        """ Gets the first frame grabbed after the timestamp, waiting for it if necessary.
+        @param timestamp: The time.monotonic() the frame must be newer than.
+        @param timeout: The max time to wait in seconds.
+        @return: The frame, or None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                # Search from the oldest frame to the newest
+                for i in range(max(0, self._count - self.size), self._count):
+                    frame = self._frames[i % self.size]
+                    if frame is not None and frame.timestamp > timestamp:
+                        return frame
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.closed:
+                    return None
+                self._cond.wait(remaining)
+
+    def close(self):
+        """ Wakes any reader waiting in newer_than(), as no more frames will be written to this ring. """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
 class Screen:
     def __init__(self, cb):
         self.ap_ckb = cb
-        self.mss = mss.mss()
+        try:
+            self.mss = mss.mss()
+        except Exception as e:
+            # No display to capture (i.e. replaying frames on a headless machine)
+            logger.warning(f"Screen capture not available: {e}")
+            self.mss = None
         self.using_screen = True  # True to use screen, false to use an image. Set screen_image to the image
         self._screen_image = None  # Screen image captured from screen, or loaded by user for testing.
         self.screen_width = 0
@@ -92,6 +247,24 @@ class Screen:
         self._last_capture_warn_ts = 0.0
         self._capture_warn_interval = 5.0  # seconds between repeated warnings
         self._capture_failure_count = 0
+        # Frame cache. A full screen frame is grabbed once and shared by every capture within a tick or within
+        # frame_max_age. With a max age of 0.0 only frame_tick() shares a frame, other captures grab the screen.
+        self.frame_max_age = 0.0  # Max age in seconds of a cached frame before a new one is grabbed
+        self._frame: Frame | None = None
+        self._frame_id = 0
+        self._frame_lock = threading.Lock()
+        self._tick = threading.local()  # The frame pinned by frame_tick(), per thread
+        # Optional capture thread, grabbing frames into a ring buffer at a fixed rate. See start_capture().
+        self.ring: FrameRingBuffer | None = None
+        self._capture_thread: threading.Thread | None = None
+        self._capture_stop = threading.Event()
+        self._capture_fps = 0.0
+        self._capture_buffer_size = 8
+        # The named regions, in pixels for the current screen size. Rescaled when the ED window moves or resizes.
+        self.regions = RegionRegistry()
+        self.window_check_interval = 1.0  # Min time in seconds between checks of the ED window position and size
+        self._last_window_check = 0.0
+        self._window_lock = threading.RLock()  # Guards the screen size, position and monitor while they change
 
         # Find ED window position to determine which monitor it is on
         self.ed_rect = self.get_elite_window_rect()
@@ -103,38 +276,8 @@ class Screen:
             logger.debug(f'Found Elite Dangerous window position: {self.ed_rect}')
 
         # Examine all monitors to determine match with ED
-        self.mons = self.mss.monitors
-        mon_num = 0
-        default = True
-        for item in self.mons:
-            logger.debug(f'Found monitor {mon_num} with details: {item}')
-            if mon_num > 0:  # ignore monitor 0 as it is the complete desktop (dims of all monitors)
-                if self.ed_rect is not None:
-                    if item['left'] == self.ed_rect[0] and item['top'] == self.ed_rect[1]:
-                        # Get information of monitor
-                        self.monitor_number = mon_num
-                        self.mon = self.mss.monitors[self.monitor_number]
-                        self.screen_width = item['width']
-                        self.screen_height = item['height']
-                        self.aspect_ratio = self.screen_width / self.screen_height
-                        self.screen_left = item['left']
-                        self.screen_top = item['top']
-                        logger.debug(f'Elite Dangerous is on monitor {mon_num}.')
-                        default = False
-                        break
-
-            # Store the first monitor incase we need it as default
-            if mon_num == 1:
-                self.monitor_number = mon_num
-                self.mon = self.mss.monitors[self.monitor_number]
-                self.screen_width = item['width']
-                self.screen_height = item['height']
-                self.aspect_ratio = self.screen_width / self.screen_height
-                self.screen_left = item['left']
-                self.screen_top = item['top']
-
-            # Next monitor
-            mon_num = mon_num + 1
+        self.mons = self.mss.monitors if self.mss is not None else []
+        default = not self._find_monitor()
 
         # Check if ED was found on a monitor, or if we are using the default monitor
         if default:
@@ -170,6 +313,101 @@ class Screen:
             self.scales = ss
             logger.debug("read json:" + str(ss))
 
+        self.update_scale()
+        self.regions.resize(self.screen_width, self.screen_height)
+
+        # if the calibration scale values are not -1, then use those regardless of above
+        # if self.scales['Calibrated'][0] != -1.0:
+        #     self.scaleX = self.scales['Calibrated'][0]
+        # if self.scales['Calibrated'][1] != -1.0:
+        #     self.scaleY = self.scales['Calibrated'][1]
+        
+        logger.debug('screen size: w='+str(self.screen_width)+" h="+str(self.screen_height))
+        logger.debug('screen position: x='+str(self.screen_left)+" y="+str(self.screen_top))
+        logger.debug('Default scale X, Y: ' + str(self.scaleX) + ", " + str(self.scaleY))
+
+    def _find_monitor(self) -> bool:
+        """ Finds the monitor ED is on from the ED window position and sets the screen size and position from it.
+        The first monitor is used if ED is not found.
+        @return: True if ED was found on a monitor.
+        """
+        mon_num = 0
+        for item in self.mons:
+            logger.debug(f'Found monitor {mon_num} with details: {item}')
+            if mon_num > 0:  # ignore monitor 0 as it is the complete desktop (dims of all monitors)
+                if self.ed_rect is not None:
+                    if item['left'] == self.ed_rect[0] and item['top'] == self.ed_rect[1]:
+                        # Get information of monitor
+                        self._set_monitor(mon_num)
+                        logger.debug(f'Elite Dangerous is on monitor {mon_num}.')
+                        return True
+
+            # Store the first monitor incase we need it as default
+            if mon_num == 1:
+                self._set_monitor(mon_num)
+
+            # Next monitor
+            mon_num = mon_num + 1
+        return False
+
+    def _set_monitor(self, mon_num: int):
+        item = self.mss.monitors[mon_num]
+        self.monitor_number = mon_num
+        self.mon = item
+        self.screen_width = item['width']
+        self.screen_height = item['height']
+        self.aspect_ratio = self.screen_width / self.screen_height
+        self.screen_left = item['left']
+        self.screen_top = item['top']
+
+    def check_window(self) -> bool:
+        """ Checks if the ED window has moved or been resized, at most every window_check_interval seconds. If it
+        has, the monitor is found again and the regions are rescaled to the new screen size.
+        @return: True if the screen size or position changed.
+        """
+        now = time.monotonic()
+        if not self.using_screen or self.mss is None or now - self._last_window_check < self.window_check_interval:
+            return False
+
+        with self._window_lock:
+            if now - self._last_window_check < self.window_check_interval:
+                return False  # Checked by another thread while waiting for the lock
+            self._last_window_check = now
+
+            rect = self.get_elite_window_rect()
+            if rect is None or rect == self.ed_rect:
+                return False
+            self.ed_rect = rect
+
+            old = (self.screen_left, self.screen_top, self.screen_width, self.screen_height)
+            self.mons = self.mss.monitors
+            self._find_monitor()
+            if (self.screen_left, self.screen_top, self.screen_width, self.screen_height) == old:
+                return False
+
+            logger.info(f'Elite Dangerous window changed to {self.screen_width}x{self.screen_height} at '
+                        f'{self.screen_left}, {self.screen_top}.')
+            self.update_scale()
+            self.regions.resize(self.screen_width, self.screen_height)
+            return True
+
+    def _monitor_rect(self, x_left=0, y_top=0, x_right=None, y_bot=None) -> dict:
+        """ The mss monitor dict of a rect in pixels of the ED screen, the full screen by default. Read under the
+        window lock, so the monitor and size are from the same check_window().
+        """
+        with self._window_lock:
+            x_right = self.screen_width if x_right is None else x_right
+            y_bot = self.screen_height if y_bot is None else y_bot
+            return {
+                "top": self.mon["top"] + int(y_top),
+                "left": self.mon["left"] + int(x_left),
+                "width": int(x_right - x_left),
+                "height": int(y_bot - y_top),
+                "mon": self.monitor_number,
+            }
+
+    def update_scale(self):
+        """ Sets the template scale for the screen size from the scales table. """
         # try to find the resolution/scale values in table
         # if not, then take current screen size and divide it out by 3440 x1440
         try:
@@ -180,22 +418,14 @@ class Screen:
             # if we don't have a definition for the resolution then use calculation
             self.scaleX = self.screen_width / 3440.0
             self.scaleY = self.screen_height / 1440.0
-            
-        # if the calibration scale values are not -1, then use those regardless of above
-        # if self.scales['Calibrated'][0] != -1.0:
-        #     self.scaleX = self.scales['Calibrated'][0]
-        # if self.scales['Calibrated'][1] != -1.0:
-        #     self.scaleY = self.scales['Calibrated'][1]
-        
-        logger.debug('screen size: w='+str(self.screen_width)+" h="+str(self.screen_height))
-        logger.debug('screen position: x='+str(self.screen_left)+" y="+str(self.screen_top))
-        logger.debug('Default scale X, Y: ' + str(self.scaleX) + ", " + str(self.scaleY))
 
     @staticmethod
     def get_elite_window_rect() -> typing.Tuple[int, int, int, int] | None:
         """ Gets the ED window rectangle.
         Returns (left, top, right, bottom) or None.
         """
+        if win32gui is None:
+            return None
         hwnd = win32gui.FindWindow(None, elite_dangerous_window)
         if hwnd:
             rect = win32gui.GetWindowRect(hwnd)
@@ -207,6 +437,8 @@ class Screen:
     def elite_window_exists() -> bool:
         """ Does the ED Client Window exist (i.e. is ED running)
         """
+        if win32gui is None:
+            return False
         hwnd = win32gui.FindWindow(None, elite_dangerous_window)
         if hwnd:
             return True
@@ -239,11 +471,33 @@ class Screen:
     def get_screen_region(self, rect, rgb=True):
         """ Gets the screen region. Should be BGR only for CV2.
         @param rect: Reg defines a box in pixels.
-        @param rgb: Returns RGB when true, else BGR when false.
+        @param rgb: Returns RGB when true, else the native BGRA when false.
         """
+        frame = self._get_shared_frame()
+        if frame is not None:
+            image = frame.region(rect)
+            if rgb:
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            return image
+
         image = self.get_screen(int(rect[0]), int(rect[1]), int(rect[2]), int(rect[3]), rgb)
         return image
 
+    def get_region(self, name: str, rgb=True):
+        """ Gets a named region (see RegionRegistry). From a shared frame this is a single slice with the
+        precomputed slices of the region, else the region is grabbed.
+        @param name: The region name, i.e. 'Screen_Regions.sun'.
+        @param rgb: Returns RGB when true, else the native BGRA when false.
+        """
+        frame = self._get_shared_frame()
+        if frame is not None:
+            image = frame.image[self.regions.slices(name)]
+            if rgb:
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            return image
+
+        return self.get_screen_region(self.regions.rect(name), rgb)
+
     def get_screen(self, x_left, y_top, x_right, y_bot, rgb=True):    # if absolute need to scale??
         """ Get screen from co-ords in pixels. Should be BGR only for CV2.
         Returns the captured image, or None if capture failed (empty grab, no monitor, etc.).
@@ -252,15 +506,14 @@ class Screen:
         @param y_top:
         @param x_right:
         @param y_bot:
-        @param rgb: Returns RGB when true, else BGR when false.
+        @param rgb: Returns RGB when true, else the native BGRA when false.
         """
-        monitor = {
-            "top": self.mon["top"] + int(y_top),
-            "left": self.mon["left"] + int(x_left),
-            "width": int(x_right - x_left),
-            "height": int(y_bot - y_top),
-            "mon": self.monitor_number,
-        }
+        if not self.using_screen:
+            return self._crop_screen_image(x_left, y_top, x_right, y_bot, rgb)
+
+        if not self.capture_running:
+            self.check_window()  # Else checked by the capture thread
+        monitor = self._monitor_rect(x_left, y_top, x_right, y_bot)
         try:
             image = array(self.mss.grab(monitor))
         except Exception as e:
@@ -276,7 +529,8 @@ class Screen:
             )
             return None
 
-        # TODO - mss.grab returns the image in BGR format, so no need to convert to RGB2BGR
+        # mss.grab returns the image in BGRA format. The RGB2BGR swap is kept for the callers whose colour ranges
+        # were calibrated against it, use get_screen_bgra() for the native buffer.
         if rgb:
             try:
                 image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
@@ -285,21 +539,34 @@ class Screen:
                 return None
         return image
         
+    def get_screen_bgra(self, x_left, y_top, x_right, y_bot):
+        """ Get screen from co-ords in pixels as the native BGRA buffer from mss, without any colour conversion.
+        Returns the captured image, or None if capture failed.
+        """
+        return self.get_screen(x_left, y_top, x_right, y_bot, rgb=False)
+
     def get_screen_rect_pct(self, rect):
         """ Grabs a screenshot and returns the selected region as an image.
         @param rect: A rect array ([L, T, R, B]) in percent (0.0 - 1.0)
-        @return: An image defined by the region, or None if capture failed.
+        @return: An image (BGR) defined by the region, or None if capture failed.
         """
         if self.using_screen:
             abs_rect = self.screen_rect_to_abs(rect)
-            image = self.get_screen(abs_rect[0], abs_rect[1], abs_rect[2], abs_rect[3])
+            frame = self._get_shared_frame()
+            if frame is not None:
+                image = frame.region_bgr(abs_rect)
+                if not image.flags.writeable:
+                    # A view of the shared frame, so give the caller its own copy
+                    image = image.copy()
+                return image
+
+            image = self.get_screen_bgra(abs_rect[0], abs_rect[1], abs_rect[2], abs_rect[3])
             if image is None:
                 return None
-            # TODO delete this line when COLOR_RGB2BGR is removed from get_screen()
             try:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                image = to_bgr(image)
             except cv2.error as e:
-                self._warn_capture_failure(f"cv2.cvtColor (BGR2RGB) failed: {e}")
+                self._warn_capture_failure(f"cv2.cvtColor (BGRA2BGR) failed: {e}")
                 return None
             return image
         else:
@@ -315,34 +582,30 @@ class Screen:
         @param rect: A rect array ([L, T, R, B]) in percent (0.0 - 1.0)
         @return: A rect array ([L, T, R, B]) in pixels
         """
-        return [
-            int(rect[0] * self.screen_width),
-            int(rect[1] * self.screen_height),
-            int(rect[2] * self.screen_width),
-            int(rect[3] * self.screen_height)
-        ]
+        return self.regions.pct_to_pix(rect)
 
     def screen_region_pct_to_pix(self, quad: Quad) -> Quad:
         """ Converts and array of real percentage screen values to int absolutes.
         @param quad: A rect array ([L, T, R, B]) in percent (0.0 - 1.0)
         @return: A rect array ([L, T, R, B]) in pixels
         """
-        q = copy(quad)
-        q.scale_from_origin(self.screen_width, self.screen_height)
-        return q
+        return Quad.from_array(quad.points * (self.screen_width, self.screen_height))
 
     def get_screen_full(self):
         """ Grabs a full screenshot and returns the image, or None if capture failed.
         """
         if self.using_screen:
-            image = self.get_screen(0, 0, self.screen_width, self.screen_height)
+            frame = self._get_shared_frame()
+            if frame is not None:
+                return frame.bgr.copy()
+
+            image = self.get_screen_bgra(0, 0, self.screen_width, self.screen_height)
             if image is None:
                 return None
-            # TODO delete this line when COLOR_RGB2BGR is removed from get_screen()
             try:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                image = to_bgr(image)
             except cv2.error as e:
-                self._warn_capture_failure(f"cv2.cvtColor (BGR2RGB) failed: {e}")
+                self._warn_capture_failure(f"cv2.cvtColor (BGRA2BGR) failed: {e}")
                 return None
             return image
         else:
@@ -351,6 +614,184 @@ class Screen:
 
             return self._screen_image
 
+    def get_frame(self, max_age: float | None = None) -> Frame | None:
+        """ Gets a frame of the full screen. The cached frame is returned if it is not older than max_age, else
+        a new frame is grabbed. Within a frame_tick() the frame of the tick is always returned.
+        @param max_age: The max age of the cached frame in seconds. Defaults to frame_max_age.
+        @return: The frame, or None if capture failed.
+        """
+        frame = getattr(self._tick, 'frame', None)
+        if frame is not None:
+            return frame
+
+        if self.capture_running:
+            # The capture thread keeps the ring up to date
+            frame = self.ring.latest() if self.ring is not None else None
+            if frame is not None:
+                return frame
+
+        if max_age is None:
+            max_age = self.frame_max_age
+
+        with self._frame_lock:
+            frame = self._frame
+            if frame is not None and frame.age <= max_age:
+                return frame
+
+            if self.using_screen:
+                image = self.get_screen_bgra(0, 0, self.screen_width, self.screen_height)
+                if image is None:
+                    return None
+                image.flags.writeable = False
+            else:
+                if self._screen_image is None:
+                    return None
+                image = self._screen_image
+
+            self._frame_id = self._frame_id + 1
+            self._frame = Frame(image, time.monotonic(), self._frame_id)
+            return self._frame
+
+    @contextmanager
+    def frame_tick(self, frame: Frame | None = None):
+        """ Grabs one frame and shares it with every capture made by this thread until the end of the tick, so all
+        the detectors in a tick read the same frame. Ticks may be nested, the outer tick's frame is used.
+        Usage:
+            with scr.frame_tick():
+                nav = ...
+                tar = ...
+        @param frame: The frame to use for the tick (i.e. from get_frame_newer_than()), else a frame is grabbed.
+        """
+        outer = getattr(self._tick, 'frame', None)
+        if outer is not None:
+            # Nested tick, use the outer frame
+            yield outer
+            return
+
+        if frame is None:
+            frame = self.get_frame()
+        self._tick.frame = frame
+        try:
+            yield frame
+        finally:
+            self._tick.frame = None
+
+    def _get_shared_frame(self) -> Frame | None:
+        """ Gets the frame to serve a capture from, or None if the capture should grab the screen directly.
+        A frame is shared within a frame_tick() or when caching is enabled with frame_max_age.
+        """
+        frame = getattr(self._tick, 'frame', None)
+        if frame is not None:
+            return frame
+
+        if self.frame_max_age > 0.0 or self.capture_running:
+            return self.get_frame()
+
+        return None
+
+    @property
+    def capture_running(self) -> bool:
+        """ True if the capture thread is running. """
+        return self._capture_thread is not None and self._capture_thread.is_alive()
+
+    def start_capture(self, fps: float, buffer_size: int = 8):
+        """ Starts the capture thread, which grabs the full screen into a ring buffer at the given rate. While it
+        is running all captures are served from the latest frame in the ring. If the thread is already running
+        the rate is updated.
+        @param fps: The capture rate in frames per second.
+        @param buffer_size: The number of frames held in the ring.
+        """
+        if fps <= 0.0:
+            self.stop_capture()
+            return
+
+        self._capture_fps = fps
+        if self.capture_running and buffer_size == self._capture_buffer_size:
+            return
+
+        self.stop_capture()
+        self._capture_buffer_size = buffer_size
+        self._capture_stop.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="ScreenCapture", daemon=True)
+        self._capture_thread.start()
+        logger.debug(f"Screen capture thread started at {fps} fps with {buffer_size} frame buffer.")
+
+    def stop_capture(self):
+        """ Stops the capture thread, if running. """
+        if self._capture_thread is None:
+            return
+
+        self._capture_stop.set()
+        self._capture_thread.join(timeout=2.0)
+        self._capture_thread = None
+        logger.debug("Screen capture thread stopped.")
+
+    def get_latest_frame(self) -> Frame | None:
+        """ Gets the latest frame from the capture thread, or a new grab if the thread is not running. """
+        if self.capture_running and self.ring is not None:
+            frame = self.ring.latest()
+            if frame is not None:
+                return frame
+        return self.get_frame(max_age=0.0)
+
+    def get_frame_newer_than(self, timestamp: float, timeout: float = 1.0) -> Frame | None:
+        """ Gets the first frame grabbed after the timestamp. With the capture thread running this waits for the
+        thread, else it waits until the timestamp and grabs a new frame.
+        @param timestamp: The time.monotonic() the frame must be newer than.
+        @param timeout: The max time to wait in seconds after the timestamp.
+        @return: The frame, or None if capture failed or timed out.
+        """
+        if self.capture_running and self.ring is not None:
+            deadline = max(time.monotonic(), timestamp) + timeout
+            while True:
+                ring = self.ring
+                frame = ring.newer_than(timestamp, max(0.0, deadline - time.monotonic()))
+                # A closed ring has been replaced (i.e. the screen size changed), so wait on the new ring
+                if frame is not None or not ring.closed or ring is self.ring or time.monotonic() >= deadline:
+                    return frame
+
+        delay = timestamp - time.monotonic()
+        if delay > 0.0:
+            time.sleep(delay)
+        return self.get_frame(max_age=0.0)
+
+    def _capture_loop(self):
+        """ The capture thread. Grabs the screen into the ring buffer at the capture rate until stopped.
+        Uses its own mss instance, as mss handles are per thread.
+        """
+        try:
+            sct = mss.mss()
+        except Exception as e:
+            logger.error(f"Screen capture thread could not start mss: {e}")
+            return
+
+        with sct:
+            while not self._capture_stop.is_set():
+                start = time.monotonic()
+                self.check_window()
+                monitor = self._monitor_rect()
+                try:
+                    shot = sct.grab(monitor)
+                    timestamp = time.monotonic()
+                    # View of the mss buffer, copied straight into the ring
+                    image = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                except Exception as e:
+                    self._warn_capture_failure(f"Capture thread mss.grab() raised {type(e).__name__}: {e}")
+                    image = None
+
+                if image is not None and image.size > 0:
+                    ring = self.ring
+                    if ring is None or ring.shape != image.shape or ring.size != self._capture_buffer_size:
+                        # (Re)allocate the ring for the screen size, then wake the readers waiting on the old ring
+                        self.ring = FrameRingBuffer(self._capture_buffer_size, image.shape)
+                        if ring is not None:
+                            ring.close()
+                    self.ring.write(image, timestamp)
+
+                # Wait for the next frame
+                elapsed = time.monotonic() - start
+                self._capture_stop.wait(max(0.0, 1.0 / self._capture_fps - elapsed))
+
     def set_screen_image(self, image):
         """ Use an image instead of a screen capture. Sets the image and also sets the
         screen width and height to the image properties.
@@ -358,6 +799,7 @@ class Screen:
         """
         self.using_screen = False
         self._screen_image = image
+        self._frame = None
 
         # Existing size
         h, w, ch = image.shape
@@ -367,6 +809,21 @@ class Screen:
         self.screen_height = h
         self.screen_left = 0
         self.screen_top = 0
+        self.regions.resize(w, h)
+
+    def _crop_screen_image(self, x_left, y_top, x_right, y_bot, rgb=True):
+        """ Crops the image set by set_screen_image() in place of a screen grab. The image is BGR, so it is returned
+        with the same channel order as get_screen().
+        """
+        if self._screen_image is None:
+            return None
+
+        image = self._screen_image[int(y_top):int(y_bot), int(x_left):int(x_right)]
+        if image.size == 0:
+            return None
+        if rgb:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return image
 
     def _warn_capture_failure(self, msg: str):
         """ Log a screen-capture failure, throttled so we do not flood the log when
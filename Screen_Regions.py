@@ -1,14 +1,20 @@
+from __future__ import annotations
+
 import json
 import os
+import threading
+import time
 from copy import copy
 from dataclasses import dataclass
 from typing import TypedDict
 
 import numpy as np
-from numpy import array, sum
+from numpy import array
 import cv2
 from datetime import datetime
 
+from Image_Templates import build_pyramid, match_pyramid
+
 """
 File:Screen_Regions.py    
 
@@ -22,6 +28,7 @@ Author: sumzer0@yahoo.com
 
 class Point:
     """Creates a point on a coordinate plane with values x and y."""
+    __slots__ = ('x', 'y')
 
     def __init__(self, x, y):
         """Defines x and y variables"""
@@ -54,85 +61,122 @@ class Point:
 class Quad:
     """ Represents a quadrilateral (a four-sided polygon that has four edges and four vertices).
     It can be classified into various types, such as squares, rectangles, trapezoids, and rhombuses.
+    The points are held in a (4, 2) float array 'points' as [[x1, y1], [x2, y2], [x3, y3], [x4, y4]], which the
+    transforms modify in place. copy() copies the array, so a copy can be transformed without changing the original.
     """
+    __slots__ = ('points',)
 
     def __init__(self, p1: Point = None, p2: Point = None, p3: Point = None, p4: Point = None):
-        self.pt1: Point = p1
-        self.pt2: Point = p2
-        self.pt3: Point = p3
-        self.pt4: Point = p4
+        self.points = np.array([[p.x, p.y] if p is not None else [0.0, 0.0] for p in (p1, p2, p3, p4)],
+                               dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, points):
+        """ Creates a quad from a (4, 2) array of points, which is used without copying if it is a float64 array. """
+        quad = cls.__new__(cls)
+        quad.points = np.asarray(points, dtype=np.float64).reshape(4, 2)
+        return quad
 
     @classmethod
     def from_list(cls, pt_list: [[float, float], [float, float], [float, float], [float, float]]):
         """ Creates a quad from a list of points as
         [[left, top], [right, top], [right, bottom], [left, bottom]]."""
-        return cls(Point.from_list(pt_list[0]), Point.from_list(pt_list[1]),
-                   Point.from_list(pt_list[2]), Point.from_list(pt_list[3]))
+        return cls.from_array(np.array(pt_list, dtype=np.float64))
 
     @classmethod
     def from_rect(cls, edge_list: [float, float, float, float]):
         """ Creates a quad from a list of edges i.e. [left, top, right, bottom] """
-        return cls(Point(edge_list[0], edge_list[1]), Point(edge_list[2], edge_list[1]),
-                   Point(edge_list[2], edge_list[3]), Point(edge_list[0], edge_list[3]))
+        left, top, right, bottom = edge_list
+        return cls.from_array(np.array([[left, top], [right, top], [right, bottom], [left, bottom]],
+                                       dtype=np.float64))
+
+    @property
+    def pt1(self) -> Point:
+        return Point(float(self.points[0, 0]), float(self.points[0, 1]))
+
+    @pt1.setter
+    def pt1(self, pt: Point):
+        self.points[0] = (pt.x, pt.y)
+
+    @property
+    def pt2(self) -> Point:
+        return Point(float(self.points[1, 0]), float(self.points[1, 1]))
+
+    @pt2.setter
+    def pt2(self, pt: Point):
+        self.points[1] = (pt.x, pt.y)
+
+    @property
+    def pt3(self) -> Point:
+        return Point(float(self.points[2, 0]), float(self.points[2, 1]))
+
+    @pt3.setter
+    def pt3(self, pt: Point):
+        self.points[2] = (pt.x, pt.y)
+
+    @property
+    def pt4(self) -> Point:
+        return Point(float(self.points[3, 0]), float(self.points[3, 1]))
+
+    @pt4.setter
+    def pt4(self, pt: Point):
+        self.points[3] = (pt.x, pt.y)
 
     def to_rect_list(self, round_dp: int = -1) -> [float, float, float, float]:
         """ Returns the bounds of the quadrilateral as a list of values [left, top, right, bottom].
         @param: round_dp: If >=0, the number of decimal places to round numbers to, otherwise no rounding.
         """
+        left, top = self.points.min(axis=0).tolist()
+        right, bottom = self.points.max(axis=0).tolist()
         if round_dp < 0:
-            return [self.left, self.top, self.right, self.bottom]
+            return [left, top, right, bottom]
         else:
-            return [round(self.left, round_dp), round(self.top, round_dp),
-                    round(self.right, round_dp), round(self.bottom, round_dp)]
+            return [round(left, round_dp), round(top, round_dp), round(right, round_dp), round(bottom, round_dp)]
 
     def to_list(self) -> [[float, float], [float, float], [float, float], [float, float]]:
         """ Returns the list of points of the quadrilateral as
         [[left, top], [right, top], [right, bottom], [left, bottom]]."""
-        return [self.pt1.to_list(), self.pt2.to_list(), self.pt3.to_list(), self.pt4.to_list()]
+        return self.points.tolist()
 
     @property
     def top_left(self) -> Point:
         """ Returns the top left point. """
-        pt = self.pt1
-        if self.pt2.x < pt.x and self.pt2.y < pt.y:
-            pt = self.pt2
-        if self.pt3.x < pt.x and self.pt3.y < pt.y:
-            pt = self.pt3
-        if self.pt4.x < pt.x and self.pt4.y < pt.y:
-            pt = self.pt4
-        return copy(pt)
+        pts = self.points.tolist()
+        pt = pts[0]
+        for p in pts[1:]:
+            if p[0] < pt[0] and p[1] < pt[1]:
+                pt = p
+        return Point(pt[0], pt[1])
 
     @property
     def bottom_right(self) -> Point:
         """ Returns the bottom right point. """
-        pt = self.pt1
-        if self.pt2.x > pt.x and self.pt2.y > pt.y:
-            pt = self.pt2
-        if self.pt3.x > pt.x and self.pt3.y > pt.y:
-            pt = self.pt3
-        if self.pt4.x > pt.x and self.pt4.y > pt.y:
-            pt = self.pt4
-        return copy(pt)
+        pts = self.points.tolist()
+        pt = pts[0]
+        for p in pts[1:]:
+            if p[0] > pt[0] and p[1] > pt[1]:
+                pt = p
+        return Point(pt[0], pt[1])
 
     @property
     def left(self) -> float:
         """ Returns the value of the left most point. """
-        return min(self.pt1.x, self.pt2.x, self.pt3.x, self.pt4.x)
+        return float(self.points[:, 0].min())
 
     @property
     def top(self) -> float:
         """ Returns the value of the top most point. """
-        return min(self.pt1.y, self.pt2.y, self.pt3.y, self.pt4.y)
+        return float(self.points[:, 1].min())
 
     @property
     def right(self) -> float:
         """ Returns the value of the right most point. """
-        return max(self.pt1.x, self.pt2.x, self.pt3.x, self.pt4.x)
+        return float(self.points[:, 0].max())
 
     @property
     def bottom(self) -> float:
         """ Returns the value of the bottom most point. """
-        return max(self.pt1.y, self.pt2.y, self.pt3.y, self.pt4.y)
+        return float(self.points[:, 1].max())
 
     @property
     def width(self):
@@ -148,12 +192,12 @@ class Quad:
     def bounds(self) -> (Point, Point):
         """ Returns the bounds of the quadrilateral as a rectangle defined by two points,
         the top-left and bottom-right."""
-        return Point(self.left, self.top), Point(self.right, self.bottom)
+        left, top, right, bottom = self.to_rect_list()
+        return Point(left, top), Point(right, bottom)
 
     @property
     def center(self) -> Point:
-        cx = (self.pt1.x + self.pt2.x + self.pt3.x + self.pt4.x) / 4
-        cy = (self.pt1.y + self.pt2.y + self.pt3.y + self.pt4.y) / 4
+        cx, cy = self.points.mean(axis=0).tolist()
         return Point(cx, cy)
 
     def scale(self, fx: float, fy: float):
@@ -161,22 +205,18 @@ class Quad:
         @param fy: Scaling in the Y direction.
         @param fx: Scaling in the X direction.
         """
-        center = self.center
-        self.pt1 = self._scale_point(self.pt1, center, fx, fy)
-        self.pt2 = self._scale_point(self.pt2, center, fx, fy)
-        self.pt3 = self._scale_point(self.pt3, center, fx, fy)
-        self.pt4 = self._scale_point(self.pt4, center, fx, fy)
+        center = self.points.mean(axis=0)
+        self.points -= center
+        self.points *= (fx, fy)
+        self.points += center
 
     def inflate(self, x: float, y: float):
         """ Scales the quad from the center.
         @param y: Scaling in the Y direction.
         @param x: Scaling in the X direction.
         """
-        center = self.center
-        self.pt1 = self._inflate_point(self.pt1, center, x, y)
-        self.pt2 = self._inflate_point(self.pt2, center, x, y)
-        self.pt3 = self._inflate_point(self.pt3, center, x, y)
-        self.pt4 = self._inflate_point(self.pt4, center, x, y)
+        # Points left of/above the center move out to the left/up
+        self.points += np.where(self.points < self.points.mean(axis=0), -1.0, 1.0) * (x, y)
 
     def crop(self, quad):
         """ Crops the quad as region specified by the % (0.0-1.0) inputs.
@@ -185,66 +225,232 @@ class Quad:
         Example: An input of [0.0, 0.0, 0.25, 0.25] returns the top left quarter of the quad.
         @param quad: A quad.
         """
-        new_l = (quad.left * self.width) + self.left
-        new_t = (quad.top * self.height) + self.top
-        new_r = (quad.right * self.width) + self.left
-        new_b = (quad.bottom * self.height) + self.top
-
-        self.pt1 = Point(new_l, new_t)
-        self.pt2 = Point(new_r, new_t)
-        self.pt3 = Point(new_r, new_b)
-        self.pt4 = Point(new_l, new_b)
+        left, top, right, bottom = self.to_rect_list()
+        new_l = (quad.left * (right - left)) + left
+        new_t = (quad.top * (bottom - top)) + top
+        new_r = (quad.right * (right - left)) + left
+        new_b = (quad.bottom * (bottom - top)) + top
+        self.points[:] = [[new_l, new_t], [new_r, new_t], [new_r, new_b], [new_l, new_b]]
 
     def scale_from_origin(self, fx: float, fy: float):
         """ Scales the quad from the origin (0,0).
         @param fy: Scaling in the Y direction.
         @param fx: Scaling in the X direction.
         """
-        origin = Point(0, 0)
-        self.pt1 = self._scale_point(self.pt1, origin, fx, fy)
-        self.pt2 = self._scale_point(self.pt2, origin, fx, fy)
-        self.pt3 = self._scale_point(self.pt3, origin, fx, fy)
-        self.pt4 = self._scale_point(self.pt4, origin, fx, fy)
+        self.points *= (fx, fy)
 
     def offset(self, dx: float, dy: float):
         """ Offsets (moves) the quad by the given amount.
         @param dx: The amount to move in the x direction.
         @param dy: The amount to move in the y direction.
         """
-        self.pt1 = self._offset_point(self.pt1, dx, dy)
-        self.pt2 = self._offset_point(self.pt2, dx, dy)
-        self.pt3 = self._offset_point(self.pt3, dx, dy)
-        self.pt4 = self._offset_point(self.pt4, dx, dy)
+        self.points += (dx, dy)
 
-    @staticmethod
-    def _scale_point(pt: Point, center: Point, fx: float, fy: float) -> Point:
-        return Point(
-            center.x + (pt.x - center.x) * fx,
-            center.y + (pt.y - center.y) * fy
-        )
+    def frozen(self):
+        """ Returns an immutable copy of the quad. """
+        return FrozenQuad.from_array(self.points.copy())
 
-    @staticmethod
-    def _inflate_point(pt: Point, center: Point, x: float, y: float) -> Point:
-        x1 = x
-        y1 = y
-        if pt.x < center.x:
-            x1 = -x
-        if pt.y < center.y:
-            y1 = -y
-        return Point(pt.x + x1, pt.y + y1)
-
-    @staticmethod
-    def _offset_point(pt: Point, dx: float, dy: float) -> Point:
-        """ Offsets the point.
-        Using this instead of calling offset on the point directly allows shallow copy of the quad."""
-        return Point(pt.x + dx, pt.y + dy)
+    def __copy__(self):
+        return Quad.from_array(self.points.copy())
 
     def __str__(self):
+        pts = self.points.tolist()
         return (f"Quadrilateral:\n"
-                f" pt1: ({self.pt1.x}, {self.pt1.y})\n"
-                f" pt2: ({self.pt2.x}, {self.pt2.y})\n"
-                f" pt3: ({self.pt3.x}, {self.pt3.y})\n"
-                f" pt4: ({self.pt4.x}, {self.pt4.y})")
+                f" pt1: ({pts[0][0]}, {pts[0][1]})\n"
+                f" pt2: ({pts[1][0]}, {pts[1][1]})\n"
+                f" pt3: ({pts[2][0]}, {pts[2][1]})\n"
+                f" pt4: ({pts[3][0]}, {pts[3][1]})")
+
+
+class FrozenQuad(Quad):
+    """ An immutable quad, for quads that are shared (i.e. calibrated regions). The transforms raise a TypeError,
+    copy() returns a (mutable) Quad to transform instead.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_array(cls, points):
+        """ Creates a frozen quad from a (4, 2) array of points. The quad holds a read-only view of a float64 array
+        rather than a copy, so the array must not be changed afterwards. """
+        quad = super().from_array(points)
+        if quad.points.flags.writeable:
+            quad.points = quad.points.view()
+            quad.points.flags.writeable = False
+        return quad
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenQuad can not be modified, copy() it first.")
+
+    scale = inflate = crop = scale_from_origin = offset = _immutable
+    pt1 = Quad.pt1.setter(_immutable)
+    pt2 = Quad.pt2.setter(_immutable)
+    pt3 = Quad.pt3.setter(_immutable)
+    pt4 = Quad.pt4.setter(_immutable)
+
+    def frozen(self):
+        return self
+
+
+class QuadArray:
+    """ A batch of quads in one (N, 4, 2) float array, to transform many quads (i.e. all the detected boxes or
+    the calibrated regions) in single numpy calls. The transforms modify the array in place.
+    """
+    __slots__ = ('points',)
+
+    def __init__(self, points=None):
+        """
+        @param points: The (N, 4, 2) array of points, or None for no quads.
+        """
+        self.points = (np.zeros((0, 4, 2), dtype=np.float64) if points is None else
+                       np.asarray(points, dtype=np.float64).reshape(-1, 4, 2))
+
+    @classmethod
+    def from_quads(cls, quads: list[Quad]):
+        return cls(np.stack([q.points for q in quads]) if quads else None)
+
+    @classmethod
+    def from_rects(cls, rects):
+        """ Creates the quads from a list or (N, 4) array of [left, top, right, bottom]. """
+        r = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        return cls(np.stack([r[:, [0, 1]], r[:, [2, 1]], r[:, [2, 3]], r[:, [0, 3]]], axis=1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, index: int) -> Quad:
+        """ A copy of the quad at the index. """
+        return Quad.from_array(self.points[index].copy())
+
+    def to_quads(self) -> list[Quad]:
+        return [Quad.from_array(p) for p in self.points.copy()]
+
+    def to_rects(self):
+        """ The bounds of the quads as an (N, 4) array of [left, top, right, bottom]. """
+        return np.concatenate([self.points.min(axis=1), self.points.max(axis=1)], axis=1)
+
+    @property
+    def centers(self):
+        """ The centers of the quads as an (N, 2) array. """
+        return self.points.mean(axis=1)
+
+    def scale(self, fx: float, fy: float):
+        """ Scales each quad from its center. """
+        centers = self.centers[:, np.newaxis, :]
+        self.points -= centers
+        self.points *= (fx, fy)
+        self.points += centers
+
+    def inflate(self, x: float, y: float):
+        """ Inflates each quad from its center, as Quad.inflate(). """
+        self.points += np.where(self.points < self.centers[:, np.newaxis, :], -1.0, 1.0) * (x, y)
+
+    def scale_from_origin(self, fx: float, fy: float):
+        self.points *= (fx, fy)
+
+    def offset(self, dx: float, dy: float):
+        self.points += (dx, dy)
+
+    def perspective_transform(self, transform):
+        """ Transforms all the quads with a perspective transform matrix (i.e. from cv2.getPerspectiveTransform).
+        @return: A new QuadArray of the transformed quads.
+        """
+        if len(self.points) == 0:
+            return QuadArray()
+        dst = cv2.perspectiveTransform(self.points.reshape(-1, 1, 2).astype(np.float32), transform)
+        return QuadArray(dst.reshape(-1, 4, 2))
+
+
+class RegionTable:
+    """ An immutable snapshot of the region pixel rects for one screen size. Rects of unnamed percent rects (see
+    RegionRegistry.pct_to_pix) are added to 'by_pct' as they are first used. """
+    __slots__ = ('width', 'height', 'rects', 'slices', 'by_pct')
+
+    def __init__(self, width: int, height: int, rects: dict[str, list[int]]):
+        self.width = width
+        self.height = height
+        self.rects = rects  # Pixel rect [L, T, R, B] by region name
+        self.slices = {name: (slice(r[1], r[3]), slice(r[0], r[2])) for name, r in rects.items()}
+        self.by_pct: dict[tuple, list[int]] = {}
+
+
+class RegionRegistry:
+    """ Holds every named screen region (in percent of the screen) with its pixel rect and array slices
+    precomputed for the current screen size, so a capture is a single slice of the frame. The pixel rects are
+    recomputed together when the screen size changes (see Screen.check_window()), and the new table replaces the
+    old one in a single assignment, so a reader always sees a consistent set of rects.
+    Regions are named '<prefix>.<key>' as in the calibration file, i.e. 'EDNavigationPanel.panel_bounds1'.
+    """
+
+    def __init__(self, width: int = 0, height: int = 0):
+        self._pct: dict[str, tuple[float, float, float, float]] = {}
+        self._lock = threading.Lock()  # Serialises the writers, readers use the current table
+        self._listeners = []
+        self.table = RegionTable(width, height, {})
+
+    def register(self, name: str, rect_pct):
+        """ Adds or updates a region.
+        @param name: The region name.
+        @param rect_pct: The rect [L, T, R, B] in percent (0.0 - 1.0).
+        """
+        self.register_regions('', {name: {'rect': rect_pct}})
+
+    def register_regions(self, prefix: str, reg: dict):
+        """ Adds or updates the regions of a class.
+        @param prefix: The class prefix, i.e. 'EDNavigationPanel', or '' to use the keys as is.
+        @param reg: The regions dictionary, i.e. {'panel_bounds1': {'rect': [0.0, 0.2, 0.7, 0.35]}, ...}.
+        """
+        with self._lock:
+            for key, value in reg.items():
+                if 'rect' in value:
+                    self._pct[f"{prefix}.{key}" if prefix else key] = tuple(value['rect'])
+            self._rebuild(self.table.width, self.table.height)
+
+    def resize(self, width: int, height: int):
+        """ Recomputes all the pixel rects for a new screen size and notifies the listeners. """
+        with self._lock:
+            if width == self.table.width and height == self.table.height:
+                return
+            self._rebuild(width, height)
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, func):
+        """ Adds a function called (with no arguments) after the screen size changes, for the classes that derive
+        their own values from the screen size. """
+        self._listeners.append(func)
+
+    def _rebuild(self, width: int, height: int):
+        names = list(self._pct.keys())
+        if names:
+            pix = (np.array([self._pct[n] for n in names], dtype=np.float64) *
+                   (width, height, width, height)).astype(int).tolist()
+        else:
+            pix = []
+        self.table = RegionTable(width, height, dict(zip(names, pix)))
+
+    def rect(self, name: str) -> list[int]:
+        """ The pixel rect [L, T, R, B] of a region. """
+        return self.table.rects[name]
+
+    def slices(self, name: str) -> tuple[slice, slice]:
+        """ The (y, x) slices of a region, i.e. frame.image[registry.slices('Screen_Regions.sun')]. """
+        return self.table.slices[name]
+
+    def pct(self, name: str) -> tuple[float, float, float, float]:
+        """ The rect [L, T, R, B] of a region in percent. """
+        return self._pct[name]
+
+    def pct_to_pix(self, rect_pct) -> list[int]:
+        """ Converts a rect in percent to pixels for the current screen size. The result is cached in the table,
+        so repeated captures of the same rect do not redo the conversion. """
+        table = self.table
+        key = tuple(rect_pct)
+        pix = table.by_pct.get(key)
+        if pix is None:
+            pix = [int(key[0] * table.width), int(key[1] * table.height),
+                   int(key[2] * table.width), int(key[3] * table.height)]
+            table.by_pct[key] = pix
+        return pix
 
 
 def load_calibrated_regions(prefix: str, reg: dict):
@@ -491,17 +697,93 @@ def load_default_calib_data() -> dict[str, MyRegion]:
     return default_calib_data
 
 
+@dataclass
+class MatchStats:
+    """ Statistics of the x3 (HSV) template matches. A hit is a match found by the window search around the last
+    match location, on the last winning channel. """
+    calls: int = 0
+    hits: int = 0
+    full_time: float = 0.0  # Total time of the full searches in secs
+    fast_time: float = 0.0  # Total time of the window searches (hit or miss) in secs
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.calls if self.calls > 0 else 0.0
+
+    @property
+    def time_saved(self) -> float:
+        """ Estimated time saved in secs, compared to running the full search on every call. """
+        full = self.calls - self.hits
+        if full == 0:
+            return 0.0
+        return self.calls * (self.full_time / full) - self.full_time - self.fast_time
+
+    def __str__(self):
+        return (f"x3 matches: {self.calls}, hit rate: {self.hit_rate:.1%}, "
+                f"time saved: {round(self.time_saved * 1000, 1)}ms")
+
+
+@dataclass
+class SunMeasure:
+    """ The bright (sun) pixels of the sun region. """
+    pct: float = 0.0  # Percent of the region that is bright
+    centroid: tuple[float, float] | None = None  # Centroid (x, y) of the bright pixels, 0.0-1.0 of the region from
+    # the top left, or None if no pixels are bright
+
+
+class RegionFilter:
+    """ The filter pipeline of a region, for one region size. Owns the CLAHE instance and the output buffers, so
+    a filter call writes to the same preallocated arrays (via the OpenCV dst= parameters) every frame. The
+    returned image is the filter's buffer, valid until the next call, so copy it to keep it. """
+
+    def __init__(self, shape):
+        """
+        @param shape: The shape of the region image (height, width, channels).
+        """
+        self.shape = shape
+        h, w = shape[:2]
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self.gray = np.empty((h, w), np.uint8)
+        self.hsv = np.empty((h, w, 3), np.uint8)
+        self.out = np.empty((h, w), np.uint8)
+
+    def equalize(self, image):
+        """ Grayscale histogram equalization, as Screen_Regions.equalize(). """
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.clahe.apply(self.gray, dst=self.out)
+
+    def filter_by_color(self, image, color_range):
+        """ Color range filter, as Screen_Regions.filter_by_color(). """
+        cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        return cv2.inRange(self.hsv, color_range[0], color_range[1], dst=self.out)
+
+    def filter_sun(self, image, thresh):
+        """ Brightness threshold, as Screen_Regions.filter_sun(). """
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.threshold(self.gray, thresh, 255, cv2.THRESH_BINARY, dst=self.out)
+        return self.out
+
+
 class Screen_Regions:
     def __init__(self, screen, templ):
         self.screen = screen
         self.templates = templ
 
+        # Filter pipelines by region name, per thread as the buffers are reused (see RegionFilter)
+        self._filters = threading.local()
+
+        # x3 matching. The last winning channel and location of each region/template is searched first, per thread
+        # as the window hit's match mask is a reused buffer.
+        self.x3_stats = MatchStats()
+        self._x3 = threading.local()
+
         # Define the thresholds for template matching to be consistent throughout the program
         self.compass_match_thresh = 0.50
         self.navpoint_match_thresh = 0.8
         self.target_thresh = 0.50
         self.target_occluded_thresh = 0.55
         self.sun_threshold = 125
+        self.sun_downsample = 0.25  # Scale of the sun region for the sun measure, 1.0 for full resolution
         self.disengage_thresh = 0.35
 
         # array is in HSV order which represents color ranges for filtering
@@ -551,22 +833,23 @@ class Screen_Regions:
         # Load custom regions from file
         load_calibrated_regions('Screen_Regions', self.reg_pct)
 
-        # convert rect from percent of screen into pixel location, calc the width/height of the area
-        for i, key in enumerate(self.reg):
-            # Take the percentage values
-            xx = self.reg_pct[key]['rect']
-            # Convert to pixels
-            self.reg[key]['rect'] = [int(xx[0] * screen.screen_width), int(xx[1] * screen.screen_height),
-                                     int(xx[2] * screen.screen_width), int(xx[3] * screen.screen_height)]
-            self.reg[key]['width'] = self.reg[key]['rect'][2] - self.reg[key]['rect'][0]
-            self.reg[key]['height'] = self.reg[key]['rect'][3] - self.reg[key]['rect'][1]
+        # Register the regions, so the pixel rects are recomputed when the screen size changes
+        screen.regions.register_regions('Screen_Regions', self.reg_pct)
+        screen.regions.add_listener(self.update_rects)
+        self.update_rects()
 
-        pass
+    def update_rects(self):
+        """ Sets the pixel rect and the width/height of each region from the region registry. """
+        for key in self.reg:
+            rect = self.screen.regions.rect(f'Screen_Regions.{key}')
+            self.reg[key]['rect'] = rect
+            self.reg[key]['width'] = rect[2] - rect[0]
+            self.reg[key]['height'] = rect[3] - rect[1]
 
     def capture_region(self, screen, region_name, inv_col=True):
         """ Just grab the screen based on the region name/rect.
         Returns an unfiltered image. """
-        return screen.get_screen_region(self.reg[region_name]['rect'], inv_col)
+        return screen.get_region(f'Screen_Regions.{region_name}', inv_col)
 
     def capture_region_percent(self, screen, region_name):
         """ Just grab the screen based on the region name in %.
@@ -575,18 +858,42 @@ class Screen_Regions:
 
     def capture_region_filtered(self, screen, region_name, inv_col=True):
         """ Grab screen region and call its filter routine.
+        The equalize, color and sun filters write to the region's preallocated buffers (see RegionFilter). These are
+        per thread, so the image is only valid until the next call for the region on the same thread. Copy it to
+        keep it, draw on it or pass it to another thread (debug_sink.write() takes its own copy).
         Returns the filtered image. """
-        scr = screen.get_screen_region(self.reg[region_name]['rect'], inv_col)
-        if self.reg[region_name]['filterCB'] is None:
+        scr = screen.get_region(f'Screen_Regions.{region_name}', inv_col)
+        filter_cb = self.reg[region_name]['filterCB']
+        if filter_cb is None:
             # return the screen region untouched in BGRA format.
             return scr
-        else:
-            # return the screen region in the format returned by the filter.
-            return self.reg[region_name]['filterCB'](scr, self.reg[region_name]['filter'])
 
-    def match_template_in_region(self, region_name, templ_name, inv_col=True):
+        # return the screen region in the format returned by the filter, in the region's filter buffers.
+        region_filter = self.region_filter(region_name, scr.shape)
+        if filter_cb == self.equalize:
+            return region_filter.equalize(scr)
+        if filter_cb == self.filter_by_color:
+            return region_filter.filter_by_color(scr, self.reg[region_name]['filter'])
+        if filter_cb == self.filter_sun:
+            return region_filter.filter_sun(scr, self.sun_threshold)
+        return filter_cb(scr, self.reg[region_name]['filter'])
+
+    def region_filter(self, region_name, shape) -> RegionFilter:
+        """ Gets the filter pipeline of the region for this thread, rebuilt if the region size has changed. """
+        filters = self._filters.__dict__.setdefault('by_region', {})
+        region_filter = filters.get(region_name)
+        if region_filter is None or region_filter.shape != shape:
+            region_filter = RegionFilter(shape)
+            filters[region_name] = region_filter
+        return region_filter
+
+    def match_template_in_region(self, region_name, templ_name, inv_col=True, pyramid=False):
         """ Attempt to match the given template in the given region which is filtered using the region filter.
-        Returns the filtered image, detail of match and the match mask. """
+        @param pyramid: Match coarse-to-fine (see Image_Templates.match_pyramid), faster on large regions. The match
+        mask is then of the lowest pyramid level, not the region. Not suited to thin filtered masks, as the true peak
+        can be lost when downsampled.
+        Returns the filtered image (the region's filter buffer, see capture_region_filtered()), detail of match and
+        the match mask. """
         img_region = self.capture_region_filtered(self.screen, region_name,
                                                   inv_col)  # which would call, reg.capture_region('compass') and apply defined filter
         img_templ = self.templates.template[templ_name]['image']
@@ -596,56 +903,84 @@ class Screen_Regions:
         # cv2.imwrite(f'test/match/{templ_name} {x} region.png', img_region)
         # cv2.imwrite(f'test/match/{templ_name} {x} templ.png', img_templ)
 
-        match = cv2.matchTemplate(img_region, img_templ, cv2.TM_CCOEFF_NORMED)
-        (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(match)
-        return img_region, (minVal, maxVal, minLoc, maxLoc), match
+        if pyramid:
+            return img_region, *self._match_template_pyramid(img_region, templ_name)
+        return img_region, *self._match_template_full(img_region, templ_name)
 
-    def match_template_in_region_x3(self, region_name, templ_name, inv_col=True):
+    def match_template_in_region_x3(self, region_name, templ_name, inv_col=True, thresh=None):
         """ Attempt to match the given template in the given region which is unfiltered.
         The region's image is split into separate HSV channels, each channel tested and the best result kept.
+        @param thresh: The match threshold of the caller. If given, the last match's channel is searched first in
+        a window around the last match location, see match_template_in_image_x3().
         Returns the image, detail of match and the match mask. """
-        img_region = self.screen.get_screen_region(self.reg[region_name]['rect'], rgb=False)
-        templ = self.templates.template[templ_name]['image']
+        img_region = self.screen.get_region(f'Screen_Regions.{region_name}', rgb=False)
+        return self._match_x3(region_name, img_region, templ_name, thresh)
 
-        # Convert to HSV and split.
-        img_hsv = cv2.cvtColor(img_region, cv2.COLOR_BGR2HSV)
-        h, s, v = cv2.split(img_hsv)
-        # hsv_comb = np.concatenate((h, s, v), axis=1)  # Combine 3 images
-        # cv2.imshow("Split HSV", hsv_comb)
-
-        # Perform matches
-        match_h = cv2.matchTemplate(h, templ, cv2.TM_CCOEFF_NORMED)
-        match_s = cv2.matchTemplate(s, templ, cv2.TM_CCOEFF_NORMED)
-        match_v = cv2.matchTemplate(v, templ, cv2.TM_CCOEFF_NORMED)
-        (minVal_h, maxVal_h, minLoc_h, maxLoc_h) = cv2.minMaxLoc(match_h)
-        (minVal_s, maxVal_s, minLoc_s, maxLoc_s) = cv2.minMaxLoc(match_s)
-        (minVal_v, maxVal_v, minLoc_v, maxLoc_v) = cv2.minMaxLoc(match_v)
-        # match_comb = np.concatenate((match_h, match_s, match_v), axis=1)  # Combine 3 images
-        # cv2.imshow("Split Matches", match_comb)
-
-        # Get best result
-        # V is likely the best match, so check it first
-        if maxVal_v > maxVal_s and maxVal_v > maxVal_h:
-            return img_region, (minVal_v, maxVal_v, minLoc_v, maxLoc_v), match_v
-        # S is likely the 2nd best match, so check it
-        if maxVal_s > maxVal_h:
-            return img_region, (minVal_s, maxVal_s, minLoc_s, maxLoc_s), match_s
-        # H must be the best match
-        return img_region, (minVal_h, maxVal_h, minLoc_h, maxLoc_h), match_h
-
-    def match_template_in_image(self, image, template):
+    def match_template_in_image(self, image, template, pyramid=False):
         """ Attempt to match the given template in the (unfiltered) image.
+        @param pyramid: Match coarse-to-fine, as match_template_in_region().
         Returns the original image, detail of match and the match mask. """
-        match = cv2.matchTemplate(image, self.templates.template[template]['image'], cv2.TM_CCOEFF_NORMED)
-        (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(match)
-        return image, (minVal, maxVal, minLoc, maxLoc), match
-
-    def match_template_in_image_x3(self, image, templ_name):
+        if pyramid:
+            return image, *self._match_template_pyramid(image, template)
+        return image, *self._match_template_full(image, template)
+
+    def _match_template_full(self, image, templ_name):
+        """ Full resolution match of the template in the image.
+        Returns the detail of match and the match mask, or no match (0.0) and an empty mask if the image is smaller
+        than the template. """
+        img_templ = self.templates.template[templ_name]['image']
+        if image.shape[0] < img_templ.shape[0] or image.shape[1] < img_templ.shape[1]:
+            return (0.0, 0.0, (0, 0), (0, 0)), np.zeros((0, 0), np.float32)
+        match = cv2.matchTemplate(image, img_templ, cv2.TM_CCOEFF_NORMED)
+        return cv2.minMaxLoc(match), match
+
+    def _match_template_pyramid(self, image, templ_name):
+        """ Coarse-to-fine match of the template in the image, using the template's precomputed pyramid.
+        Returns the detail of match and the match mask. """
+        templ_pyramid = self.templates.template[templ_name]['pyramid']
+        return match_pyramid(build_pyramid(image, len(templ_pyramid) - 1), templ_pyramid)
+
+    def match_template_in_image_x3(self, image, templ_name, thresh=None):
         """ Attempt to match the given template in the (unfiltered) image.
         The image is split into separate HSV channels, each channel tested and the best result kept.
+        @param thresh: The match threshold of the caller. If given, the last match's channel is searched first in
+        a window of one template size around the last match location, and the full search on all three channels is
+        only done if that window match is below the threshold. On a window hit the match mask is a buffer reused by
+        the next window hit of the thread, so copy it to keep it.
         Returns the original image, detail of match and the match mask. """
+        return self._match_x3(None, image, templ_name, thresh)
+
+    def _match_x3(self, key, image, templ_name, thresh):
+        """ The x3 match of match_template_in_image_x3(), remembering the last match of each image source.
+        @param key: Identifies the source of the image, i.e. the region name, or None for a given image.
+        Returns the image, detail of match and the match mask. """
         templ = self.templates.template[templ_name]['image']
+        if thresh is None:
+            return image, *self._match_x3_full(image, templ)[1:]
+
+        self.x3_stats.calls += 1
+        last_by_key = self._x3.__dict__.setdefault('last', {})
+        last = last_by_key.get((key, templ_name))
+        if last is not None and last[0] == image.shape and last[1] == templ.shape:
+            start = time.perf_counter()
+            res = self._match_x3_window(image, templ, last[2], last[3], thresh)
+            self.x3_stats.fast_time += time.perf_counter() - start
+            if res is not None:
+                self.x3_stats.hits += 1
+                # Follow the match as it moves
+                last_by_key[(key, templ_name)] = (image.shape, templ.shape, last[2], res[0][3])
+                return image, *res
+
+        start = time.perf_counter()
+        channel, detail, match = self._match_x3_full(image, templ)
+        self.x3_stats.full_time += time.perf_counter() - start
+        last_by_key[(key, templ_name)] = (image.shape, templ.shape, channel, detail[3])
+        return image, detail, match
 
+    @staticmethod
+    def _match_x3_full(image, templ):
+        """ Matches the template on all the HSV channels of the image.
+        Returns the winning channel (0=H, 1=S, 2=V), the detail of match and the match mask. """
         # Convert to HSV and split.
         img_hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         h, s, v = cv2.split(img_hsv)
@@ -665,12 +1000,44 @@ class Screen_Regions:
         # Get best result
         # V is likely the best match, so check it first
         if maxVal_v > maxVal_s and maxVal_v > maxVal_h:
-            return image, (minVal_v, maxVal_v, minLoc_v, maxLoc_v), match_v
+            return 2, (minVal_v, maxVal_v, minLoc_v, maxLoc_v), match_v
         # S is likely the 2nd best match, so check it
         if maxVal_s > maxVal_h:
-            return image, (minVal_s, maxVal_s, minLoc_s, maxLoc_s), match_s
+            return 1, (minVal_s, maxVal_s, minLoc_s, maxLoc_s), match_s
         # H must be the best match
-        return image, (minVal_h, maxVal_h, minLoc_h, maxLoc_h), match_h
+        return 0, (minVal_h, maxVal_h, minLoc_h, maxLoc_h), match_h
+
+    def _match_x3_window(self, image, templ, channel: int, loc, thresh):
+        """ Matches the template on one HSV channel in a window around the location (top left of the last match).
+        Returns the detail of match and the match mask (the size of a full match, with the window's matches in
+        place and the window's min elsewhere), or None if the match is below the threshold. """
+        t_h, t_w = templ.shape[:2]
+        img_h, img_w = image.shape[:2]
+        # Search up to a template size away from the last location
+        x1 = max(0, loc[0] - t_w)
+        y1 = max(0, loc[1] - t_h)
+        x2 = min(img_w, loc[0] + 2 * t_w)
+        y2 = min(img_h, loc[1] + 2 * t_h)
+        if x2 - x1 < t_w or y2 - y1 < t_h:
+            return None
+
+        window = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGR2HSV)
+        match_win = cv2.matchTemplate(window[:, :, channel], templ, cv2.TM_CCOEFF_NORMED)
+        (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(match_win)
+        if maxVal < thresh:
+            return None
+
+        # Full size match mask, so it can be used as from the full search. Reuse the thread's buffer of this size.
+        shape = (img_h - t_h + 1, img_w - t_w + 1)
+        masks = self._x3.__dict__.setdefault('masks', {})
+        match = masks.get(shape)
+        if match is None:
+            match = masks[shape] = np.empty(shape, np.float32)
+        match.fill(minVal)
+        match[y1:y1 + match_win.shape[0], x1:x1 + match_win.shape[1]] = match_win
+        minLoc = (minLoc[0] + x1, minLoc[1] + y1)
+        maxLoc = (maxLoc[0] + x1, maxLoc[1] + y1)
+        return (minVal, maxVal, minLoc, maxLoc), match
 
     def equalize(self, image=None, noOp=None):
         # Load the image in greyscale
@@ -713,13 +1080,22 @@ class Screen_Regions:
 
         return blackAndWhiteImage
 
+    def sun_measure(self, screen) -> SunMeasure:
+        """ Measures the bright pixels of the sun region on a downsampled luminance image.
+        @return: The percent of the region that is bright and the centroid of the bright pixels. """
+        image = screen.get_region('Screen_Regions.sun')
+        if self.sun_downsample != 1.0:
+            image = cv2.resize(image, (0, 0), fx=self.sun_downsample, fy=self.sun_downsample,
+                               interpolation=cv2.INTER_AREA)
+        mask = self.region_filter('sun_measure', image.shape).filter_sun(image, self.sun_threshold)
+
+        bright = cv2.countNonZero(mask)
+        if bright == 0:
+            return SunMeasure()
+        m = cv2.moments(mask, binaryImage=True)
+        h, w = mask.shape[:2]
+        return SunMeasure(pct=bright * 100 / mask.size, centroid=(m['m10'] / m['m00'] / w, m['m01'] / m['m00'] / h))
+
     # percent the image is white
     def sun_percent(self, screen):
-        blackAndWhiteImage = self.capture_region_filtered(screen, 'sun')
-
-        wht = sum(blackAndWhiteImage == 255)
-        blk = sum(blackAndWhiteImage != 255)
-
-        result = int((wht / (wht + blk)) * 100)
-
-        return result
+        return int(self.sun_measure(screen).pct)
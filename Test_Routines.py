@@ -123,7 +123,8 @@ def compass_test():
         region_name = 'compass'
         template = 'compass'
 
-        img_region, (minVal, maxVal, minLoc, maxLoc), match = scr_reg.match_template_in_region_x3(region_name, template)
+        img_region, (minVal, maxVal, minLoc, maxLoc), match = scr_reg.match_template_in_region_x3(
+            region_name, template, thresh=scr_reg.compass_match_thresh)
         pt = maxLoc
         c_wid = scr_reg.templates.template['compass']['width']
         c_hgt = scr_reg.templates.template['compass']['height']
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+
+import cv2
+
+from bench_utils import load_test_images, time_func, percentile, format_us
+from Screen import Frame, to_bgr
+
+"""
+File:bench_capture.py
+
+Description:
+  Microbenchmark of the colour conversions on the screen capture path. Each image under test/ is scaled to a
+  full screen BGRA buffer (as returned by mss) and the compass and target regions are read from it, once with
+  the old path and once with the Frame path.
+    Old: RGB2BGR in get_screen(), BGR2RGB in get_screen_rect_pct() and BGRA2BGR in the caller.
+    New: a single BGRA2BGR of the region from the Frame, none in the caller.
+  Usage (from the repo root):
+    python benchmarks/bench_capture.py [--width 1920] [--height 1080] [--repeat 100]
+"""
+
+# Default compass and target regions from Screen_Regions
+REGIONS = {'compass': [0.33, 0.6, 0.46, 1.0],
+           'target': [0.2, 0.15, 0.8, 0.75]}
+
+
+def rect_to_pix(rect, width, height):
+    return [int(rect[0] * width), int(rect[1] * height), int(rect[2] * width), int(rect[3] * height)]
+
+
+def old_path(bgra, rects):
+    """ The capture path before the Frame. """
+    for r in rects:
+        image = bgra[r[1]:r[3], r[0]:r[2]]  # mss.grab of the region
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)  # get_screen()
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # get_screen_rect_pct()
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)  # get_nav_offset()/get_target_offset()
+
+
+def new_path(bgra, rects):
+    """ The Frame capture path, one conversion per region. """
+    frame = Frame(bgra, 0.0, 1)
+    for r in rects:
+        image = frame.region_bgr(r)  # get_screen_rect_pct()
+        image = to_bgr(image)  # get_nav_offset()/get_target_offset(), no conversion needed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Screen capture colour conversion benchmark.')
+    parser.add_argument('--width', type=int, default=1920, help='Width of the simulated screen.')
+    parser.add_argument('--height', type=int, default=1080, help='Height of the simulated screen.')
+    parser.add_argument('--repeat', type=int, default=100, help='Number of timed frames per image.')
+    args = parser.parse_args()
+
+    images = load_test_images()
+    if not images:
+        print("No test images found.")
+        return
+
+    rects = [rect_to_pix(r, args.width, args.height) for r in REGIONS.values()]
+
+    print(f"Screen {args.width}x{args.height}, regions: {', '.join(REGIONS.keys())}, {args.repeat} frames per image")
+    print(f"{'image':<50} {'old p50':>11} {'new p50':>11} {'saved/frame':>11}")
+    total_old = 0.0
+    total_new = 0.0
+    for name, image in images.items():
+        screen = cv2.resize(image, (args.width, args.height))
+        bgra = cv2.cvtColor(screen, cv2.COLOR_BGR2BGRA)
+
+        old = percentile(time_func(lambda: old_path(bgra, rects), args.repeat), 50)
+        new = percentile(time_func(lambda: new_path(bgra, rects), args.repeat), 50)
+        total_old += old
+        total_new += new
+        print(f"{name:<50} {format_us(old)} {format_us(new)} {format_us(old - new)}")
+
+    count = len(images)
+    print(f"{'mean':<50} {format_us(total_old / count)} {format_us(total_new / count)} "
+          f"{format_us((total_old - total_new) / count)}")
+
+
+if __name__ == "__main__":
+    main()
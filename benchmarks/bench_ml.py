@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import argparse
+import os
+
+from bench_utils import load_test_images, time_func, percentile, format_us
+from MachineLearning import COMPASS_WEIGHTS, TARGET_WEIGHTS, ML_BACKENDS, create_backend
+
+"""
+File:bench_ml.py
+
+Description:
+  Benchmark of the MachLearn model backends. Runs the compass model on the test/navpoint* images and the target
+  model on the test/target images with each backend, and reports the latency and the detections compared to the
+  'torch' backend (the current path). The first run of the 'onnx' or 'openvino' backend exports the models to
+  ONNX next to the weights.
+  Usage (from the repo root):
+    python benchmarks/bench_ml.py [--backends torch,onnx,openvino] [--threads 0] [--repeat 20]
+"""
+
+# The model used for the images in each test/ sub folder
+MODEL_FOLDERS = {'navpoint': 'compass',
+                 'navpoint-behind': 'compass',
+                 'target': 'target'}
+
+WEIGHTS = {'compass': COMPASS_WEIGHTS,
+           'target': TARGET_WEIGHTS}
+
+
+def iou(a: list[float], b: list[float]) -> float:
+    """ The intersection over union of two [x1, y1, x2, y2] boxes. """
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare(ref: list, dets: list) -> str:
+    """ Compares detections to the reference detections, by best matching box of the same class. """
+    if not ref and not dets:
+        return "match (none)"
+    if len(ref) != len(dets):
+        return f"count {len(dets)} vs {len(ref)}"
+
+    ious = []
+    conf_diff = 0.0
+    for name, conf, box in ref:
+        same = [(iou(box, b), c) for n, c, b in dets if n == name]
+        if not same:
+            return f"missing '{name}'"
+        best_iou, best_conf = max(same)
+        ious.append(best_iou)
+        conf_diff = max(conf_diff, abs(conf - best_conf))
+    return f"min iou {min(ious):.3f}, max conf diff {conf_diff:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MachLearn backend benchmark.')
+    parser.add_argument('--backends', default=','.join(ML_BACKENDS), help='Comma separated backends to compare.')
+    parser.add_argument('--threads', type=int, default=0, help='CPU threads for the onnx/openvino backends.')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of timed predictions per image.')
+    args = parser.parse_args()
+
+    images = {name: image for name, image in load_test_images().items()
+              if os.path.dirname(name) in MODEL_FOLDERS}
+    if not images:
+        print("No test images found.")
+        return
+
+    backends = {}
+    for backend in args.backends.split(','):
+        for model, weights in WEIGHTS.items():
+            b = create_backend(backend, weights, threads=args.threads)
+            if b.name != backend:
+                print(f"Backend '{backend}' not available, skipped.")
+                break
+            backends.setdefault(backend, {})[model] = b
+
+    print(f"{'image':<50} {'backend':<9} {'p50':>11} {'p95':>11}  detections vs torch")
+    for name, image in images.items():
+        model = MODEL_FOLDERS[os.path.dirname(name)]
+        ref = backends['torch'][model].predict(image) if 'torch' in backends else None
+        for backend, models in backends.items():
+            b = models[model]
+            times = time_func(lambda: b.predict(image), args.repeat)
+            dets = b.predict(image)
+            result = compare(ref, dets) if ref is not None else f"{len(dets)} detections"
+            print(f"{name:<50} {backend:<9} {format_us(percentile(times, 50))} {format_us(percentile(times, 95))}  "
+                  f"{result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import argparse
+import random
+
+from strsimpy.normalized_levenshtein import NormalizedLevenshtein
+
+from bench_utils import time_func, percentile, format_us
+import OCR
+
+"""
+File:bench_similarity.py
+
+Description:
+  Microbenchmark of the OCR string similarity, on nav panel style lists. Each list has a destination and rows made
+  from station, settlement and signal names, with OCR style errors (dropped spaces, a changed letter). Each row is
+  scored against the destination three ways:
+    Old: the str.replace() chain and strsimpy, per row, as OCR.string_similarity() was.
+    New: text_similarity() per row.
+    Batch: text_similarities() of the whole list in one call.
+  The backend (rapidfuzz or strsimpy) of the new functions is reported.
+  Usage (from the repo root):
+    python benchmarks/bench_similarity.py [--rows 12,40,200] [--repeat 200]
+"""
+
+NAMES = ["JAMESON MEMORIAL", "ABRAHAM LINCOLN", "GALILEO", "DARWIN RESEARCH FACILITY", "HUTTON ORBITAL",
+         "NAV BEACON", "UNIDENTIFIED SIGNAL SOURCE", "CONFLICT ZONE [HIGH INTENSITY]", "RESOURCE EXTRACTION SITE",
+         "STAR BLAZE V2V-65W", "WINGROVE'S INHERITANCE", "ORBITAL CONSTRUCTION SITE", "DAEDALUS", "M.GORBACHEV",
+         "BURNELL STATION", "FAIRWAY HORIZONS", "ARMSTRONG SETTLEMENT", "SIRIUS ATMOSPHERICS", "SOL 1 A", "ROBIGO 1 A"]
+
+_levenshtein = NormalizedLevenshtein()
+
+
+def old_similarity(s1: str, s2: str) -> float:
+    """ OCR.string_similarity() before the normalization table and the rapidfuzz backend. """
+    results = []
+    for s in (s1, s2):
+        for old in ("['", "']", '["', '"]', "', '", "<", ">", "-", "—", " "):
+            s = s.replace(old, "")
+        results.append(s)
+    return _levenshtein.similarity(results[0], results[1])
+
+
+def ocr_noise(name: str, rng: random.Random) -> list[str]:
+    """ The name as an OCR result, with the errors PaddleOCR makes. """
+    chars = list(name)
+    if rng.random() < 0.5:
+        chars = [c for c in chars if c != ' ' or rng.random() < 0.5]
+    if rng.random() < 0.3:
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice('0O1IL5S')
+    return [''.join(chars)]
+
+
+def make_list(rows: int, rng: random.Random) -> tuple[str, list[list[str]]]:
+    """ A destination and the OCR results of the rows of a list. """
+    names = [f"{rng.choice(NAMES)} {rng.randrange(100)}" if rng.random() < 0.5 else rng.choice(NAMES)
+             for _ in range(rows)]
+    return rng.choice(names), [ocr_noise(name, rng) for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR string similarity benchmark.')
+    parser.add_argument('--rows', default='12,40,200', help='Comma separated list lengths.')
+    parser.add_argument('--repeat', type=int, default=200, help='Number of timed calls per list.')
+    args = parser.parse_args()
+
+    print(f"Backend: {'rapidfuzz' if OCR.rf_process is not None else 'strsimpy'}")
+    print(f"{'rows':>5} {'method':<8} {'p50':>11} {'p95':>11}  best row")
+    rng = random.Random(0)
+    for rows in [int(r) for r in args.rows.split(',')]:
+        dst, textlists = make_list(rows, rng)
+        cases = {
+            'old': lambda: [old_similarity(f"['{dst}']", str(t)) for t in textlists],
+            'new': lambda: [OCR.text_similarity(dst, t) for t in textlists],
+            'batch': lambda: OCR.text_similarities(dst, textlists),
+        }
+        for name, func in cases.items():
+            times = time_func(func, args.repeat)
+            sims = list(func())
+            best = max(range(len(sims)), key=lambda i: sims[i])
+            print(f"{rows:>5} {name:<8} {format_us(percentile(times, 50))} {format_us(percentile(times, 95))}  "
+                  f"{best} ({sims[best]:.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+"""
+File:bench_utils.py
+
+Description:
+  Helpers shared by the benchmark scripts. The benchmarks run headless (no Elite Dangerous window) against the
+  images under test/, and are run from the repo root, i.e.:
+    python benchmarks/bench_capture.py
+"""
+
+# Make the EDAP modules in the repo root importable from the benchmarks folder
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+TEST_IMAGE_FOLDER = os.path.join(REPO_ROOT, 'test')
+
+
+def load_test_images(folder: str = TEST_IMAGE_FOLDER) -> dict[str, np.ndarray]:
+    """ Loads all the png images under the folder (and sub folders).
+    @param folder: The folder to search.
+    @return: A dict of image (BGR) by path relative to the folder.
+    """
+    images = {}
+    for path in sorted(glob.glob(os.path.join(folder, '**', '*.png'), recursive=True)):
+        image = cv2.imread(path)
+        if image is not None:
+            images[os.path.relpath(path, folder)] = image
+    return images
+
+
+def time_func(func, repeat: int = 100, warmup: int = 3) -> list[float]:
+    """ Times a function.
+    @param func: The function to time, called with no arguments.
+    @param repeat: The number of timed calls.
+    @param warmup: The number of untimed calls made first.
+    @return: The time of each call in seconds.
+    """
+    for _ in range(warmup):
+        func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def percentile(times: list[float], pct: float) -> float:
+    """ Returns the percentile (0 - 100) of the times. """
+    if not times:
+        return 0.0
+    return float(np.percentile(times, pct))
+
+
+def format_us(secs: float) -> str:
+    """ Formats a time in seconds as microseconds. """
+    return f"{secs * 1000000:9.1f}us"
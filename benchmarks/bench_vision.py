@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tracemalloc
+
+import cv2
+
+from bench_utils import load_test_images, time_func, percentile, format_us
+
+"""
+File:bench_vision.py
+
+Description:
+  Microbenchmarks of the vision primitives, run headless against the images under test/. Each image is scaled to
+  a full screen and set as the Screen image, so the Screen_Regions functions read their regions from it.
+  Reports the p50/p95/p99 latency and the peak memory allocated (by numpy/OpenCV arrays and python objects) per
+  call of each primitive. Primitives needing an optional package (paddleocr, ultralytics and the model weights)
+  are skipped if it is not available. The image_lines_ocr cases read the same region as image_simple_ocr with the
+  recognition only OCR, one line and a batch of 4, to compare against the full OCR. The OCR cache is off.
+
+  The results can be saved as a json baseline and a later run compared against it. The run fails (exit code 1)
+  if the p50 latency or the allocations of a primitive exceed the baseline by more than the threshold. Baselines
+  are machine specific, so are not committed.
+  Usage (from the repo root):
+    python benchmarks/bench_vision.py [--repeat 50] [--only sun_percent,equalize]
+    python benchmarks/bench_vision.py --save benchmarks/vision_baseline.json
+    python benchmarks/bench_vision.py --baseline benchmarks/vision_baseline.json [--threshold 0.25]
+"""
+
+SCREEN_SIZE = (1920, 1080)
+
+# Nav panel quad (in percent) for the perspective transforms, slanted as the panel is in game
+NAV_PANEL_QUAD = [[0.05, 0.02], [0.95, 0.10], [0.95, 0.90], [0.05, 0.98]]
+# A highlighted nav panel list item (in percent)
+NAV_PANEL_ITEM = [0.0, 0.0, 0.5, 0.05]
+
+
+class BenchContext:
+    """ The Screen, regions and other objects shared by the benchmarks. """
+
+    def __init__(self):
+        import Image_Templates
+        import Screen_Regions
+        from Screen import Screen
+
+        self.screen = Screen(cb=lambda *args, **kwargs: None)
+        self.screen.set_screen_image(cv2.resize(next(iter(load_test_images().values())), SCREEN_SIZE))
+        self.screen.update_scale()
+
+        # Create the calibration file with the default regions if it does not exist, as the GUI does on start
+        Screen_Regions.load_default_calib_data()
+        self.templ = Image_Templates.Image_Templates(self.screen.scaleX, self.screen.scaleY)
+        self.scr_reg = Screen_Regions.Screen_Regions(self.screen, self.templ)
+        self._ocr = None
+        self._mach_learn = None
+
+    def set_image(self, image):
+        self.screen.set_screen_image(cv2.resize(image, SCREEN_SIZE))
+
+    def region(self, name: str):
+        """ The BGR image of a region of the screen. """
+        return self.scr_reg.capture_region_percent(self.screen, name)
+
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            from OCR import OCR
+            self._ocr = OCR(None, self.screen)
+            self._ocr.cache.max_size = 0  # Time the OCR models, not the cache
+        return self._ocr
+
+    @property
+    def mach_learn(self):
+        if self._mach_learn is None:
+            from MachineLearning import MachLearn
+            self._mach_learn = MachLearn(None, None)
+        return self._mach_learn
+
+
+def build_cases(ctx: BenchContext) -> dict:
+    """ Builds the benchmark cases. Each case is a function taking the test image and returning the function to
+    time, so any preparation (i.e. cropping a region) is not timed. Modules with heavy or optional dependencies are
+    imported by their cases, so a missing package only skips those cases.
+    """
+    from Screen_Regions import Quad
+
+    scr_reg = ctx.scr_reg
+
+    def perspective(image):
+        from EDNavigationPanel import image_perspective_transform
+        return lambda: image_perspective_transform(image, Quad.from_list(
+            [[x * image.shape[1], y * image.shape[0]] for x, y in NAV_PANEL_QUAD]))
+
+    def reverse_perspective(image):
+        from EDNavigationPanel import image_perspective_transform, image_reverse_perspective_transform
+        quad = Quad.from_list([[x * image.shape[1], y * image.shape[0]] for x, y in NAV_PANEL_QUAD])
+        dst, m, rev = image_perspective_transform(image, quad)
+        return lambda: image_reverse_perspective_transform(dst, Quad.from_rect(NAV_PANEL_ITEM), rev)
+
+    def highlighted_item(image):
+        from OCR import OCR
+        return lambda: OCR.get_highlighted_item_in_image(image, Quad.from_rect(NAV_PANEL_ITEM))
+
+    def equalize(image):
+        compass = ctx.region('compass')
+        return lambda: scr_reg.equalize(compass)
+
+    def filter_by_color(image):
+        target = ctx.region('target')
+        return lambda: scr_reg.filter_by_color(target, scr_reg.reg['target']['filter'])
+
+    def filter_sun(image):
+        sun = ctx.region('sun')
+        return lambda: scr_reg.filter_sun(sun)
+
+    def model_predict(image):
+        from MachineLearning import ModelType
+        compass = ctx.region('compass')
+        return lambda: ctx.mach_learn.model_predict(ModelType.Compass, compass, '')
+
+    def simple_ocr(image):
+        disengage = ctx.region('disengage')
+        return lambda: ctx.ocr.image_simple_ocr(disengage, 'disengage')
+
+    def lines_ocr(count: int):
+        def make(image):
+            disengage = ctx.region('disengage')
+            return lambda: ctx.ocr.image_lines_ocr([disengage] * count, 'disengage')
+        return make
+
+    return {
+        'match_template_in_region_x3': lambda image: lambda: scr_reg.match_template_in_region_x3(
+            'disengage', 'disengage', thresh=scr_reg.disengage_thresh),
+        'equalize': equalize,
+        'filter_by_color': filter_by_color,
+        'filter_sun': filter_sun,
+        'capture_region_filtered': lambda image: lambda: scr_reg.capture_region_filtered(ctx.screen, 'target'),
+        'sun_percent': lambda image: lambda: scr_reg.sun_percent(ctx.screen),
+        'get_highlighted_item_in_image': highlighted_item,
+        'image_simple_ocr': simple_ocr,
+        'image_lines_ocr': lines_ocr(1),
+        'image_lines_ocr_x4': lines_ocr(4),
+        'model_predict': model_predict,
+        'image_perspective_transform': perspective,
+        'image_reverse_perspective_transform': reverse_perspective,
+    }
+
+
+def peak_alloc(func) -> int:
+    """ The peak memory in bytes allocated by a call of the function, as traced by tracemalloc. """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - start)
+
+
+def run_case(ctx: BenchContext, make_func, images: dict, repeat: int) -> dict:
+    """ Times a case over all the images.
+    @return: The p50/p95/p99 in secs and the max peak allocation in bytes.
+    """
+    times = []
+    alloc = 0
+    for image in images.values():
+        ctx.set_image(image)
+        func = make_func(image)
+        times.extend(time_func(func, repeat))
+        alloc = max(alloc, peak_alloc(func))
+    return {'p50': percentile(times, 50), 'p95': percentile(times, 95), 'p99': percentile(times, 99),
+            'alloc': alloc}
+
+
+def compare_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """ Compares the results against a baseline.
+    @return: The regressions, as messages.
+    """
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if res['p50'] > base['p50'] * (1.0 + threshold):
+            regressions.append(f"{name}: p50 {format_us(res['p50']).strip()} > baseline "
+                               f"{format_us(base['p50']).strip()} +{threshold:.0%}")
+        if res['alloc'] > base['alloc'] * (1.0 + threshold) and res['alloc'] - base['alloc'] > 4096:
+            regressions.append(f"{name}: alloc {res['alloc']} > baseline {base['alloc']} bytes +{threshold:.0%}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Vision primitives benchmark.')
+    parser.add_argument('--repeat', type=int, default=50, help='Number of timed calls per image.')
+    parser.add_argument('--only', help='Comma separated list of the primitives to run.')
+    parser.add_argument('--save', help='Save the results as a json baseline to this file.')
+    parser.add_argument('--baseline', help='Compare the results against this json baseline.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed regression from the baseline as a fraction, i.e. 0.25 for 25%%.')
+    args = parser.parse_args()
+
+    images = load_test_images()
+    if not images:
+        print("No test images found.")
+        return 1
+
+    ctx = BenchContext()
+    cases = build_cases(ctx)
+    if args.only:
+        names = [n.strip() for n in args.only.split(',')]
+        cases = {n: c for n, c in cases.items() if n in names}
+
+    print(f"{len(images)} images at {SCREEN_SIZE[0]}x{SCREEN_SIZE[1]}, {args.repeat} calls per image")
+    print(f"{'primitive':<38} {'p50':>11} {'p95':>11} {'p99':>11} {'peak alloc':>12}")
+    results = {}
+    for name, make_func in cases.items():
+        try:
+            res = run_case(ctx, make_func, images, args.repeat)
+        except ImportError as e:
+            print(f"{name:<38} skipped ({e})")
+            continue
+        except Exception as e:
+            print(f"{name:<38} failed ({e})")
+            continue
+        results[name] = res
+        print(f"{name:<38} {format_us(res['p50'])}  {format_us(res['p95'])}  {format_us(res['p99'])}  "
+              f"{res['alloc'] / 1024:9.1f}KB")
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(results, fp, indent=1)
+        print(f"Baseline saved to: {args.save}")
+
+    if args.baseline:
+        if not os.path.isfile(args.baseline):
+            print(f"Baseline not found: {args.baseline}")
+            return 1
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)
+        regressions = compare_baseline(results, baseline, args.threshold)
+        for msg in regressions:
+            print(f"REGRESSION {msg}")
+        if regressions:
+            return 1
+        print(f"No regressions against: {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from DebugSink import DebugSink
+
+
+class DebugSinkTestCase(unittest.TestCase):
+    def test_channels(self):
+        """ Images are only written for enabled channels, to folders created as needed. """
+        with tempfile.TemporaryDirectory() as folder:
+            sink = DebugSink()
+            image = np.full((20, 30, 3), 128, np.uint8)
+            off = os.path.join(folder, 'off', 'image.png')
+            on = os.path.join(folder, 'on', 'image.png')
+
+            self.assertFalse(sink.write('test', off, image))
+            sink.enable('test')
+            self.assertTrue(sink.write('test', on, image))
+            image[:] = 0  # The caller may reuse the image once queued
+            sink.stop()
+
+            self.assertFalse(os.path.exists(off))
+            self.assertEqual(cv2.imread(on)[0, 0].tolist(), [128, 128, 128])
+            self.assertEqual((sink.written, sink.dropped), (1, 0))
+
+    def test_drop_when_full(self):
+        """ Images are dropped, not blocked on, when the writer falls behind. """
+        with tempfile.TemporaryDirectory() as folder:
+            sink = DebugSink(queue_size=2)
+            sink.enable('test')
+            image = np.zeros((500, 500, 3), np.uint8)
+            results = [sink.write('test', os.path.join(folder, f'{i}.png'), image) for i in range(50)]
+            sink.stop()
+
+            self.assertGreater(sink.dropped, 0)
+            self.assertEqual(sink.written + sink.dropped, 50)
+            self.assertEqual(results.count(True), sink.written)
+
+
+if __name__ == '__main__':
+    unittest.main()
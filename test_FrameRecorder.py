@@ -0,0 +1,57 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from FrameRecorder import FrameRecorder, RecordingArchive
+from FrameReplay import ArchiveSource
+
+
+class FrameRecorderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_record_and_read(self):
+        """ Records are read back with the same crops and metadata, across chunk files. """
+        recorder = FrameRecorder(self.folder, chunk_size=1000)
+        recorder.start()
+        crops = []
+        for i in range(5):
+            crop = np.full((10, 20, 4), i, dtype=np.uint8)
+            crops.append(crop)
+            recorder.record({'compass': ([10, 20, 30, 30], crop)}, {'screen': [100, 50], 'index': i}, frame_id=i,
+                            timestamp=float(i))
+        recorder.stop()
+
+        archive = RecordingArchive(self.folder)
+        self.assertEqual(len(archive), 5)
+        for i, record in enumerate(archive):
+            self.assertEqual(record['meta']['index'], i)
+            rect, image = archive.read_regions(record)['compass']
+            self.assertEqual(rect, [10, 20, 30, 30])
+            self.assertTrue(np.array_equal(image, crops[i]))
+        self.assertGreater(max(r['regions'][0]['chunk'] for r in archive), 0)
+
+    def test_replay_archive(self):
+        """ An archive replays as full frames with the crops at their recorded positions. """
+        recorder = FrameRecorder(self.folder)
+        recorder.start()
+        recorder.record({'target': ([10, 20, 30, 30], np.full((10, 20, 4), 200, dtype=np.uint8))},
+                        {'screen': [100, 50]}, timestamp=5.0)
+        recorder.stop()
+
+        frames = list(ArchiveSource(self.folder))
+        self.assertEqual(len(frames), 1)
+        timestamp, image = frames[0]
+        self.assertEqual(timestamp, 0.0)
+        self.assertEqual(image.shape, (50, 100, 3))
+        self.assertEqual(image[25, 15, 0], 200)
+        self.assertEqual(image[0, 0, 0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
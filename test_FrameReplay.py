@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from FrameReplay import FrameReplay, NpzSource, compare_results, open_replay_source, run_replay
+from Screen import Screen
+
+
+def dummy_cb(msg, body=None):
+    pass
+
+
+class FrameReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.folder, 'frames.npz')
+        # Frame i has the value i * 10
+        frames = np.stack([np.full((50, 80, 3), i * 10, np.uint8) for i in range(5)])
+        np.savez(self.filepath, frames=frames, timestamps=np.array([0.0, 0.01, 0.02, 0.03, 0.2]))
+        self.scr = Screen(cb=dummy_cb)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_replay(self):
+        """ Each frame is played through the screen in turn, with the detector results per frame. """
+        source = open_replay_source(self.filepath)
+        self.assertIsInstance(source, NpzSource)
+        self.assertEqual(len(source), 5)
+
+        detectors = {'value': lambda: int(self.scr.get_screen_region([0, 0, 10, 10], rgb=False)[0, 0, 0])}
+        report = run_replay(FrameReplay(self.scr, source), detectors)
+        self.assertEqual(report.frames, 5)
+        self.assertEqual(report.skipped, 0)
+        self.assertEqual([r['value'] for r in report.results], [0, 10, 20, 30, 40])
+        self.assertEqual(self.scr.get_screen_size(), (80, 50))
+        self.assertEqual(len(report.latencies['value']), 5)
+
+        expected = [dict(r) for r in report.results]
+        expected[2]['value'] = 99
+        self.assertEqual(compare_results(report.results, expected), 1)
+
+    def test_realtime(self):
+        """ At the recorded speed, frames that are already late are skipped, as in a live capture. """
+        replay = FrameReplay(self.scr, NpzSource(self.filepath), realtime=True)
+        played = []
+        for idx in replay:
+            played.append(idx)
+            if idx == 0:
+                time.sleep(0.05)  # A detector slower than the frame rate
+        self.assertEqual(played, [0, 3, 4])
+        self.assertEqual(replay.skipped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
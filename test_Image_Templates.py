@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from Image_Templates import TemplateCache, build_pyramid, match_pyramid, match_template_scales, pyramid_levels
+
+
+class PyramidMatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.templ = cv2.imread('templates/destination.png', cv2.IMREAD_GRAYSCALE)
+        self.image = (np.random.default_rng(0).random((600, 1100)) * 80).astype(np.uint8)
+
+    def place(self, scale: float, x: int, y: int):
+        """ Places the template at the scale in the image with its top left at x, y. """
+        templ = cv2.resize(self.templ, (0, 0), fx=scale, fy=scale)
+        self.image[y:y + templ.shape[0], x:x + templ.shape[1]] = templ
+        return templ
+
+    def test_match_pyramid(self):
+        """ The coarse-to-fine match finds the same location as a full match. """
+        templ = self.place(0.73, 403, 201)
+        templ_pyramid = build_pyramid(templ, pyramid_levels(templ.shape))
+        self.assertGreater(len(templ_pyramid), 1)
+
+        (_, max_val, _, max_loc), _ = match_pyramid(build_pyramid(self.image, len(templ_pyramid) - 1), templ_pyramid)
+        self.assertEqual(max_loc, (403, 201))
+        self.assertGreater(max_val, 0.99)
+
+    def test_match_pyramid_small_image(self):
+        """ An image smaller than the template at any level is no match, not an error. """
+        templ = np.zeros((64, 64), np.uint8)
+        cv2.circle(templ, (32, 32), 20, 255, -1)
+        templ_pyramid = build_pyramid(templ, 2)
+        # 63 pixels rounds up to the template's 16 at the lowest level, but is smaller than it at full size
+        for size in [(63, 200), (40, 40)]:
+            image = np.zeros(size, np.uint8)
+            (_, max_val, _, _), match = match_pyramid(build_pyramid(image, 2), templ_pyramid)
+            self.assertEqual((max_val, match.size), (0.0, 0))
+
+    def test_match_template_scales(self):
+        """ The scale search finds the scale and location the template was placed at. """
+        self.place(0.73, 400, 200)
+        results = match_template_scales([self.image], self.templ, [i / 100 for i in range(50, 201)])
+        scale, max_val, max_loc = results[0]
+        self.assertEqual(scale, 0.73)
+        self.assertEqual(max_loc, (400, 200))
+
+
+class TemplateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.png = os.path.join(self.dir.name, 'templ.png')
+        cv2.imwrite(self.png, cv2.imread('templates/destination.png', cv2.IMREAD_GRAYSCALE))
+        self.cache = TemplateCache(os.path.join(self.dir.name, 'cache'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def build(self, file_name):
+        templ = cv2.resize(cv2.imread(self.png, cv2.IMREAD_GRAYSCALE), (0, 0), fx=0.5, fy=0.5)
+        return build_pyramid(templ, pyramid_levels(templ.shape))
+
+    def test_cache_and_invalidate(self):
+        """ The templates are built once, loaded from the cache after, and rebuilt when the PNG changes. """
+        built = self.build('templ.png')
+        arrays = self.cache.load({self.png: 'templ.png'}, 0.5, 0.5, self.build)
+        cached = self.cache.load({self.png: 'templ.png'}, 0.5, 0.5, self.build)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        for a, b, c in zip(built, arrays['templ.png'], cached['templ.png']):
+            self.assertTrue(np.array_equal(a, b) and np.array_equal(a, c))
+
+        cv2.imwrite(self.png, np.zeros((40, 60), np.uint8))
+        changed = self.cache.load({self.png: 'templ.png'}, 0.5, 0.5, self.build)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(changed['templ.png'][0].shape, (20, 30))
+        del arrays, cached, changed  # Unmap the cache file, so the directory can be removed on Windows
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from MachineLearning import MachLearnMatch
+from MLTracker import MLTracker
+from Screen_Regions import Quad
+
+
+def draw_target(background, x: int, y: int, occluded: bool = False):
+    """ Draws a 20x20 target with its top left at x, y. The occluded target is hollow. """
+    image = background.copy()
+    cv2.circle(image, (x + 10, y + 10), 8, (255, 255, 255), 2 if occluded else -1)
+    cv2.putText(image, 'T', (x + 5, y + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 255), 1)
+    return image
+
+
+class MLTrackerTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.background = (rng.random((300, 400, 3)) * 50).astype(np.uint8)
+        self.pos = [100, 100]
+        self.class_name = 'target'
+        self.tracker = MLTracker(self.predict, [{'target', 'target-occluded'}], full_every=10)
+
+    def predict(self, image):
+        """ Stands in for the model, returning the target at its drawn position. """
+        return [MachLearnMatch(self.class_name, 0.9, Quad.from_rect([self.pos[0], self.pos[1],
+                                                              self.pos[0] + 20, self.pos[1] + 20]))]
+
+    def test_tracks_between_full_predictions(self):
+        """ A moving target is tracked, with the model run every 'full_every' frames. """
+        for _ in range(20):
+            self.pos[0] = self.pos[0] + 3
+            matches = self.tracker.model_predict(draw_target(self.background, *self.pos))
+            self.assertEqual(matches[0].bounding_quad.left, self.pos[0])
+            self.assertEqual(matches[0].bounding_quad.top, self.pos[1])
+        self.assertEqual(self.tracker.full_count, 2)
+        self.assertEqual(self.tracker.tracked_count, 18)
+
+    def test_motion_and_miss(self):
+        """ A known movement is tracked, and a lost target runs the model again. """
+        self.tracker.model_predict(draw_target(self.background, *self.pos))
+        self.tracker.add_motion(40, -30)
+        self.pos = [140, 70]
+        matches = self.tracker.model_predict(draw_target(self.background, *self.pos))
+        self.assertEqual(matches[0].bounding_quad.left, 140)
+        self.assertEqual(self.tracker.full_count, 1)
+
+        self.pos = [300, 250]
+        matches = self.tracker.model_predict(draw_target(self.background, *self.pos))
+        self.assertEqual(matches[0].bounding_quad.left, 300)
+        self.assertEqual(self.tracker.full_count, 2)
+
+    def test_class_change(self):
+        """ A target that becomes occluded in place runs the model again, not keeping the tracked class. """
+        for occluded in [False, False, True, True, False, False, True]:
+            self.class_name = 'target-occluded' if occluded else 'target'
+            matches = self.tracker.model_predict(draw_target(self.background, *self.pos, occluded))
+            self.assertEqual(matches[0].class_name, self.class_name)
+        # The model runs on the first frame and each change, the frames in between are tracked
+        self.assertEqual(self.tracker.full_count, 4)
+        self.assertEqual(self.tracker.tracked_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
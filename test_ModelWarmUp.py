@@ -0,0 +1,65 @@
+import threading
+import unittest
+
+from ModelWarmUp import ModelWarmUp
+
+
+class DummyModel:
+    def __init__(self, ok: bool):
+        self.ok = ok
+        self.runs = 0
+
+    def warm_up(self):
+        self.runs = self.runs + 1
+        return self.ok
+
+
+class DummyAP:
+    """ The parts of the AP used by the warm up. The OCR is slow to load and its dummy inference fails. """
+
+    def __init__(self, enabled: bool = True):
+        self.config = {'WarmUpModels': enabled}
+        self.terminate = False
+        self.logs = []
+        self.mach_learn = DummyModel(True)
+        self.ocr_loading = threading.Event()
+        self._ocr = DummyModel(False)
+
+    @property
+    def ocr(self):
+        self.ocr_loading.wait(10.0)
+        return self._ocr
+
+    def ap_ckb(self, msg, body=None):
+        self.logs.append(body)
+
+
+class ModelWarmUpTestCase(unittest.TestCase):
+    def test_warm_up(self):
+        """ Each model is loaded and run once in the background, with its state published. """
+        ap = DummyAP()
+        warm_up = ModelWarmUp(ap)
+        self.assertTrue(warm_up.start())
+        self.assertFalse(warm_up.start())
+
+        self.assertTrue(warm_up.wait('mach_learn', 10.0))
+        self.assertFalse(warm_up.wait('ocr', 0.05))
+        self.assertEqual(warm_up.state['ocr'], 'loading')
+        ap.ocr_loading.set()
+        self.assertFalse(warm_up.wait('ocr', 10.0))
+
+        self.assertEqual(warm_up.state, {'mach_learn': 'ready', 'ocr': 'failed'})
+        self.assertEqual((ap.mach_learn.runs, ap._ocr.runs), (1, 1))
+        self.assertEqual(len(ap.logs), 1)
+
+    def test_disabled(self):
+        """ Nothing is loaded when off in the config. """
+        ap = DummyAP(enabled=False)
+        warm_up = ModelWarmUp(ap)
+        self.assertFalse(warm_up.start())
+        self.assertFalse(warm_up.wait('mach_learn', 0.0))
+        self.assertEqual(ap.mach_learn.runs, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
+import time
 import unittest
-from OCR import OCR
+from OCR import OCR, RegionChangeGate, text_similarities, text_similarity
 from Screen import *
 
 
@@ -70,6 +71,23 @@ class OCRTestCase(unittest.TestCase):
 
         self.assertEqual(True, True)  # add assertion here
 
+    def test_get_list_rows(self):
+        """ Check a list is split into its rows, with the highlighted row found. """
+        image = np.full((400, 600, 3), 15, np.uint8)
+        orange = (0, 140, 255)
+        for i, name in enumerate(['SOL', 'ALPHA CENTAURI', 'BARNARDS STAR', 'WOLF 359', 'SIRIUS']):
+            y = 10 + i * 40
+            if i == 1:
+                cv2.rectangle(image, (5, y), (590, y + 32), orange, -1)
+                cv2.putText(image, name, (15, y + 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (10, 10, 10), 2)
+            else:
+                cv2.putText(image, name, (15, y + 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, orange, 2)
+
+        rows = OCR.get_list_rows_in_image(image, Quad.from_rect([0.0, 0.0, 0.98, 0.08]))
+        self.assertEqual([selected for _, selected in rows], [False, True, False, False, False])
+        for i, (quad, _) in enumerate(rows):
+            self.assertAlmostEqual(quad.top * 400, 10 + i * 40, delta=3)
+
     def test_similarity_test1(self):
         ocr = OCR(self.ed_ap, screen=None)
         s1 = "Orbital Construction Site: Wingrove's Inheritance"
@@ -107,5 +125,58 @@ class OCRTestCase(unittest.TestCase):
         self.assertGreater(actual, 0.8)  # add assertion here
 
 
+class RegionChangeGateTestCase(unittest.TestCase):
+    def test_gate(self):
+        """ The gate opens once the region has settled, not during a change, and not again until it changes. """
+        gate = RegionChangeGate(settle_frames=2, max_wait=60.0)
+        blank = np.zeros((40, 200, 3), np.uint8)
+        frames = [blank] * 4
+        # A fading in screen, then the settled screen
+        frames += [np.full_like(blank, v) for v in (60, 120, 180)] + [np.full_like(blank, 200)] * 4
+        opened = [gate.update(frame) for frame in frames]
+        self.assertEqual(opened, [False, False, True, False, False, False, False, False, False, True, False])
+        self.assertEqual(gate.skipped, 9)
+
+    def test_max_wait(self):
+        """ A region that never settles, or never changes, is still OCRed once max_wait has passed. """
+        gate = RegionChangeGate(settle_frames=2, max_wait=0.2)
+        frames = [np.full((40, 200, 3), v, np.uint8) for v in (0, 100)]
+        opened = [gate.update(frames[i % 2]) for i in range(4)]
+        self.assertEqual(opened, [False, False, False, False])
+        time.sleep(0.25)
+        self.assertTrue(gate.update(frames[0]))
+        self.assertFalse(gate.update(frames[1]))
+
+        # Unchanged since the last OCR
+        gate = RegionChangeGate(settle_frames=1, max_wait=0.2)
+        self.assertEqual([gate.update(frames[0]) for _ in range(3)], [False, True, False])
+        time.sleep(0.25)
+        self.assertTrue(gate.update(frames[0]))
+
+
+class TextLineTestCase(unittest.TestCase):
+    def test_get_text_line(self):
+        """ Check an image is cropped to its main line of text, not the whole region, for the line OCR. """
+        image = np.zeros((150, 600, 3), np.uint8)
+        cv2.putText(image, 'PRESS [J] TO DISENGAGE', (40, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 200, 0), 2)
+        cv2.circle(image, (10, 10), 2, (255, 200, 0), -1)
+        mask = cv2.inRange(image, (1, 1, 0), (255, 255, 255))
+
+        line = OCR.get_text_line_in_image(image, mask)
+        self.assertLess(line.shape[0], 50)
+        self.assertGreater(line.shape[1], 300)
+        self.assertIsNone(OCR.get_text_line_in_image(image, np.zeros(mask.shape, np.uint8)))
+
+
+class SimilarityTestCase(unittest.TestCase):
+    def test_similarities(self):
+        """ Scoring a list of OCR results in one call gives the same as scoring each, ignoring the list repr. """
+        candidates = [['NAV BEACON'], "['<NAVBEACON>']", ['NAV', 'BEACON'], 'STAR BLAZE (V2V-65W)', []]
+        sims = text_similarities('NAV BEACON', candidates)
+        self.assertEqual(list(sims[:3]), [1.0, 1.0, 1.0])
+        for sim, candidate in zip(sims, candidates):
+            self.assertAlmostEqual(float(sim), text_similarity("['NAV BEACON']", candidate), places=6)
+
+
 if __name__ == '__main__':
     unittest.main()
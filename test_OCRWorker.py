@@ -0,0 +1,98 @@
+import os
+import time
+import unittest
+
+import numpy as np
+
+from OCRWorker import WORKER_MAX_RESTARTS, WORKER_READY, OCRWorkerPool
+
+# The first pixel of an image tells the stub worker what to do
+OK, CRASH, HANG, ERROR = 0, 1, 2, 3
+
+
+def _stub_worker(requests, results, mobile: bool):
+    """ A worker following the protocol of OCRWorker._worker_main(), without PaddleOCR. It takes
+    STUB_LOAD_DELAY secs to load, and then crashes, hangs or fails as told by the first pixel of the image. """
+    from multiprocessing import shared_memory
+
+    time.sleep(float(os.environ.get('STUB_LOAD_DELAY', '0')))
+    results.send((WORKER_READY, True, os.getpid()))
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+
+        req_id, kind, shm_name, shape, dtype, sizes = request
+        shm = shared_memory.SharedMemory(name=shm_name)
+        action = int(np.ndarray(shape, dtype=dtype, buffer=shm.buf).flat[0])
+        shm.close()
+        if action == CRASH:
+            os._exit(1)
+        elif action == HANG:
+            time.sleep(60)
+        elif action == ERROR:
+            results.send((req_id, False, "RuntimeError: stub error"))
+        else:
+            results.send((req_id, True, [{'rec_texts': ['OK'], 'rec_scores': [1.0], 'rec_polys': []}]))
+
+
+def make_image(action: int) -> np.ndarray:
+    image = np.zeros((10, 20, 3), np.uint8)
+    image[0, 0, 0] = action
+    return image
+
+
+class OCRWorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        os.environ.pop('STUB_LOAD_DELAY', None)
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def test_restart(self):
+        """ A worker that crashes or hangs is restarted, and the next request succeeds. """
+        self.pool = OCRWorkerPool(workers=1, target=_stub_worker)
+        self.assertEqual(self.pool.ocr(make_image(OK), timeout=10.0)[0]['rec_texts'], ['OK'])
+
+        self.assertIsNone(self.pool.ocr(make_image(CRASH), timeout=10.0))
+        self.assertEqual(self.pool.ocr(make_image(OK), timeout=10.0)[0]['rec_texts'], ['OK'])
+        self.assertEqual(self.pool.restarts, 1)
+
+        hung = self.pool._workers[0].process
+        self.assertIsNone(self.pool.ocr(make_image(HANG), timeout=1.0))
+        # The hung worker is terminated and reaped before ocr() returns
+        self.assertIsNotNone(hung.exitcode)
+        self.assertEqual(self.pool.ocr(make_image(OK), timeout=10.0)[0]['rec_texts'], ['OK'])
+        self.assertEqual(self.pool.restarts, 2)
+
+        # A failed OCR does not restart the worker
+        self.assertIsNone(self.pool.ocr(make_image(ERROR), timeout=10.0))
+        self.assertEqual(self.pool.restarts, 2)
+        self.assertEqual(self.pool.workers, 1)
+
+    def test_timeout_after_load(self):
+        """ The timeout of a request starts once the worker has loaded, so a slow load is not a hung worker. """
+        os.environ['STUB_LOAD_DELAY'] = '1.5'
+        self.pool = OCRWorkerPool(workers=1, target=_stub_worker)
+        start = time.monotonic()
+        self.assertIsNotNone(self.pool.ocr(make_image(OK), timeout=0.5))
+        self.assertGreater(time.monotonic() - start, 1.0)
+        self.assertEqual(self.pool.restarts, 0)
+
+    def test_give_up(self):
+        """ A worker that keeps crashing is given up on, and the pool then fails requests at once. """
+        self.pool = OCRWorkerPool(workers=1, target=_stub_worker)
+        for _ in range(WORKER_MAX_RESTARTS + 1):
+            self.assertIsNone(self.pool.ocr(make_image(CRASH), timeout=10.0))
+        deadline = time.monotonic() + 10.0
+        while self.pool.workers > 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(self.pool.workers, 0)
+        self.assertEqual(self.pool.restarts, WORKER_MAX_RESTARTS)
+        self.assertIsNone(self.pool.submit(make_image(OK)).result(0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from Perception import Perception
+from Screen import Screen
+from Screen_Regions import SunMeasure
+
+
+def dummy_cb(msg, body=None):
+    pass
+
+
+class DummyRegions:
+    """ The sun measure of Screen_Regions, as the value of the top left pixel. """
+
+    def sun_measure(self, scr):
+        return SunMeasure(pct=float(scr.get_screen_region([0, 0, 1, 1], rgb=False)[0, 0, 0]))
+
+
+class DummyAP:
+    """ The parts of the AP used by the perception. Each detector returns the frame it read. """
+
+    def __init__(self):
+        self.scr = Screen(cb=dummy_cb)
+        self.scr.set_screen_image(np.full((100, 200, 3), 3, np.uint8))
+        self.scrReg = DummyRegions()
+        self.cv_view = False
+        self.mach_learn = None
+        self.recorded = []
+        self.delay = 0.0  # Time taken by the compass and target detectors
+        self.threads = set()  # The threads the compass and target detectors ran on
+
+    def _detect(self):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return {'frame_id': self.scr.get_frame().frame_id}
+
+    def get_nav_offset(self, scr_reg):
+        return self._detect()
+
+    def get_target_offset(self, scr_reg):
+        return self._detect()
+
+    def combine_compass_target_offset(self, nav, tar):
+        return {'nav': nav, 'tar': tar}
+
+    def sc_disengage_ocr(self, scr_reg):
+        return self.scr.get_frame().frame_id > 0
+
+    def record_frame(self, frame, detectors, outputs):
+        self.recorded.append((frame.frame_id, detectors))
+
+
+class PerceptionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ap = DummyAP()
+        self.perception = Perception(self.ap)
+        self.perception.parallel = False
+
+    def tearDown(self):
+        self.perception.shutdown()
+
+    def test_sense(self):
+        """ The detectors of the mode all read the one frame of the sense, and only those detectors are run. """
+        self.perception.set_mode('fsd')
+        res = self.perception.sense()
+        self.assertEqual(res.nav, {'frame_id': res.frame_id})
+        self.assertEqual(res.target, {'frame_id': res.frame_id})
+        self.assertEqual(res.compass_target, {'nav': res.nav, 'tar': res.target})
+        self.assertIsNone(res.sun_pct)
+        self.assertIsNone(res.disengage)
+        self.assertEqual(self.ap.recorded, [(res.frame_id, ['compass', 'target'])])
+        self.assertIn('total', res.timings)
+
+        res = self.perception.sense(('compass', 'target', 'sun'))
+        self.assertEqual(res.nav, {'frame_id': res.frame_id})
+        self.assertEqual(res.sun_pct, 3)
+        self.assertFalse(res.sun_ahead)
+        self.assertEqual(self.ap.recorded[-1], (res.frame_id, ['compass', 'target', 'sun']))
+
+        res2 = self.perception.sense(('sun',))
+        self.assertGreater(res2.frame_id, res.frame_id)
+        self.assertIsNone(res2.nav)
+        self.assertEqual(res2.sun_pct, 3)
+
+    def test_enable(self):
+        """ A detector is switched on or off for one mode only. """
+        self.perception.enable('disengage', mode='sc')
+        self.perception.enable('target', False, mode='sc')
+        self.perception.set_mode('sc')
+        self.assertEqual(self.perception.enabled, {'compass', 'disengage'})
+        res = self.perception.sense()
+        self.assertTrue(res.disengage)
+        self.assertIsNone(res.target)
+
+        self.perception.set_mode('default')
+        self.assertEqual(self.perception.enabled, {'compass', 'target'})
+
+    def test_parallel(self):
+        """ The compass and target run at the same time on worker threads, both reading the frame of the sense. """
+        self.perception.parallel = True
+        self.ap.delay = 0.2
+        start = time.perf_counter()
+        res = self.perception.sense()
+        self.assertLess(time.perf_counter() - start, 0.35)
+        self.assertEqual(res.nav, {'frame_id': res.frame_id})
+        self.assertEqual(res.target, {'frame_id': res.frame_id})
+        self.assertEqual(len(self.ap.threads), 2)
+        self.assertNotIn(threading.current_thread().name, self.ap.threads)
+        self.assertIn('compass_target', res.timings)
+
+        # Not in parallel when the CV view is shown, as its windows are drawn from the calling thread
+        self.ap.threads.clear()
+        self.ap.cv_view = True
+        self.perception.sense()
+        self.assertEqual(self.ap.threads, {threading.current_thread().name})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from Screen import Frame, FrameRingBuffer, Screen
+
+
+def dummy_cb(msg, body=None):
+    pass
+
+
+def make_screen_image(width=400, height=200):
+    """ A BGR screen image with a different value in each pixel column. """
+    image = np.zeros((height, width, 3), np.uint8)
+    image[:, :, 0] = (np.arange(width) % 256).astype(np.uint8)
+    return image
+
+
+class FrameTickTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scr = Screen(cb=dummy_cb)
+        self.scr.set_screen_image(make_screen_image())
+
+    def test_frame_tick(self):
+        """ All the captures in a tick read one frame, and the next tick gets a new frame. """
+        with self.scr.frame_tick() as frame:
+            self.assertIs(self.scr.get_frame(), frame)
+            with self.scr.frame_tick() as inner:
+                self.assertIs(inner, frame)
+            region = self.scr.get_screen_region([10, 20, 50, 60], rgb=False)
+            self.assertEqual(region.shape, (40, 40, 3))
+            self.assertEqual(region[0, 0, 0], 10)
+
+        with self.scr.frame_tick() as frame2:
+            self.assertGreater(frame2.frame_id, frame.frame_id)
+
+    def test_frame_max_age(self):
+        """ Outside a tick, a frame is shared only while it is younger than frame_max_age. """
+        self.assertIsNot(self.scr.get_frame(), self.scr.get_frame())
+        self.scr.frame_max_age = 60.0
+        self.assertIs(self.scr.get_frame(), self.scr.get_frame())
+
+
+class FrameTestCase(unittest.TestCase):
+    def test_bgr(self):
+        """ A BGRA frame is converted to BGR once, and a BGR image is shared without making it read-only. """
+        bgra = np.zeros((20, 30, 4), np.uint8)
+        bgra[:, :, 2] = 255
+        frame = Frame(bgra, 0.0, 1)
+        self.assertEqual(frame.bgr.shape, (20, 30, 3))
+        self.assertIs(frame.bgr, frame.bgr)
+        self.assertFalse(frame.bgr.flags.writeable)
+        self.assertEqual(frame.region_bgr([0, 0, 10, 10])[0, 0, 2], 255)
+
+        bgr = make_screen_image(30, 20)
+        frame = Frame(bgr, 0.0, 2)
+        self.assertTrue(np.shares_memory(frame.bgr, bgr))
+        self.assertFalse(frame.bgr.flags.writeable)
+        self.assertTrue(bgr.flags.writeable)
+
+
+class FrameRingBufferTestCase(unittest.TestCase):
+    def test_overwrite(self):
+        """ The ring wraps round over the oldest frame, but a frame still held by a reader is not overwritten. """
+        ring = FrameRingBuffer(3, (4, 4, 3))
+        for i in range(5):
+            ring.write(np.full((4, 4, 3), i, np.uint8), float(i))
+        self.assertEqual(ring.latest().frame_id, 5)
+        self.assertEqual(ring.reallocs, 0)
+
+        held = ring.latest()
+        region = held.region([0, 0, 2, 2])
+        for i in range(5, 8):
+            ring.write(np.full((4, 4, 3), i, np.uint8), float(i))
+        self.assertEqual(ring.reallocs, 1)
+        self.assertEqual(held.image[0, 0, 0], 4)
+        self.assertEqual(region[0, 0, 0], 4)
+        self.assertEqual(ring.latest().image[0, 0, 0], 7)
+
+    def test_newer_than(self):
+        """ A reader waits for the first frame after the timestamp, and is woken when the ring is closed. """
+        ring = FrameRingBuffer(2, (4, 4, 3))
+        ring.write(np.zeros((4, 4, 3), np.uint8), 1.0)
+        self.assertEqual(ring.newer_than(0.5, 0.0).frame_id, 1)
+        self.assertIsNone(ring.newer_than(1.0, 0.05))
+
+        writer = threading.Timer(0.05, lambda: ring.write(np.ones((4, 4, 3), np.uint8), 2.0))
+        writer.start()
+        frame = ring.newer_than(1.0, 5.0)
+        writer.join()
+        self.assertEqual((frame.frame_id, frame.timestamp), (2, 2.0))
+
+        closer = threading.Timer(0.05, ring.close)
+        closer.start()
+        start = time.monotonic()
+        self.assertIsNone(ring.newer_than(2.0, 5.0))
+        self.assertLess(time.monotonic() - start, 2.0)
+        closer.join()
+
+
+class CaptureThreadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scr = Screen(cb=dummy_cb)
+        if self.scr.mss is None:
+            self.skipTest("No screen to capture")
+
+    def tearDown(self):
+        self.scr.stop_capture()
+
+    def test_capture(self):
+        """ The capture thread fills the ring, and captures are served from its latest frame. """
+        self.scr.start_capture(fps=50.0, buffer_size=4)
+        self.assertTrue(self.scr.capture_running)
+        deadline = time.monotonic() + 2.0
+        while (self.scr.ring is None or self.scr.ring.latest() is None) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        now = time.monotonic()
+        frame = self.scr.get_frame_newer_than(now, timeout=2.0)
+        self.assertIsNotNone(frame)
+        self.assertGreater(frame.timestamp, now)
+        self.assertEqual(frame.image.shape[:2], (self.scr.screen_height, self.scr.screen_width))
+
+        with self.scr.frame_tick() as tick_frame:
+            self.assertGreaterEqual(tick_frame.frame_id, frame.frame_id)
+            self.assertIs(self.scr.get_frame(), tick_frame)
+
+        self.scr.stop_capture()
+        self.assertFalse(self.scr.capture_running)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from copy import copy
+
+import cv2
+import numpy as np
+
+from Screen import Screen
+from Screen_Regions import FrozenQuad, Quad, QuadArray, RegionRegistry, Screen_Regions
+
+
+def dummy_cb(msg, body=None):
+    pass
+
+
+def make_screen_regions(image):
+    """ A Screen showing the image, and its Screen_Regions with the default compass and sun regions. """
+    scr = Screen(cb=dummy_cb)
+    scr.set_screen_image(image)
+    scr_reg = Screen_Regions(scr, None)
+    scr.regions.register_regions('Screen_Regions', {'compass': {'rect': [0.33, 0.6, 0.46, 1.0]},
+                                                    'sun': {'rect': [0.30, 0.30, 0.70, 0.68]}})
+    scr_reg.update_rects()
+    return scr, scr_reg
+
+
+class QuadTestCase(unittest.TestCase):
+    def test_copy_and_transform(self):
+        """ A transformed copy does not change the original. """
+        quad = Quad.from_rect([10, 20, 110, 70])
+        moved = copy(quad)
+        moved.offset(5, -5)
+        moved.scale(2.0, 2.0)
+        self.assertEqual(quad.to_rect_list(), [10.0, 20.0, 110.0, 70.0])
+        self.assertEqual(moved.to_rect_list(), [-35.0, -10.0, 165.0, 90.0])
+
+    def test_frozen(self):
+        """ A frozen quad can not be transformed, but a copy of it can. """
+        frozen = Quad.from_rect([0, 0, 1, 1]).frozen()
+        with self.assertRaises(TypeError):
+            frozen.offset(1, 1)
+        quad = copy(frozen)
+        quad.scale_from_origin(100, 50)
+        self.assertEqual(quad.to_rect_list(), [0.0, 0.0, 100.0, 50.0])
+
+        # A frozen quad made from an array holds a read-only view of it, not a copy
+        points = np.array([[0, 0], [4, 0], [4, 2], [0, 2]], dtype=np.float64)
+        frozen = FrozenQuad.from_array(points)
+        self.assertTrue(np.shares_memory(frozen.points, points))
+        self.assertFalse(frozen.points.flags.writeable)
+        self.assertTrue(points.flags.writeable)
+
+    def test_quad_array(self):
+        """ A batch transform gives the same quads as transforming each quad. """
+        rects = [[0, 0, 10, 10], [5, 5, 20, 30], [1, 2, 3, 4]]
+        batch = QuadArray.from_rects(rects)
+        batch.scale_from_origin(2.0, 3.0)
+        batch.inflate(1, 1)
+        for rect, batch_quad in zip(rects, batch.to_quads()):
+            quad = Quad.from_rect(rect)
+            quad.scale_from_origin(2.0, 3.0)
+            quad.inflate(1, 1)
+            self.assertTrue(np.allclose(quad.points, batch_quad.points))
+
+
+class RegionRegistryTestCase(unittest.TestCase):
+    def test_resize(self):
+        """ The pixel rects are recomputed for a new screen size and the listeners are called. """
+        registry = RegionRegistry(1920, 1080)
+        registry.register_regions('Test', {'a': {'rect': [0.25, 0.5, 0.75, 1.0]}, 'b': {'text': 'no rect'}})
+        self.assertEqual(registry.rect('Test.a'), [480, 540, 1440, 1080])
+        self.assertEqual(registry.slices('Test.a'), (slice(540, 1080), slice(480, 1440)))
+        self.assertEqual(registry.pct_to_pix([0.5, 0.5, 1.0, 1.0]), [960, 540, 1920, 1080])
+
+        called = []
+        registry.add_listener(lambda: called.append(True))
+        registry.resize(3440, 1440)
+        self.assertEqual(registry.rect('Test.a'), [860, 720, 2580, 1440])
+        self.assertEqual(registry.pct_to_pix([0.5, 0.5, 1.0, 1.0]), [1720, 720, 3440, 1440])
+        self.assertEqual(called, [True])
+
+
+class ScreenRegionsResizeTestCase(unittest.TestCase):
+    def test_resize(self):
+        """ The region rects and captures follow a change of the screen size. """
+        image = np.zeros((1080, 1920, 3), np.uint8)
+        image[324:734, 576:1344] = 200
+        scr, scr_reg = make_screen_regions(image)
+        self.assertEqual(scr_reg.reg['sun']['rect'], [576, 324, 1344, 734])
+        self.assertEqual((scr_reg.reg['sun']['width'], scr_reg.reg['sun']['height']), (768, 410))
+        with scr.frame_tick():
+            region = scr.get_region('Screen_Regions.sun', rgb=False)
+        self.assertEqual(region.shape, (410, 768, 3))
+        self.assertTrue((region == 200).all())
+
+        scr.set_screen_image(np.zeros((1440, 3440, 3), np.uint8))
+        self.assertEqual(scr_reg.reg['sun']['rect'], [1032, 432, 2408, 979])
+        self.assertEqual(scr_reg.capture_region(scr, 'sun').shape, (547, 1376, 3))
+
+
+class RegionFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        image = np.random.default_rng(1).integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+        self.scr, self.scr_reg = make_screen_regions(image)
+
+    def test_buffer_reuse(self):
+        """ The filtered image is the region's buffer, reused by each call on a thread, and matches the filter. """
+        first = self.scr_reg.capture_region_filtered(self.scr, 'compass')
+        expected = self.scr_reg.equalize(self.scr_reg.capture_region(self.scr, 'compass'))
+        self.assertTrue(np.array_equal(first, expected))
+        second = self.scr_reg.capture_region_filtered(self.scr, 'compass')
+        self.assertTrue(np.shares_memory(first, second))
+
+        # Each thread has its own buffers
+        other = []
+        thread = threading.Thread(target=lambda: other.append(
+            self.scr_reg.capture_region_filtered(self.scr, 'compass')))
+        thread.start()
+        thread.join()
+        self.assertFalse(np.shares_memory(first, other[0]))
+        self.assertTrue(np.array_equal(first, other[0]))
+
+
+class MatchX3TestCase(unittest.TestCase):
+    def setUp(self):
+        self.image = np.random.default_rng(2).integers(0, 255, (200, 300, 3), dtype=np.uint8)
+        templ = cv2.cvtColor(self.image[80:110, 120:160], cv2.COLOR_BGR2HSV)[:, :, 2].copy()
+        self.scr_reg = Screen_Regions(Screen(cb=dummy_cb), SimpleNamespace(template={'t': {'image': templ}}))
+
+    def test_window_hit(self):
+        """ The last match is found again by the window search, with the full search's detail of match. """
+        _, full, full_match = self.scr_reg.match_template_in_image_x3(self.image, 't', thresh=0.8)
+        self.assertEqual(full[3], (120, 80))
+        _, detail, match = self.scr_reg.match_template_in_image_x3(self.image, 't', thresh=0.8)
+        self.assertEqual(detail[3], (120, 80))
+        self.assertAlmostEqual(detail[1], full[1], places=4)
+        self.assertEqual(match.shape, full_match.shape)
+        self.assertEqual((self.scr_reg.x3_stats.calls, self.scr_reg.x3_stats.hits), (2, 1))
+
+        # The mask of a window hit is reused by the next hit
+        _, _, match2 = self.scr_reg.match_template_in_image_x3(self.image, 't', thresh=0.8)
+        self.assertTrue(np.shares_memory(match, match2))
+
+    def test_window_miss(self):
+        """ A match that moved out of the window falls back to the full search, and no threshold always does. """
+        self.scr_reg.match_template_in_image_x3(self.image, 't', thresh=0.8)
+        moved = np.roll(self.image, 100, axis=1)
+        _, detail, _ = self.scr_reg.match_template_in_image_x3(moved, 't', thresh=0.8)
+        self.assertEqual(detail[3], (220, 80))
+        self.assertEqual(self.scr_reg.x3_stats.hits, 0)
+
+        _, detail, _ = self.scr_reg.match_template_in_image_x3(moved, 't')
+        self.assertEqual(detail[3], (220, 80))
+        self.assertEqual(self.scr_reg.x3_stats.calls, 2)
+
+
+class SunMeasureTestCase(unittest.TestCase):
+    def test_sun_measure(self):
+        """ The quarter scale measure gives the bright percent and centroid of the full resolution measure. """
+        image = np.zeros((1080, 1920, 3), np.uint8)
+        cv2.circle(image, (960, 600), 60, (255, 255, 255), -1)
+        scr, scr_reg = make_screen_regions(image)
+        sun = scr_reg.sun_measure(scr)
+
+        # The sun region is [576, 324, 1344, 734] at 1920x1080
+        self.assertAlmostEqual(sun.pct, np.pi * 60 * 60 * 100 / (768 * 410), delta=0.2)
+        self.assertAlmostEqual(sun.centroid[0], (960 - 576) / 768, delta=0.01)
+        self.assertAlmostEqual(sun.centroid[1], (600 - 324) / 410, delta=0.01)
+        self.assertEqual(scr_reg.sun_percent(scr), int(sun.pct))
+
+        scr_reg.sun_downsample = 1.0
+        full = scr_reg.sun_measure(scr)
+        self.assertAlmostEqual(sun.pct, full.pct, delta=0.2)
+        self.assertAlmostEqual(sun.centroid[1], full.centroid[1], delta=0.01)
+
+    def test_no_sun(self):
+        """ A dark sun region has no bright pixels and no centroid. """
+        scr, scr_reg = make_screen_regions(np.full((1080, 1920, 3), 40, np.uint8))
+        sun = scr_reg.sun_measure(scr)
+        self.assertEqual(sun.pct, 0.0)
+        self.assertIsNone(sun.centroid)
+
+
+if __name__ == '__main__':
+    unittest.main()
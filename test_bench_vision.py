@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# The benchmark scripts import their helpers from the benchmarks folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from bench_utils import percentile, time_func
+from bench_vision import compare_baseline, peak_alloc
+
+
+class BenchVisionTestCase(unittest.TestCase):
+    def test_compare_baseline(self):
+        """ A primitive slower or allocating more than the baseline plus the threshold is a regression. """
+        baseline = {'fast': {'p50': 0.001, 'alloc': 100000},
+                    'slow': {'p50': 0.001, 'alloc': 100000},
+                    'alloc': {'p50': 0.001, 'alloc': 100000}}
+        results = {'fast': {'p50': 0.0011, 'alloc': 110000},
+                   'slow': {'p50': 0.002, 'alloc': 100000},
+                   'alloc': {'p50': 0.001, 'alloc': 200000},
+                   'new': {'p50': 1.0, 'alloc': 1000000}}
+        regressions = compare_baseline(results, baseline, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('slow: p50'))
+        self.assertTrue(regressions[1].startswith('alloc: alloc'))
+
+    def test_measure(self):
+        """ The timings and allocations of a call are measured. """
+        times = time_func(lambda: None, repeat=20, warmup=1)
+        self.assertEqual(len(times), 20)
+        self.assertLessEqual(percentile(times, 50), percentile(times, 99))
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertGreaterEqual(peak_alloc(lambda: np.ones(1000000, np.uint8)), 1000000)
+
+
+if __name__ == '__main__':
+    unittest.main()